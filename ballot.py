@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Union
+
+from snapshot import Snapshot
+
+
+class BallotState:
+    """勝敗・ポイント記入シートに最後に書き込んだ内容の記録
+
+    シート毎 (スプレッドシートID毎) に、書き込んだセルの値・プルダウンの選択肢・投票シートの行を保存する。
+    ``update-ballot`` では対戦表の現在の内容と比較し、変更のあったセルだけを書き込む。
+    """
+
+    CACHE_DIR = Path('.cache')
+
+    def __init__(self, file_id: str, cache_dir: Path = CACHE_DIR):
+        """
+        :param file_id: 管理用スプレッドシートのID
+        :type file_id: str
+        :param cache_dir: 保存先のディレクトリ, defaults to CACHE_DIR
+        :type cache_dir: Path, optional
+        """
+        self.path = Path(cache_dir) / f'ballots-{file_id}.json'
+        self.ballots: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, ballot_id: str) -> Union[Dict[str, Any], None]:
+        """シートの記録を取得する
+
+        :param ballot_id: 勝敗・ポイント記入シートのスプレッドシートID
+        :type ballot_id: str
+        :return: ``sheet_id``, ``sheet_title``, ``cells``, ``options``, ``vote``, ``vote_row`` を持つ辞書. 記録が無い場合は None
+        :rtype: Union[Dict[str, Any], None]
+        """
+        with self._lock:
+            return self.ballots.get(ballot_id)
+
+    def record(self, ballot_id: str, sheet_id: int, sheet_title: str, cells: Dict[str, Any],
+               options: Dict[str, List[str]], vote: List[Any], vote_row: Union[int, None]):
+        """シートに書き込んだ内容を記録する
+
+        :param ballot_id: 勝敗・ポイント記入シートのスプレッドシートID
+        :type ballot_id: str
+        :param sheet_id: 書き込み先のシートID
+        :type sheet_id: int
+        :param sheet_title: 書き込み先のシート名
+        :type sheet_title: str
+        :param cells: セルの位置と値
+        :type cells: Dict[str, Any]
+        :param options: セルの位置とプルダウンの選択肢
+        :type options: Dict[str, List[str]]
+        :param vote: 投票シートの行の値
+        :type vote: List[Any]
+        :param vote_row: 投票シートの行番号. 未確定の場合は None
+        :type vote_row: Union[int, None]
+        """
+        with self._lock:
+            self.ballots[ballot_id] = {
+                'sheet_id': sheet_id,
+                'sheet_title': sheet_title,
+                'cells': dict(cells),
+                'options': {label: list(values) for label, values in options.items()},
+                'vote': list(vote),
+                'vote_row': vote_row,
+            }
+
+    def clear(self):
+        """全ての記録を破棄する"""
+        with self._lock:
+            self.ballots = {}
+
+    def save(self):
+        """記録をファイルに保存する"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as ofp:
+                json.dump(self.ballots, ofp, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding='utf-8') as ifp:
+                self.ballots = json.load(ifp)
+        except (OSError, ValueError):
+            self.ballots = {}
+
+
+class VoteRows:
+    """投票シートの行の割り当て
+
+    複数の対戦表シートの勝敗・ポイント記入シートを並行して生成しても行が重ならないように、
+    使用済みの最終行から順に行番号を割り当て、足りない分はシートに行を追加する。
+    """
+
+    def __init__(self, snapshot: Snapshot, sheet_index: int, clear: bool = False):
+        """
+        :param snapshot: 管理用スプレッドシートのスナップショット
+        :type snapshot: Snapshot
+        :param sheet_index: 投票シートのインデックス
+        :type sheet_index: int
+        :param clear: 見出し以外の行を削除してから割り当てるか, defaults to False
+        :type clear: bool, optional
+        """
+        self.snapshot = snapshot
+        self.sheet_index = sheet_index
+        self.worksheet = snapshot.worksheet(sheet_index)
+        self.last_row = max([k+1 for k, row in enumerate(snapshot.values(sheet_index)) if row and row[0]], default=1)
+        if clear and self.last_row > 1:
+            self.worksheet.delete_rows(2, self.last_row)
+            snapshot.invalidate(sheet_index, metadata=True)
+            self.last_row = 1
+        self._lock = threading.Lock()
+
+    def allocate(self, count: int) -> int:
+        """行を割り当てる
+
+        :param count: 割り当てる行数
+        :type count: int
+        :return: 割り当てた最初の行番号
+        :rtype: int
+        """
+        with self._lock:
+            first = self.last_row + 1
+            self.last_row += count
+            if self.last_row > self.worksheet.row_count:
+                self.worksheet.add_rows(self.last_row - self.worksheet.row_count)
+                self.snapshot.invalidate(self.sheet_index, metadata=True)
+            return first
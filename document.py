@@ -0,0 +1,329 @@
+import re
+import threading
+from typing import Union, List, Dict, Any
+from gspread import Client, Spreadsheet
+from gspread.urls import DRIVE_FILES_API_V3_URL, SPREADSHEET_DRIVE_URL
+import gspread.utils as gsutils
+
+from worksheet import WorksheetEx
+
+
+class DocumentRender:
+    """生成したスプレッドシート1つ分の書き込みを収集し、1回の batchUpdate で送信する
+
+    セルへの値の書き込み、プルダウン (ONE_OF_LIST) の入力規則を
+    ``spreadsheets.batchUpdate`` の requests としてまとめる。
+    セルの値は ``USER_ENTERED`` で書き込んだ場合と同様に、
+    ``=`` で始まるものは数式、数値として解釈できるものは数値として扱う。
+    日付・時刻・パーセント・桁区切りの数値等の解釈はシートのロケールに依るため、
+    数字を含むその他の文字列は ``pasteData`` で貼り付けて Google Sheets に解釈させる。
+    """
+
+    NUMBER_PATTERN = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+    DIGIT_PATTERN = re.compile(r'\d')
+
+    def __init__(self, sheet_id: int):
+        """
+        :param sheet_id: 書き込み先のシートID
+        :type sheet_id: int
+        """
+        self.sheet_id = sheet_id
+        self.requests = []
+
+    def set_value(self, label: str, value: Union[int, float, str, None]):
+        """セルに値を設定する
+
+        :param label: セルの位置 (A1形式)
+        :type label: str
+        :param value: 値
+        :type value: Union[int, float, str, None]
+        """
+        row, col = gsutils.a1_to_rowcol(label)
+        start = {
+            'sheetId': self.sheet_id,
+            'rowIndex': row - 1,
+            'columnIndex': col - 1,
+        }
+        if DocumentRender.is_parsed(value):
+            self.requests.append({
+                'pasteData': {
+                    'coordinate': start,
+                    'data': value,
+                    'type': 'PASTE_NORMAL',
+                    'delimiter': '\t',
+                }
+            })
+            return
+        self.requests.append({
+            'updateCells': {
+                'rows': [{'values': [{'userEnteredValue': DocumentRender.cell_value(value)}]}],
+                'fields': 'userEnteredValue',
+                'start': start,
+            }
+        })
+
+    def set_options(self, label: str, options: List[str]):
+        """セルにプルダウン選択の入力規則を設定する
+
+        :param label: セルの位置 (A1形式)
+        :type label: str
+        :param options: 選択肢
+        :type options: List[str]
+        """
+        self.requests.append({
+            'setDataValidation': {
+                'range': gsutils.a1_range_to_grid_range(label, self.sheet_id),
+                'rule': WorksheetEx.data_validation_rule(
+                    WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True),
+            }
+        })
+
+    def append_columns(self, length: int):
+        """シートの末尾に列を追加する
+
+        :param length: 追加する列数
+        :type length: int
+        """
+        self.requests.append({
+            'appendDimension': {
+                'sheetId': self.sheet_id,
+                'dimension': 'COLUMNS',
+                'length': length,
+            }
+        })
+
+    def append_rows(self, length: int):
+        """シートの末尾に行を追加する
+
+        :param length: 追加する行数
+        :type length: int
+        """
+        self.requests.append({
+            'appendDimension': {
+                'sheetId': self.sheet_id,
+                'dimension': 'ROWS',
+                'length': length,
+            }
+        })
+
+    def hide_columns(self, first: int, last: int):
+        """列を非表示にする
+
+        :param first: 最初の列番号 (1始まり)
+        :type first: int
+        :param last: 最後の列番号 (1始まり)
+        :type last: int
+        """
+        self.requests.append({
+            'updateDimensionProperties': {
+                'range': {
+                    'sheetId': self.sheet_id,
+                    'dimension': 'COLUMNS',
+                    'startIndex': first - 1,
+                    'endIndex': last,
+                },
+                'properties': {
+                    'hiddenByUser': True
+                },
+                'fields': 'hiddenByUser'
+            }
+        })
+
+    def body(self) -> Dict[str, Any]:
+        """batchUpdate のリクエストボディを組み立てる
+
+        :return: リクエストボディ
+        :rtype: Dict[str, Any]
+        """
+        return {'requests': list(self.requests)}
+
+    def send(self, spreadsheet: Union[Spreadsheet, 'Document']):
+        """収集した書き込みを1回の batchUpdate で送信する
+
+        :param spreadsheet: 書き込み先のスプレッドシート
+        :type spreadsheet: Union[Spreadsheet, Document]
+        """
+        body = self.body()
+        if len(body['requests']) > 0:
+            spreadsheet.batch_update(body)
+
+    @staticmethod
+    def is_parsed(value: Union[int, float, str, None]) -> bool:
+        """値を Google Sheets に解釈させる (``pasteData`` で貼り付ける) 必要があるか
+
+        数式・数値・真偽値以外で数字を含む文字列は、日付・時刻 (``2024/10/01``, ``10:00``)、
+        パーセント、桁区切りの数値等として解釈される場合がある。
+        貼り付けで区切られてしまうタブと改行を含むものは文字列として扱う。
+
+        :param value: 値
+        :type value: Union[int, float, str, None]
+        :return: ``pasteData`` で貼り付ける場合は True
+        :rtype: bool
+        """
+        if type(value) is not str or value.startswith(('=', "'")):
+            return False
+        if DocumentRender.NUMBER_PATTERN.match(value) or any(c in value for c in '\t\r\n'):
+            return False
+        return DocumentRender.DIGIT_PATTERN.search(value) is not None
+
+    @staticmethod
+    def cell_value(value: Union[int, float, str, None]) -> Dict[str, Any]:
+        """値を ExtendedValue に変換する
+
+        :param value: 値
+        :type value: Union[int, float, str, None]
+        :return: ExtendedValue
+        :rtype: Dict[str, Any]
+        """
+        if value is None:
+            return {'stringValue': ''}
+        if type(value) is bool:
+            return {'boolValue': value}
+        if type(value) in (int, float):
+            return {'numberValue': value}
+
+        value = str(value)
+        if value.startswith('='):
+            return {'formulaValue': value}
+        if value.startswith("'"):
+            return {'stringValue': value[1:]}
+        if value.upper() in ('TRUE', 'FALSE'):
+            return {'boolValue': value.upper() == 'TRUE'}
+        if DocumentRender.NUMBER_PATTERN.match(value):
+            return {'numberValue': float(value) if any(c in value for c in '.eE') else int(value)}
+        return {'stringValue': value}
+
+
+class Document:
+    """テンプレートからコピーして生成したスプレッドシート
+
+    コピー直後のスプレッドシートはテンプレートとシートID・シート名が同じであるため、
+    メタデータを取得せずにテンプレートの情報をそのまま保持する。
+    """
+
+    def __init__(self, client: Client, id: str, sheet_id: int, sheet_title: str):
+        self.client = client
+        self.id = id
+        self.sheet_id = sheet_id
+        self.sheet_title = sheet_title
+
+    @property
+    def url(self) -> str:
+        """スプレッドシートのURL"""
+        return SPREADSHEET_DRIVE_URL % self.id
+
+    def batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """spreadsheets.batchUpdate を呼び出す
+
+        :param body: リクエストボディ
+        :type body: Dict[str, Any]
+        :return: レスポンス
+        :rtype: Dict[str, Any]
+        """
+        return self.client.http_client.batch_update(self.id, body)
+
+    def batch_get(self, ranges: List[str]) -> List[List[List[Any]]]:
+        """spreadsheets.values.batchGet で、シート内の複数の範囲の値を1回で取得する
+
+        :param ranges: 範囲 (A1形式、シート名なし) のリスト
+        :type ranges: List[str]
+        :return: 範囲毎の値
+        :rtype: List[List[List[Any]]]
+        """
+        response = self.client.http_client.values_batch_get(
+            self.id, [gsutils.absolute_range_name(self.sheet_title, label) for label in ranges])
+        return [value_range.get('values', []) for value_range in response.get('valueRanges', [])]
+
+
+class Template:
+    """生成するスプレッドシートのテンプレート
+
+    先頭シートのシートID・シート名・行数・列数はテンプレート毎に1回だけ取得してキャッシュする。
+    """
+
+    _cache: Dict[str, 'Template'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, client: Client, id: str):
+        self.client = client
+        self.id = id
+
+        metadata = client.http_client.fetch_sheet_metadata(id, params={'fields': 'sheets.properties'})
+        properties = metadata['sheets'][0]['properties']
+        self.sheet_id = properties['sheetId']
+        self.sheet_title = properties['title']
+        self.row_count = properties.get('gridProperties', {}).get('rowCount', 0)
+        self.column_count = properties.get('gridProperties', {}).get('columnCount', 0)
+
+    @classmethod
+    def open(cls, client: Client, id: str) -> 'Template':
+        """テンプレートを取得する (取得済みであればキャッシュを返す)
+
+        :param client: gspread のクライアント
+        :type client: Client
+        :param id: テンプレートのスプレッドシートID
+        :type id: str
+        :return: テンプレート
+        :rtype: Template
+        """
+        with cls._lock:
+            if id not in cls._cache:
+                cls._cache[id] = cls(client, id)
+            return cls._cache[id]
+
+    def copy(self, title: str, folder_id: str) -> Document:
+        """テンプレートを指定のフォルダに指定のタイトルでコピーする
+
+        Drive の files.copy を1回呼び出すだけで、タイトルの変更やフォルダの移動は行わない。
+
+        :param title: コピー後のタイトル
+        :type title: str
+        :param folder_id: コピー先のフォルダID
+        :type folder_id: str
+        :return: コピーされたスプレッドシート
+        :rtype: Document
+        """
+        response = self.client.http_client.request(
+            'post',
+            f'{DRIVE_FILES_API_V3_URL}/{self.id}/copy',
+            params={'supportsAllDrives': True, 'fields': 'id'},
+            json={'name': title, 'parents': [folder_id]},
+        )
+        return Document(self.client, response.json()['id'], self.sheet_id, self.sheet_title)
+
+
+def list_files(client: Client, folder_id: str, modified_since: Union[str, None] = None) -> List[Dict[str, str]]:
+    """フォルダ内のファイルを、更新日時とともに取得する
+
+    ``modified_since`` を指定した場合は、その日時以降に更新されたファイルだけを Drive 側で絞り込んで返す。
+
+    :param client: gspread のクライアント
+    :type client: Client
+    :param folder_id: フォルダID
+    :type folder_id: str
+    :param modified_since: 更新日時 (RFC 3339 形式) の下限, defaults to None
+    :type modified_since: Union[str, None], optional
+    :return: ``id`` と ``modifiedTime`` を持つ辞書のリスト
+    :rtype: List[Dict[str, str]]
+    """
+    query = f"'{folder_id}' in parents and trashed = false"
+    if modified_since is not None:
+        query += f" and modifiedTime >= '{modified_since}'"
+
+    files = []
+    page_token = None
+    while True:
+        params = {
+            'q': query,
+            'fields': 'nextPageToken,files(id,modifiedTime)',
+            'pageSize': 1000,
+            'supportsAllDrives': True,
+            'includeItemsFromAllDrives': True,
+        }
+        if page_token is not None:
+            params['pageToken'] = page_token
+        response = client.http_client.request('get', DRIVE_FILES_API_V3_URL, params=params).json()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if page_token is None:
+            return files
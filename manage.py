@@ -2,36 +2,137 @@ import argparse
 import yaml
 import string
 import secrets
-from datetime import datetime
 import math
 import time
 import re
+import threading
+from fnmatch import fnmatch
 import sys
 from pathlib import Path
-import gspread
 import gspread.utils as gsutils
-from pydrive2.auth import GoogleAuth
-from pydrive2.drive import GoogleDrive
+from gspread.exceptions import APIError
 from oauth2client.client import Credentials
-from oauth2client.service_account import ServiceAccountCredentials
 
-from typing import List, Dict, Any
-from zoom import Zoom
-from worksheet import WorksheetEx
+from typing import List, Dict, Any, Tuple, Union, Callable
+from zoom import Zoom, UserDirectory, MeetingScheduler
+from document import DocumentRender, Document, Template, list_files
+from pipeline import run_jobs, run_steps, WriteBack
+from session import open_client
+from snapshot import Snapshot
+from schedule import Schedule, Match
+from ballot import BallotState, VoteRows
+from manifest import Manifest
+from plan import Plan, SHEETS_READ, SHEETS_WRITE, DRIVE, ZOOM
+from metrics import metrics
+
+
+ZOOM_TOKEN_CACHE='.zoom-token.json'
+ZOOM_USER_CACHE='.zoom-users.json'
+ZOOM_MEETING_COUNT_CACHE='.cache/zoom-meetings.json'
+WATCH_INTERVAL=30
+RUN_STEPS=['generate-room', 'generate-member-list', 'generate-ballot', 'generate-aggregate', 'generate-advice', 'update-live']
+RUN_DEPENDS={
+    'generate-aggregate': ['generate-ballot'],
+    'update-live': ['generate-room'],
+    'update-ballot': ['generate-ballot'],
+    'collect-results': ['generate-ballot'],
+}
+RUN_CONFLICTS=[
+    {'generate-room', 'clear-room', 'update-live'},
+]
+
+_zoom_clients: Dict[str, Zoom] = {}
+_zoom_lock = threading.Lock()
+
+
+def open_zoom(auth_key: Dict[str, str]) -> Zoom:
+    """Zoom API のクライアントを生成する
+
+    アクセストークンは ``auth_key`` の ``token-cache`` (省略時は ``.zoom-token.json``) に保存し、
+    有効期限内であれば次回以降のコマンド実行でも再利用する。
+    同じプロセス内では、クライアントを ``run`` の各ステップで共有する。
+
+    :param auth_key: Zoom の Account ID/Client ID/Client Secret
+    :type auth_key: Dict[str, str]
+    :return: Zoom API のクライアント
+    :rtype: Zoom
+    """
+    with _zoom_lock:
+        if auth_key['client-id'] not in _zoom_clients:
+            token_cache = Path(auth_key.get('token-cache', ZOOM_TOKEN_CACHE))
+            _zoom_clients[auth_key['client-id']] = Zoom(auth_key['client-id'], auth_key['client-secret'], auth_key['account-id'], token_cache)
+        return _zoom_clients[auth_key['client-id']]
 
 
-INTERVAL=0.1
+def open_users(client: Zoom, auth_key: Dict[str, str], workers: int = 1) -> UserDirectory:
+    """Zoom ユーザーの一覧を取得する
 
+    一覧は ``auth_key`` の ``user-cache`` (省略時は ``.zoom-users.json``) にキャッシュし、
+    ``user-cache-ttl`` 秒 (省略時は1時間) の間は各コマンドで共有する。
 
-def get_gauth(json_key_file: Path):
-    scope = [
-        'https://www.googleapis.com/auth/spreadsheets',
-        'https://www.googleapis.com/auth/drive'
-    ]
-    gauth = GoogleAuth()
-    gauth.credentials = ServiceAccountCredentials.from_json_keyfile_name(json_key_file, scope)
+    :param client: Zoom API のクライアント
+    :type client: Zoom
+    :param auth_key: Zoom の Account ID/Client ID/Client Secret
+    :type auth_key: Dict[str, str]
+    :param workers: ページを並行して取得する数, defaults to 1
+    :type workers: int, optional
+    :return: Zoom ユーザーの一覧
+    :rtype: UserDirectory
+    """
+    cache = Path(auth_key.get('user-cache', ZOOM_USER_CACHE))
+    ttl = float(auth_key.get('user-cache-ttl', UserDirectory.TTL))
+    return UserDirectory(client, cache, ttl, workers).load()
+
+
+def get_header_cells(schedule: Schedule, *link_lists: List[Any]) -> Dict[str, Any]:
+    """参照関係設定のうち、セル番地で指定された参照元をまとめて取得する
+
+    対戦表の開催日等、全てのドキュメントで共通の値を、読み込んだ対戦表の表示値から一度に取り出す。
+
+    :param schedule: 対戦表
+    :type schedule: Schedule
+    :param link_lists: 参照関係設定のリスト
+    :type link_lists: List[Any]
+    :return: セル番地と値の辞書
+    :rtype: Dict[str, Any]
+    """
+    labels = sorted({link[0] for links in link_lists for link in links if type(link) == list and type(link[0]) == str})
+    return {label: schedule.cell(label) for label in labels}
+
+
+def copy_template(manifest: Manifest, resume: bool, template: Template,
+                  kind: str, match: str, slot: int, title: str, folder_id: str) -> Tuple[Document, bool]:
+    """テンプレートをコピーしてシートを生成し、マニフェストに記録する
+
+    ``resume`` が True でマニフェストに記録がある場合は、コピーせずに記録済みのシートを返す。
+
+    :param manifest: 成果物の記録
+    :type manifest: Manifest
+    :param resume: 記録済みのシートを再利用するか
+    :type resume: bool
+    :param template: テンプレート
+    :type template: Template
+    :param kind: 成果物の種類
+    :type kind: str
+    :param match: 試合名
+    :type match: str
+    :param slot: 枠の番号
+    :type slot: int
+    :param title: コピー後のタイトル
+    :type title: str
+    :param folder_id: コピー先のフォルダID
+    :type folder_id: str
+    :return: シート, 書き込みまで完了しているか
+    :rtype: Tuple[Document, bool]
+    """
+    entry = manifest.get(kind, match, slot) if resume else None
+    if entry is not None:
+        document = Document(template.client, entry['remote_id'], template.sheet_id, template.sheet_title)
+        return document, entry['status'] == Manifest.FINISHED
 
-    return gauth
+    document = template.copy(title, folder_id)
+    manifest.created(kind, match, slot, document.id, document.url)
+    return document, False
 
 
 def generate_room(json_key_file: Path, file_id: str, sheet_index: int,
@@ -55,82 +156,80 @@ def generate_room(json_key_file: Path, file_id: str, sheet_index: int,
     :param settings: Zoom ミーティングの設定情報
     :type settings: Dict[str, Any]
     """
-    def find_user(users: List[Dict[str, Any]], key: str, value: Any) -> List[Dict[str, Any]]:
-        users = list(filter(lambda x: x[key] == value, users))
-        return users
-
     def generate_password(length: int = 6):
         chars = string.digits
         return ''.join(secrets.choice(chars) for x in range(length))
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
-
-    gc = gspread.auth.service_account(json_key_file)
-    book = gc.open_by_key(file_id)
-    sheet = WorksheetEx.cast(book.get_worksheet(sheet_index))
-
-    values = sheet.get_all_values()
-
-    year, month, day = values.pop(0)[1].split('/')
-    values.pop(0)
-
-    client = Zoom(auth_key['client-id'], auth_key['client-secret'], auth_key['account-id'])
-    users = client.get_users()
-
-    meetings = []
-
-    for i, value in enumerate(values):
-
-        if i < offset:
-            continue
-
-        if i >= limit:
-            break
-
-        matchName = value[0]
-        hour_s, min_s = value[2].split(':')
-        hour_e, min_e = value[3].split(':')
-        start_time = datetime(int(year), int(month), int(day), int(hour_s), int(min_s))
-        end_time = datetime(int(year), int(month), int(day), int(hour_e), int(min_e))
-        duration = math.ceil((end_time - start_time).total_seconds()/60.0)
-        user_id = value[5+judge_num+staff_num+1] if len(find_user(users, 'email', value[5+judge_num+staff_num+1])) > 0 else None
-        url = value[5+judge_num+staff_num+3]
-        meeting_id = value[5+judge_num+staff_num+4]
-        password = value[5+judge_num+staff_num+5]
-
-        if url and meeting_id and password:
-            meetings.append([url, meeting_id, password])
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
+
+    gc = open_client(json_key_file)
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index, judge_num, staff_num)
+    manifest = Manifest(file_id, schedule.sheet_id)
+
+    client = open_zoom(auth_key)
+    users = open_users(client, auth_key, workers)
+
+    new_meetings = []
+    targets: List[Match] = []
+    resumed: List[Match] = []
+
+    for match in schedule.select(offset, limit):
+
+        entry = manifest.get('room', match.name) if resume else None
+
+        if match.has_room:
+            print(prefix + match.name)
+        elif entry is not None:
+            match.set_room(entry['url'], entry['remote_id'], entry['payload']['password'])
+            resumed.append(match)
+            print(prefix + match.name)
+        elif match.start is None or match.end is None:
+            print(f'{prefix}{match.name}: start or end time is invalid')
         else:
+            user_id = match.user if users.find(match.user) is not None else None
+            duration = math.ceil((match.end - match.start).total_seconds()/60.0)
             request = {
-                'topic': prefix + matchName,
+                'topic': prefix + match.name,
                 'type': 2,
-                'start_time': start_time.strftime('%Y-%m-%dT%H:%M:%S+09:00'),
+                'start_time': match.start.strftime('%Y-%m-%dT%H:%M:%S+09:00'),
                 'duration': duration,
                 'timezone': 'Asia/Tokyo',
                 'password': generate_password(),
-                'agenda': prefix + matchName,
+                'agenda': prefix + match.name,
                 'settings': settings
             }
-            response = client.create_meeting(user_id, request)
-            if response.ok:
-                data = response.json()
-                meetings.append([data['join_url'], f"'{data['id']}", f"'{data['password']}"])
+            targets.append(match)
+            new_meetings.append((user_id, request))
+
+    with schedule.writer(chunk_rows, chunk_seconds) as write_back:
+
+        for match in resumed:
+            schedule.write(match, write_back)
+
+        def on_result(index: int, data: Dict[str, Any], error: Exception):
+            topic = new_meetings[index][1]['topic']
+            if error is None:
+                match = targets[index]
+                manifest.finished('room', match.name, 0, str(data['id']), data['join_url'], {'password': data['password']})
+                match.set_room(data['join_url'], data['id'], data['password'])
+                schedule.write(match, write_back)
+                print(topic)
             else:
-                meetings.append([None, None, None])
-
-        print(prefix + matchName)
+                print(f'{topic}: {error}')
 
-    start = gsutils.rowcol_to_a1(3+offset, 6+judge_num+staff_num+3)
-    end = gsutils.rowcol_to_a1(2+len(meetings)+offset, 6+judge_num+staff_num+5)
-    sheet.batch_update([
-        {'range': f'{start}:{end}', 'values': meetings}
-    ], value_input_option='USER_ENTERED')
+        counts = Path(auth_key.get('meeting-count-cache', ZOOM_MEETING_COUNT_CACHE))
+        MeetingScheduler(client, workers, counts=counts).create_meetings(new_meetings, on_result)
 
 
 def clear_room(json_key_file: Path, file_id: str, sheet_index: int,
                judge_num: int, staff_num: int, auth_key: Dict[str, str], **kwargs):
-    """試合会場を生成する
+    """試合会場を削除する
 
     :param credentials: Google の認証情報
     :type credentials: Credentials
@@ -145,52 +244,145 @@ def clear_room(json_key_file: Path, file_id: str, sheet_index: int,
     :param auth_key: Zoom の APIキー/APIシークレット
     :type auth_key: Dict[str, str]
     """
-    def delete_meetings(client: Zoom, ids: List[str], offset: int, limit: int):
-        count = 0
-        for i, id in enumerate(ids):
+    offset = kwargs['offset'] if 'offset' in kwargs else 0
+    limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
 
-            if i < offset:
-                continue
+    gc = open_client(json_key_file)
 
-            if i >= limit:
-                break
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index, judge_num, staff_num)
+    manifest = Manifest(file_id, schedule.sheet_id)
 
-            if id:
-                response = client.get_meeting(id)
-                if client.delete_meeting(id):
-                    print(f'delete {response["topic"]}')
+    targets = [match for match in schedule.select(offset, limit) if match.meeting_id]
 
-            count += 1
+    client = open_zoom(auth_key)
 
-        return count
+    with schedule.writer() as write_back:
 
-    offset = kwargs['offset'] if 'offset' in kwargs else 0
-    limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+        def on_result(index: int, result: bool, error: Exception):
+            match = targets[index]
+            if result:
+                manifest.remove('room', match.name)
+                match.set_room('', '', '')
+                schedule.write(match, write_back)
+                print(f'delete {match.name}')
+            else:
+                print(f'{match.name}: {error}')
 
-    gc = gspread.auth.service_account(json_key_file)
+        MeetingScheduler(client, workers).delete_meetings([match.meeting_id for match in targets], on_result)
 
-    book = gc.open_by_key(file_id)
-    sheet = WorksheetEx.cast(book.get_worksheet(sheet_index))
+    pass
 
-    values = sheet.get_all_values()
-    values = values[2:]
-    ids = [v[6+judge_num+staff_num+2+1] for v in values]
 
-    client = Zoom(auth_key['client-id'], auth_key['client-secret'], auth_key['account-id'])
-    count = delete_meetings(client, ids, offset, limit)
+def ballot_contents(match: Match, j: int, header: Dict[str, Any],
+                    ballot_config: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """勝敗・ポイント記入シートに書き込む内容を参照関係設定から求める
 
-    update_values = [['']*3 for i in range(count)]
-    start = gsutils.rowcol_to_a1(3+offset, 6+judge_num+staff_num+3)
-    end = gsutils.rowcol_to_a1(2+len(update_values)+offset, 6+judge_num+staff_num+5)
-    sheet.batch_update([
-        {'range': f'{start}:{end}', 'values': update_values}
-    ], value_input_option='USER_ENTERED')
+    :param match: 試合
+    :type match: Match
+    :param j: ジャッジの番号
+    :type j: int
+    :param header: セル番地で指定された参照元の値
+    :type header: Dict[str, Any]
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    :return: セルの位置と値, セルの位置とプルダウンの選択肢
+    :rtype: Tuple[Dict[str, Any], Dict[str, List[str]]]
+    """
+    cells = {}
+    options = {}
+    for link in ballot_config['to_ballot']:
+        if type(link[0]) == int:
+            if len(link) >= 3 and link[2]:
+                cells[link[1]] = match.text(link[0]+j)
+            else:
+                cells[link[1]] = match.text(link[0])
+        elif type(link[0]) == str:
+            cells[link[1]] = header[link[0]]
+        elif type(link[0]) == list:
+            options[link[1]] = [match.text(x) for x in link[0]]
+    return cells, options
+
+
+def ballot_vote(match: Match, j: int, row: int, ballot_id: str, sheet_title: str,
+                ballot_config: Dict[str, Any]) -> List[Any]:
+    """投票シートに書き込む行を求める
+
+    :param match: 試合
+    :type match: Match
+    :param j: ジャッジの番号
+    :type j: int
+    :param row: 投票シートの行番号
+    :type row: int
+    :param ballot_id: 勝敗・ポイント記入シートのスプレッドシートID
+    :type ballot_id: str
+    :param sheet_title: 勝敗・ポイント記入シートのシート名
+    :type sheet_title: str
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    :return: 投票シートの行の値
+    :rtype: List[Any]
+    """
+    vote = [''] * 11
+    vote[0] = f"'{match.name}"
+    vote[1] = j
+    vote[2] = match.judges[j].text
+    vote[4] = f'=IF({gsutils.rowcol_to_a1(row,10)}="肯定",1,0)'
+    vote[7] = f'=IF({gsutils.rowcol_to_a1(row,10)}="否定",1,0)'
+    for link in ballot_config['to_vote']:
+        vote[link[1]] = f'=IMPORTRANGE("{ballot_id}","{sheet_title}!{link[0]}")'
+    return vote
+
+
+def create_ballot(template: Template, match: Match, j: int, row: int, header: Dict[str, Any],
+                  ballot_config: Dict[str, Any], state: BallotState, manifest: Manifest,
+                  resume: bool = False) -> Tuple[str, List[Any]]:
+    """勝敗・ポイント記入シートを1つ生成し、書き込んだ内容を記録する
+
+    :param template: テンプレート
+    :type template: Template
+    :param match: 試合
+    :type match: Match
+    :param j: ジャッジの番号
+    :type j: int
+    :param row: 投票シートの行番号
+    :type row: int
+    :param header: セル番地で指定された参照元の値
+    :type header: Dict[str, Any]
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    :param state: 書き込んだ内容の記録
+    :type state: BallotState
+    :param manifest: 成果物の記録
+    :type manifest: Manifest
+    :param resume: 記録済みのシートを再利用するか, defaults to False
+    :type resume: bool, optional
+    :return: 生成したシートのID, 投票シートの行の値
+    :rtype: Tuple[str, List[Any]]
+    """
+    new_book, done = copy_template(manifest, resume, template, 'ballot', match.name, j,
+                                   f"{ballot_config['title']} {match.name} #{j}", ballot_config['folder'])
+    vote = ballot_vote(match, j, row, new_book.id, new_book.sheet_title, ballot_config)
+    if done:
+        return new_book.id, vote
 
-    pass
+    cells, options = ballot_contents(match, j, header, ballot_config)
+    render = DocumentRender(new_book.sheet_id)
+    for label, cell in cells.items():
+        render.set_value(label, cell)
+    for label, option in options.items():
+        render.set_options(label, option)
+    render.send(new_book)
+    manifest.finished('ballot', match.name, j, new_book.id, new_book.url)
+
+    state.record(new_book.id, new_book.sheet_id, new_book.sheet_title, cells, options, vote, row)
+
+    return new_book.id, vote
 
 
 def generate_ballot(json_key_file: Path, file_id: str, sheet_index_matches: int, sheet_index_vote: int,
-                    judge_num: int, ballot_config: Dict[str, Any], **kwargs):
+                    judge_num: int, staff_num: int, ballot_config: Dict[str, Any], **kwargs):
     """対戦表に基づき、勝敗・ポイント記入シートを生成する
 
     :param credentials: Google の認証情報
@@ -203,130 +395,71 @@ def generate_ballot(json_key_file: Path, file_id: str, sheet_index_matches: int,
     :type sheet_index_vote: int
     :param judge_num: ジャッジの人数
     :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
     :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
     :type ballot_config: Dict[str, Any]
     """
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
 
-    gc = gspread.auth.service_account(json_key_file)
+    gc = open_client(json_key_file, workers)
 
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    header = get_header_cells(schedule, ballot_config['to_ballot'])
 
-    values = sheet_matches.get_all_values()
-    values = values[2:]
+    # 複数の対戦表シートを処理する場合は、投票シートの行と書き込んだ内容の記録を共有する
+    vote_rows = kwargs['vote_rows'] if 'vote_rows' in kwargs else VoteRows(snapshot, sheet_index_vote, offset <= 0)
+    state = kwargs['ballot_state'] if 'ballot_state' in kwargs else None
+    if state is None:
+        state = BallotState(file_id)
+        if offset <= 0 and not resume:
+            state.clear()
 
-    sheet_vote = WorksheetEx.cast(book.get_worksheet(sheet_index_vote))
-    row_count = len(sheet_vote.col_values(1))
-    if offset <= 0:
-        if row_count > 1:
-            sheet_vote.delete_rows(2, row_count)
-            sheet_vote = WorksheetEx.cast(book.get_worksheet(sheet_index_vote))
-            row_count = len(sheet_vote.col_values(1))
+    template = Template.open(gc, ballot_config['template'])
+    manifest = Manifest(file_id, schedule.sheet_id)
 
-    votes = []
-    new_ballots = []
-    actual_judge_num = 0
+    targets = []
 
-    for i, value in enumerate(values):
+    for match in schedule.select(offset, limit):
 
-        if i < offset:
+        if not match.has_teams:
             continue
 
-        if i >= limit:
-            break
+        for j, judge in enumerate(match.judges):
 
-        if not value[4] or not value[5]:
-            new_ballots.append([None]*judge_num)
-            continue
-
-        ballots = []
-        for j in range(judge_num):
-
-            if not value[6+j]:
+            if not judge.text:
                 continue
 
-            actual_judge_num += 1
-
-            new_book = gc.copy(ballot_config['template'])
-            ballots.append(new_book.url)
-            new_sheet = WorksheetEx.cast(new_book.get_worksheet(0))
-
-            new_book.batch_update({
-                'requests': [
-                    {
-                        'updateSpreadsheetProperties': {
-                            'properties': {
-                                'title': f"{ballot_config['title']} {value[0]} #{j}"
-                            },
-                            'fields': 'title'
-                        }
-                    }
-                ]
-            })
-
-            gauth = get_gauth(json_key_file)
-
-            gdrive = GoogleDrive(gauth)
-            gfile = gdrive.CreateFile({'id': new_book.id})
-            time.sleep(INTERVAL)
-            gfile.FetchMetadata(fetch_all=True)
-            time.sleep(INTERVAL)
-
-            gfile['parents'] = [{'id': ballot_config['folder']}]
-            gfile.Upload()
-            time.sleep(INTERVAL)
-
-            row = row_count + actual_judge_num
-            vote = [''] * 11
-            vote[0] = f"'{value[0]}"
-            vote[1] = j
-            vote[2] = value[6+j]
-            vote[4] = f'=IF({gsutils.rowcol_to_a1(row,10)}="肯定",1,0)'
-            vote[7] = f'=IF({gsutils.rowcol_to_a1(row,10)}="否定",1,0)'
-            for link in ballot_config['to_vote']:
-                vote[link[1]] = f'=IMPORTRANGE("{new_book.id}","{new_sheet.title}!{link[0]}")'
-                pass
-
-            votes.append(vote)
-
-            for link in ballot_config['to_ballot']:
-                if type(link[0]) == int:
-                    if len(link) >= 3 and link[2]:
-                        new_sheet.update_acell(link[1], value[link[0]+j])
-                    else:
-                        new_sheet.update_acell(link[1], value[link[0]])
-                elif type(link[0]) == str:
-                    cell = sheet_matches.acell(link[0], value_render_option='FORMATTED_VALUE')
-                    new_sheet.update_acell(link[1], cell.value)
-                elif type(link[0]) == list:
-                    options = [value[x] for x in link[0]]
-                    new_sheet.set_data_validation(link[1], WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True)
-                time.sleep(INTERVAL)
-
-            print(f"{ballot_config['title']} {value[0]} #{j}")
-
-        new_ballots.append(ballots)
-
-    sheet_vote.append_rows(votes, value_input_option='USER_ENTERED', insert_data_option='INSERT_ROWS')
+            targets.append((match, j))
 
-    start = gsutils.rowcol_to_a1(3+offset, 7)
-    end = gsutils.rowcol_to_a1(2+len(new_ballots)+offset, 6+judge_num)
-    target_range = f'{start}:{end}' if judge_num > 1 or len(new_ballots) > 2 else f'{start}'
-    judges = sheet_matches.get(target_range)
+    # 投票シートの行は生成順に関わらず行番号を指定して書き込むため、先に行を確保しておく
+    first_row = vote_rows.allocate(len(targets))
+    jobs = [(template, match, j, first_row + k, header, ballot_config, state, manifest, resume)
+            for k, (match, j) in enumerate(targets)]
 
-    if (len(judges)) > 0:
-        new_values = [[f'=HYPERLINK("{col}","{judges[i][j]}")' if col else f'{judges[i][j]}' for j, col in enumerate(row)] for i, row in enumerate(new_ballots)]
-        sheet_matches.batch_update([
-            {'range': f'{start}:{end}', 'values': new_values}
-        ], value_input_option='USER_ENTERED')
+    with WriteBack(vote_rows.worksheet, chunk_rows, chunk_seconds, lambda: snapshot.invalidate(sheet_index_vote)) as votes, \
+            schedule.writer(chunk_rows, chunk_seconds) as links:
+        try:
+            for (template, match, j, row, *_), (ballot_id, vote) in zip(jobs, run_jobs(create_ballot, jobs, workers)):
+                votes.put(f'{gsutils.rowcol_to_a1(row, 1)}:{gsutils.rowcol_to_a1(row, 11)}', [vote])
+                match.set_ballot(j, ballot_id)
+                schedule.write(match, links)
+                print(f"{ballot_config['title']} {match.name} #{j}")
+        finally:
+            state.save()
 
     pass
 
 
-def generate_member_list(json_key_file: Path, file_id: str, sheet_index_matches: int, member_list_config: Dict[str, Any], **kwargs):
+def generate_member_list(json_key_file: Path, file_id: str, sheet_index_matches: int,
+                         judge_num: int, staff_num: int, member_list_config: Dict[str, Any], **kwargs):
     """対戦表に基づき、出場メンバー届を生成する
 
     :param credentials: Google の認証情報
@@ -335,104 +468,104 @@ def generate_member_list(json_key_file: Path, file_id: str, sheet_index_matches:
     :type file_id: str
     :param sheet_index_matches: 対戦表シートのインデックス
     :type sheet_index_matches: int
+    :param judge_num: ジャッジの人数
+    :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
     :param member_list_config: 勝敗・ポイント記入シートの参照関係設定
     :type member_list_config: Dict[str, Any]
     """
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
 
-    gc = gspread.auth.service_account(json_key_file)
+    gc = open_client(json_key_file, workers)
 
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    header = get_header_cells(schedule, member_list_config['to_list'])
 
-    values = sheet_matches.get_all_values()
-    values = values[2:]
+    template = Template.open(gc, member_list_config['template'])
+    manifest = Manifest(file_id, schedule.sheet_id)
 
-    new_member_lists = []
+    def create_member_list(match: Match, j: int):
+        side = '肯定' if j == 0 else '否定'
 
-    for i, value in enumerate(values):
+        new_book, done = copy_template(manifest, resume, template, 'member_list', match.name, j,
+                                       f"{member_list_config['title']} {match.name} {side}", member_list_config['folder'])
+        if done:
+            return new_book.id
 
-        if i < offset:
-            continue
+        render = DocumentRender(new_book.sheet_id)
+
+        for link in member_list_config['to_list']:
+            if type(link) == list:
+                if type(link[0]) == int:
+                    if len(link) >= 3 and link[2]:
+                        render.set_value(link[1], match.text(link[0]+j))
+                    else:
+                        render.set_value(link[1], match.text(link[0]))
+                elif type(link[0]) == str:
+                    render.set_value(link[1], header[link[0]])
+                elif type(link[0]) == list:
+                    options = [match.text(x) for x in link[0]]
+                    render.set_options(link[1], options)
+            elif type(link) == dict:
+                if 'side' in link:
+                    render.set_value(link['side'], side)
 
-        if i >= limit:
-            break
+        render.send(new_book)
+        manifest.finished('member_list', match.name, j, new_book.id, new_book.url)
 
-        member_lists = []
-        for j in range(2):
+        return new_book.id
 
-            if not value[4+j]:
-                member_lists.append(None)
-                continue
+    jobs = []
 
-            side = '肯定' if j == 0 else '否定'
+    for match in schedule.select(offset, limit):
 
-            new_book = gc.copy(member_list_config['template'])
-            member_lists.append(new_book.url)
-            new_sheet = WorksheetEx.cast(new_book.get_worksheet(0))
+        for j, team in enumerate(match.teams):
 
-            new_book.batch_update({
-                'requests': [
-                    {
-                        'updateSpreadsheetProperties': {
-                            'properties': {
-                                'title': f"{member_list_config['title']} {value[0]} {side}"
-                            },
-                            'fields': 'title'
-                        }
-                    }
-                ]
-            })
-
-            gauth = get_gauth(json_key_file)
-
-            gdrive = GoogleDrive(gauth)
-            gfile = gdrive.CreateFile({'id': new_book.id})
-            time.sleep(INTERVAL)
-            gfile.FetchMetadata(fetch_all=True)
-            time.sleep(INTERVAL)
-
-            gfile['parents'] = [{'id': member_list_config['folder']}]
-            gfile.Upload()
-            time.sleep(INTERVAL)
-
-            for link in member_list_config['to_list']:
-                if type(link) == list:
-                    if type(link[0]) == int:
-                        if len(link) >= 3 and link[2]:
-                            new_sheet.update_acell(link[1], value[link[0]+j])
-                        else:
-                            new_sheet.update_acell(link[1], value[link[0]])
-                    elif type(link[0]) == str:
-                        cell = sheet_matches.acell(link[0], value_render_option='FORMATTED_VALUE')
-                        new_sheet.update_acell(link[1], cell.value)
-                    elif type(link[0]) == list:
-                        options = [value[x] for x in link[0]]
-                        new_sheet.set_data_validation(link[1], WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True)
-                elif type(link) == dict:
-                    if 'side' in link:
-                        new_sheet.update_acell(link['side'], side)
-                time.sleep(INTERVAL)
-
-            print(f"{member_list_config['title']} {value[0]} {side}")
-
-        new_member_lists.append(member_lists)
-
-    start = gsutils.rowcol_to_a1(3+offset, 5)
-    end = gsutils.rowcol_to_a1(2+len(new_member_lists)+offset, 6)
-    target_range = f'{start}:{end}'
-    lists = sheet_matches.get(target_range)
-
-    new_values = [[f'=HYPERLINK("{col}","{lists[i][j]}")' if col else f'{lists[i][j]}' for j, col in enumerate(row)] for i, row in enumerate(new_member_lists)]
-    sheet_matches.batch_update([
-        {'range': f'{start}:{end}', 'values': new_values}
-    ], value_input_option='USER_ENTERED')
+            if not team.text:
+                continue
+
+            jobs.append((match, j))
+
+    with schedule.writer(chunk_rows, chunk_seconds) as links:
+        for (match, j), list_id in zip(jobs, run_jobs(create_member_list, jobs, workers)):
+            match.set_team_list(j, list_id)
+            schedule.write(match, links)
+            print(f"{member_list_config['title']} {match.name} {'肯定' if j == 0 else '否定'}")
 
     pass
 
 
+def aggregate_formula(kind: str, refs: List[str]) -> str:
+    """集計用紙のセルに書き込む数式を組み立てる
+
+    :param kind: 集計の種類 (``POINT``, ``VOTE_AFF``, ``VOTE_NEG``, ``CONFIRM``)
+    :type kind: str
+    :param refs: 各ジャッジの値を参照する式
+    :type refs: List[str]
+    :return: 数式. 参照が無い場合は空文字列
+    :rtype: str
+    """
+    if len(refs) == 0:
+        return ''
+    if kind == 'POINT':
+        return '=' + '+'.join(refs)
+    elif kind == 'VOTE_AFF':
+        return '=' + '+'.join(f'IF({ref}="肯定",1,0)' for ref in refs)
+    elif kind == 'VOTE_NEG':
+        return '=' + '+'.join(f'IF({ref}="否定",1,0)' for ref in refs)
+    elif kind == 'CONFIRM':
+        return '=IF(AND(' + ','.join(f'{ref}="確定"' for ref in refs) + '),"確定","未確定あり")'
+    return ''
+
+
 def generate_aggregate(json_key_file: Path, file_id: str, sheet_index_matches: int,
                        judge_num: int, staff_num: int, aggregate_config: Dict[str, Any], **kwargs):
     """対戦表に基づき、集計用紙を生成する
@@ -453,105 +586,85 @@ def generate_aggregate(json_key_file: Path, file_id: str, sheet_index_matches: i
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
-
-    gc = gspread.auth.service_account(json_key_file)
-
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
-
-    values = sheet_matches.get_all_values(value_render_option='FORMULA')
-    values = values[2:]
-
-    new_aggregates = []
-    pattern = r'=HYPERLINK\("https://docs\.google\.com/spreadsheets/d/(.*?)","(.*?)"\)'
-
-    for i, value in enumerate(values):
-
-        if i < offset:
-            continue
-
-        if i >= limit:
-            break
-
-        if not values[4] or not values[5]:
-            new_aggregates.append(None)
-            continue
-
-        new_book = gc.copy(aggregate_config['template'])
-        new_aggregates.append(new_book.url)
-        new_sheet = WorksheetEx.cast(new_book.get_worksheet(0))
-
-        new_book.batch_update({
-            'requests': [
-                {
-                    'updateSpreadsheetProperties': {
-                        'properties': {
-                            'title': f"{aggregate_config['title']} {value[0]}"
-                        },
-                        'fields': 'title'
-                    }
-                }
-            ]
-        })
-
-        gauth = get_gauth(json_key_file)
-
-        gdrive = GoogleDrive(gauth)
-        gfile = gdrive.CreateFile({'id': new_book.id})
-        time.sleep(INTERVAL)
-        gfile.FetchMetadata(fetch_all=True)
-        time.sleep(INTERVAL)
-
-        gfile['parents'] = [{'id': aggregate_config['folder']}]
-        gfile.Upload()
-        time.sleep(INTERVAL)
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
+
+    gc = open_client(json_key_file, workers)
+
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    header = get_header_cells(schedule, aggregate_config['to_aggregate'])
+
+    template = Template.open(gc, aggregate_config['template'])
+    manifest = Manifest(file_id, schedule.sheet_id)
+
+    staging = aggregate_config['staging'] if 'staging' in aggregate_config else None
+    if staging is not None:
+        cells = [gsutils.a1_to_rowcol(link[0]) for link in aggregate_config['link']]
+        top, left = min(row for row, col in cells), min(col for row, col in cells)
+        bottom, right = max(row for row, col in cells), max(col for row, col in cells)
+        block = f'{gsutils.rowcol_to_a1(top, left)}:{gsutils.rowcol_to_a1(bottom, right)}'
+        block_rows = bottom - top + 1
+        staging_row, staging_col = gsutils.a1_to_rowcol(staging)
+        staging_last_row = staging_row + judge_num*block_rows - 1
+        staging_last_col = staging_col + right - left
+
+    def create_aggregate(match: Match):
+        new_book, done = copy_template(manifest, resume, template, 'aggregate', match.name, 0,
+                                       f"{aggregate_config['title']} {match.name}", aggregate_config['folder'])
+        if done:
+            return new_book.id
+
+        render = DocumentRender(new_book.sheet_id)
+
+        if staging is not None:
+            if staging_last_col > template.column_count:
+                render.append_columns(staging_last_col - template.column_count)
+            if staging_last_row > template.row_count:
+                render.append_rows(staging_last_row - template.row_count)
+            render.hide_columns(staging_col, staging_last_col)
 
         for link in aggregate_config['to_aggregate']:
             if type(link) == list:
                 if type(link[0]) == int:
-                    new_sheet.update_acell(link[1], value[link[0]])
+                    render.set_value(link[1], match.text(link[0]))
                 elif type(link[0]) == str:
-                    cell = sheet_matches.acell(link[0], value_render_option='FORMATTED_VALUE')
-                    new_sheet.update_acell(link[1], cell.value)
+                    render.set_value(link[1], header[link[0]])
                 elif type(link[0]) == list:
-                    options = [value[x] for x in link[0]]
-                    new_sheet.set_data_validation(link[1], WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True)
-            time.sleep(INTERVAL)
+                    options = [match.text(x) for x in link[0]]
+                    render.set_options(link[1], options)
 
-        links = [''] * len(aggregate_config['link'])
-        for j in range(judge_num):
+        ballots = [(j, judge.id) for j, judge in enumerate(match.judges) if judge.id]
 
-            match = re.match(pattern, value[6+j])
-            if not match:
-                continue
+        if staging is None:
+            refs = [[f'IMPORTRANGE("{ballot}","{link[0]}")' for j, ballot in ballots] for link in aggregate_config['link']]
+        else:
+            # ジャッジ毎に必要な範囲を1回だけ取り込み、集計は取り込んだ範囲を参照して行う
+            for j, ballot in ballots:
+                render.set_value(gsutils.rowcol_to_a1(staging_row + j*block_rows, staging_col), f'=IMPORTRANGE("{ballot}","{block}")')
+            refs = [[gsutils.rowcol_to_a1(staging_row + j*block_rows + row - top, staging_col + col - left)
+                     for j, ballot in ballots]
+                    for row, col in (gsutils.a1_to_rowcol(link[0]) for link in aggregate_config['link'])]
 
-            ballot = match.group(1)
-
-            for k, link in enumerate(aggregate_config['link']):
-                if link[2] == 'POINT':
-                    links[k] = links[k] + f'{"=" if j==0 else "+"}IMPORTRANGE("{ballot}","{link[0]}")'
-                elif link[2] == 'VOTE_AFF':
-                    links[k] = links[k] + f'{"=" if j==0 else "+"}IF(IMPORTRANGE("{ballot}","{link[0]}")="肯定",1,0)'
-                elif link[2] == 'VOTE_NEG':
-                    links[k] = links[k] + f'{"=" if j==0 else "+"}IF(IMPORTRANGE("{ballot}","{link[0]}")="否定",1,0)'
-                elif link[2] == 'CONFIRM':
-                    if j==0:
-                        links[k] = '=IF(AND('
-                    links[k] = links[k] + f'IMPORTRANGE("{ballot}","{link[0]}")="確定",'
-                    if j==(judge_num-1):
-                        links[k] = links[k] + '),"確定","未確定あり")'
+        links = [aggregate_formula(link[2], refs[k]) for k, link in enumerate(aggregate_config['link'])]
 
         for k, link in enumerate(aggregate_config['link']):
-            new_sheet.update_acell(link[1], links[k])
-            time.sleep(INTERVAL)
+            render.set_value(link[1], links[k])
+
+        render.send(new_book)
+        manifest.finished('aggregate', match.name, 0, new_book.id, new_book.url)
 
-        print(f"{aggregate_config['title']} {value[0]}")
+        return new_book.id
 
-    start = gsutils.rowcol_to_a1(3+offset, 6+judge_num+staff_num+9)
-    end = gsutils.rowcol_to_a1(2+len(new_aggregates)+offset, 6+judge_num+staff_num+9)
-    sheet_matches.batch_update([
-        {'range': f'{start}:{end}', 'values': [[f'=HYPERLINK("{v}","Link")' if v else ''] for v in new_aggregates]}
-    ], value_input_option='USER_ENTERED')
+    jobs = [(match,) for match in schedule.select(offset, limit) if match.has_teams]
+
+    with schedule.writer(chunk_rows, chunk_seconds) as links:
+        for (match,), aggregate_id in zip(jobs, run_jobs(create_aggregate, jobs, workers)):
+            match.set_aggregate(aggregate_id)
+            schedule.write(match, links)
+            print(f"{aggregate_config['title']} {match.name}")
 
     pass
 
@@ -576,104 +689,81 @@ def generate_advice(json_key_file: Path, file_id: str, sheet_index_matches: int,
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
 
-    gc = gspread.auth.service_account(json_key_file)
-
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
+    gc = open_client(json_key_file, workers)
 
-    values = sheet_matches.get_all_values()
-    values = values[2:]
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    header = get_header_cells(schedule, advice_config['to_advice'])
 
-    new_advice = []
+    template = Template.open(gc, advice_config['template'])
+    manifest = Manifest(file_id, schedule.sheet_id)
 
-    for i, value in enumerate(values):
+    def create_advice(match: Match, j: int):
+        side = '肯定' if j == 0 else '否定'
 
-        if i < offset:
-            continue
+        new_book, done = copy_template(manifest, resume, template, 'advice', match.name, j,
+                                       f"{advice_config['title']} {match.name} {side}", advice_config['folder'])
+        if done:
+            return new_book.id
 
-        if i >= limit:
-            break
+        render = DocumentRender(new_book.sheet_id)
 
-        advice_list = []
-
-        for j in range(2):
-
-            if not value[4+j]:
-                advice_list.append(None)
+        for link in advice_config['to_advice']:
+            if type(link) == list:
+                if type(link[0]) == int:
+                    if len(link) >= 3 and link[2]:
+                        render.set_value(link[1], match.text(link[0]+j))
+                    else:
+                        render.set_value(link[1], match.text(link[0]))
+                elif type(link[0]) == str:
+                    render.set_value(link[1], header[link[0]])
+                elif type(link[0]) == list:
+                    options = [match.text(x) for x in link[0]]
+                    render.set_options(link[1], options)
+            elif type(link) == dict:
+                if 'aff' in link and side == '肯定':
+                    for x in link['aff']:
+                        if type(x) == int:
+                            render.set_value(link[1], match.text(link[0]))
+                        elif type(x) == str:
+                            render.set_value(x, side)
+                        elif type(x) == list:
+                            render.set_value(x[1], match.text(x[0]))
+                if 'neg' in link and side == '否定':
+                    for x in link['neg']:
+                        if type(x) == int:
+                            render.set_value(link[1], match.text(link[0]))
+                        elif type(x) == str:
+                            render.set_value(x, side)
+                        elif type(x) == list:
+                            render.set_value(x[1], match.text(x[0]))
+
+        render.send(new_book)
+        manifest.finished('advice', match.name, j, new_book.id, new_book.url)
+
+        return new_book.id
+
+    jobs = []
+
+    for match in schedule.select(offset, limit):
+
+        for j, team in enumerate(match.teams):
+
+            if not team.text:
                 continue
 
-            side = '肯定' if j == 0 else '否定'
+            jobs.append((match, j))
 
-            new_book = gc.copy(advice_config['template'])
-            advice_list.append(new_book.url)
-            new_sheet = WorksheetEx.cast(new_book.get_worksheet(0))
-
-            new_book.batch_update({
-                'requests': [
-                    {
-                        'updateSpreadsheetProperties': {
-                            'properties': {
-                                'title': f"{advice_config['title']} {value[0]} {side}"
-                            },
-                            'fields': 'title'
-                        }
-                    }
-                ]
-            })
-
-            gauth = get_gauth(json_key_file)
-
-            gdrive = GoogleDrive(gauth)
-            gfile = gdrive.CreateFile({'id': new_book.id})
-            gfile.FetchMetadata(fetch_all=True)
-
-            gfile['parents'] = [{'id': advice_config['folder']}]
-            gfile.Upload()
-
-            for link in advice_config['to_advice']:
-                if type(link) == list:
-                    if type(link[0]) == int:
-                        if len(link) >= 3 and link[2]:
-                            new_sheet.update_acell(link[1], value[link[0]+j])
-                        else:
-                            new_sheet.update_acell(link[1], value[link[0]])
-                    elif type(link[0]) == str:
-                        cell = sheet_matches.acell(link[0], value_render_option='FORMATTED_VALUE')
-                        new_sheet.update_acell(link[1], cell.value)
-                    elif type(link[0]) == list:
-                        options = [value[x] for x in link[0]]
-                        new_sheet.set_data_validation(link[1], WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True)
-                elif type(link) == dict:
-                    if 'aff' in link and side == '肯定':
-                        for x in link['aff']:
-                            if type(x) == int:
-                                new_sheet.update_acell(link[1], value[link[0]])
-                            elif type(x) == str:
-                                new_sheet.update_acell(x, side)
-                            elif type(x) == list:
-                                new_sheet.update_acell(x[1], value[x[0]])
-                    if 'neg' in link and side == '否定':
-                        for x in link['neg']:
-                            if type(x) == int:
-                                new_sheet.update_acell(link[1], value[link[0]])
-                            elif type(x) == str:
-                                new_sheet.update_acell(x, side)
-                            elif type(x) == list:
-                                new_sheet.update_acell(x[1], value[x[0]])
-                time.sleep(INTERVAL)
-
-            print(f"{advice_config['title']} {value[0]} {side}")
-
-        new_advice.append(advice_list)
-
-    start = gsutils.rowcol_to_a1(3+offset, 6+judge_num+staff_num+10)
-    end = gsutils.rowcol_to_a1(2+len(new_advice)+offset, 6+judge_num+staff_num+11)
-
-    new_values = [[f'=HYPERLINK("{col}","Link")' if col else '' for col in row] for row in new_advice]
-    sheet_matches.batch_update([
-        {'range': f'{start}:{end}', 'values': new_values}
-    ], value_input_option='USER_ENTERED')
+    with schedule.writer(chunk_rows, chunk_seconds) as links:
+        for (match, j), advice_id in zip(jobs, run_jobs(create_advice, jobs, workers)):
+            match.set_advice(j, advice_id)
+            schedule.write(match, links)
+            print(f"{advice_config['title']} {match.name} {'肯定' if j == 0 else '否定'}")
 
     pass
 
@@ -700,39 +790,206 @@ def update_live(json_key_file: Path, file_id: str, sheet_index_matches: int,
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
 
-    gc = gspread.auth.service_account(json_key_file)
+    gc = open_client(json_key_file)
 
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
 
-    values = sheet_matches.get_all_values()
-    values = values[2:]
+    client = open_zoom(auth_key)
 
-    client = Zoom(auth_key['client-id'], auth_key['client-secret'], auth_key['account-id'])
+    for match in schedule.select(offset, limit):
 
-    for i, value in enumerate(values):
+        if match.meeting_id and match.stream_url and match.stream_key and match.page_url:
+            if not client.update_livestream(match.meeting_id, match.stream_url, match.stream_key, match.page_url):
+                raise RuntimeError(f'Update live failed: {match.meeting_id}')
+        print(match.name)
+    pass
 
-        if i < offset:
-            continue
 
-        if i >= limit:
-            break
+def update_ballot(json_key_file: Path, file_id: str, sheet_index_matches: int, sheet_index_vote: int,
+                  judge_num: int, staff_num: int, ballot_config: Dict[str, Any], **kwargs):
+    """対戦表の変更点を勝敗・ポイント記入シートに反映する
+
+    生成済みのシートは、前回書き込んだ内容 (BallotState) と対戦表の現在の内容を比較し、
+    変更のあったセルと投票シートの行だけを書き込む。
+    ジャッジのセルがリンクになっていない場合は、シートを新たに生成して投票シートに書き込む。
+    投票シートにその試合とジャッジの行が既にあれば上書きし、無ければ行を追加する。
+
+    :param credentials: Google の認証情報
+    :type credentials: Credentials
+    :param file_id: 管理用スプレッドシートのID
+    :type file_id: str
+    :param sheet_index_matches: 対戦表シートのインデックス
+    :type sheet_index_matches: int
+    :param sheet_index_vote: 投票シートのインデックス
+    :type sheet_index_vote: int
+    :param judge_num: ジャッジの人数
+    :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    """
 
-        meeting_id = value[5+judge_num+staff_num+4]
-        stream_url = value[5+judge_num+staff_num+6]
-        stream_key = value[5+judge_num+staff_num+7]
-        page_url = value[5+judge_num+staff_num+8]
+    offset = kwargs['offset'] if 'offset' in kwargs else 0
+    limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+    chunk_seconds = kwargs['chunk_seconds'] if 'chunk_seconds' in kwargs else WriteBack.CHUNK_SECONDS
+
+    gc = open_client(json_key_file, workers)
+
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    sheet_vote = snapshot.worksheet(sheet_index_vote)
+    header = get_header_cells(schedule, ballot_config['to_ballot'])
+
+    state = kwargs['ballot_state'] if 'ballot_state' in kwargs else BallotState(file_id)
+    manifest = Manifest(file_id, schedule.sheet_id)
+    imported_rows = None
+
+    def find_vote_row(ballot_id: str) -> Union[int, None]:
+        # 記録の無いシートは、投票シートの IMPORTRANGE から行を探す
+        nonlocal imported_rows
+        if imported_rows is None:
+            imported_rows = {}
+            for k, row in enumerate(snapshot.values(sheet_index_vote, Snapshot.FORMULA)):
+                for cell in row:
+                    imported = re.match(r'=IMPORTRANGE\("(.*?)"', str(cell))
+                    if imported:
+                        imported_rows.setdefault(imported.group(1), k+1)
+        return imported_rows.get(ballot_id)
+
+    new_jobs = []
+    updated = []
+
+    try:
+        with WriteBack(sheet_vote, chunk_rows, chunk_seconds, lambda: snapshot.invalidate(sheet_index_vote)) as votes, \
+                schedule.writer(chunk_rows, chunk_seconds) as links:
+
+            for match in schedule.select(offset, limit):
+
+                if not match.has_teams:
+                    continue
+
+                for j, judge in enumerate(match.judges):
+
+                    if not judge.text:
+                        continue
+
+                    if not judge.id:
+                        new_jobs.append((match, j))
+                        continue
+
+                    ballot_id = judge.id
+                    cells, options = ballot_contents(match, j, header, ballot_config)
+                    pushed = state.get(ballot_id)
+                    if pushed is None:
+                        template = Template.open(gc, ballot_config['template'])
+                        pushed = {
+                            'sheet_id': template.sheet_id,
+                            'sheet_title': template.sheet_title,
+                            'cells': {},
+                            'options': {},
+                            'vote': [],
+                            'vote_row': find_vote_row(ballot_id),
+                        }
+
+                    render = DocumentRender(pushed['sheet_id'])
+                    for label, cell in cells.items():
+                        if label not in pushed['cells'] or pushed['cells'][label] != cell:
+                            render.set_value(label, cell)
+                    for label, option in options.items():
+                        if label not in pushed['options'] or pushed['options'][label] != option:
+                            render.set_options(label, option)
+
+                    vote = pushed['vote']
+                    vote_row = pushed['vote_row']
+                    if vote_row is not None:
+                        vote = ballot_vote(match, j, vote_row, ballot_id, pushed['sheet_title'], ballot_config)
+                        changed = [k for k, cell in enumerate(vote) if k >= len(pushed['vote']) or pushed['vote'][k] != cell]
+                        if len(changed) > 0:
+                            first, last = changed[0], changed[-1]
+                            votes.put(f'{gsutils.rowcol_to_a1(vote_row, first+1)}:{gsutils.rowcol_to_a1(vote_row, last+1)}',
+                                      [vote[first:last+1]])
+
+                    if len(render.requests) == 0 and vote == pushed['vote']:
+                        continue
+
+                    render.send(Document(gc, ballot_id, pushed['sheet_id'], pushed['sheet_title']))
+                    updated.append((ballot_id, pushed['sheet_id'], pushed['sheet_title'], cells, options, vote, vote_row))
+
+                    print(f"{ballot_config['title']} {match.name} #{j} (updated)")
+
+            if len(new_jobs) > 0:
+                template = Template.open(gc, ballot_config['template'])
+                # リンクが外れただけのジャッジは、投票シートの既存の行を上書きする
+                existing = vote_row_index(snapshot, sheet_index_vote)
+                rows = [existing.get((match.name, j)) for match, j in new_jobs]
+                missing = rows.count(None)
+                if missing > 0:
+                    vote_rows = kwargs['vote_rows'] if 'vote_rows' in kwargs else VoteRows(snapshot, sheet_index_vote)
+                    allocated = iter(range(vote_rows.allocate(missing), sys.maxsize))
+                    rows = [row if row is not None else next(allocated) for row in rows]
+
+                jobs = [(template, match, j, row, header, ballot_config, state, manifest)
+                        for (match, j), row in zip(new_jobs, rows)]
+                for (template, match, j, row, *_), (ballot_id, vote) in zip(jobs, run_jobs(create_ballot, jobs, workers)):
+                    votes.put(f'{gsutils.rowcol_to_a1(row, 1)}:{gsutils.rowcol_to_a1(row, 11)}', [vote])
+                    match.set_ballot(j, ballot_id)
+                    schedule.write(match, links)
+                    print(f"{ballot_config['title']} {match.name} #{j}")
+
+        # 投票シートへの書き込みが完了したものだけを記録する
+        for args in updated:
+            state.record(*args)
+    finally:
+        state.save()
 
-        if meeting_id and stream_url and stream_key and page_url:
-            if not client.update_livestream(meeting_id, stream_url, stream_key, page_url):
-                raise RuntimeError(f'Update live failed: {meeting_id}')
-        print(value[0])
     pass
 
 
-def update_ballot(json_key_file: Path, file_id: str, sheet_index_matches: int, sheet_index_vote: int,
-                  judge_num: int, ballot_config: Dict[str, Any], **kwargs):
-    """対戦表の変更点を勝敗・ポイント記入シートに反映する
+def vote_row_index(snapshot: Snapshot, sheet_index_vote: int) -> Dict[Tuple[str, int], int]:
+    """投票シートの行番号を、試合名とジャッジの番号から引けるようにする
+
+    :param snapshot: 管理用スプレッドシートのスナップショット
+    :type snapshot: Snapshot
+    :param sheet_index_vote: 投票シートのインデックス
+    :type sheet_index_vote: int
+    :return: (試合名, ジャッジの番号) と行番号の辞書
+    :rtype: Dict[Tuple[str, int], int]
+    """
+    rows = {}
+    for k, row in enumerate(snapshot.values(sheet_index_vote)):
+        if k == 0 or len(row) < 2 or not row[0]:
+            continue
+        try:
+            rows[(row[0], int(row[1]))] = k+1
+        except ValueError:
+            continue
+    return rows
+
+
+def fetch_results(document: Document, ballot_config: Dict[str, Any]) -> List[Any]:
+    """勝敗・ポイント記入シートから投票シートに反映するセルの値を取得する
+
+    :param document: 勝敗・ポイント記入シート
+    :type document: Document
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    :return: ``to_vote`` の順の値
+    :rtype: List[Any]
+    """
+    values = document.batch_get([link[0] for link in ballot_config['to_vote']])
+    return [value[0][0] if len(value) > 0 and len(value[0]) > 0 else '' for value in values]
+
+
+def collect_results(json_key_file: Path, file_id: str, sheet_index_matches: int, sheet_index_vote: int,
+                    judge_num: int, staff_num: int, ballot_config: Dict[str, Any], **kwargs):
+    """勝敗・ポイント記入シートの記入内容を投票シートに値として書き込む
+
+    対戦表のリンクから各シートのIDを求め、``to_vote`` のセルをシート毎に1回の batchGet でまとめて取得する。
+    投票シートの IMPORTRANGE は取得した値で置き換え、1回の batchUpdate で書き込む。
 
     :param credentials: Google の認証情報
     :type credentials: Credentials
@@ -744,112 +1001,351 @@ def update_ballot(json_key_file: Path, file_id: str, sheet_index_matches: int, s
     :type sheet_index_vote: int
     :param judge_num: ジャッジの人数
     :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
     :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
     :type ballot_config: Dict[str, Any]
     """
 
     offset = kwargs['offset'] if 'offset' in kwargs else 0
     limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    ballots = kwargs['ballots'] if 'ballots' in kwargs else None
 
-    gc = gspread.auth.service_account(json_key_file)
+    gc = open_client(json_key_file, workers)
 
-    book = gc.open_by_key(file_id)
-    sheet_matches = WorksheetEx.cast(book.get_worksheet(sheet_index_matches))
-    sheet_vote = WorksheetEx.cast(book.get_worksheet(sheet_index_vote))
+    snapshot = Snapshot.open(gc, file_id)
+    schedule = kwargs['schedule'] if 'schedule' in kwargs else Schedule(snapshot, sheet_index_matches, judge_num, staff_num)
+    sheet_vote = snapshot.worksheet(sheet_index_vote)
+    rows = vote_row_index(snapshot, sheet_index_vote)
 
-    values = sheet_matches.get_all_values(value_render_option='FORMULA')
-    values = values[2:]
+    template = Template.open(gc, ballot_config['template'])
 
-    pattern = r'=HYPERLINK\("https://docs\.google\.com/spreadsheets/d/(.*?)","(.*?)"\)'
+    targets = []
+    for match in schedule.select(offset, limit):
 
-    for i, value in enumerate(values):
+        for j, judge in enumerate(match.judges):
 
-        if i < offset:
-            continue
+            if judge.id and (ballots is None or judge.id in ballots):
+                targets.append((match.name, j, judge.id))
 
-        if i >= limit:
-            break
+    def collect(name: str, j: int, ballot_id: str) -> Union[List[Any], APIError]:
+        try:
+            return fetch_results(Document(gc, ballot_id, template.sheet_id, template.sheet_title), ballot_config)
+        except APIError as e:
+            return e
 
-        if not value[4] or not value[5]:
+    updates = []
+    for (name, j, ballot_id), results in zip(targets, run_jobs(collect, targets, workers)):
+
+        if isinstance(results, APIError):
+            print(f'{name} #{j}: {results}')
+            continue
+
+        row = rows.get((name, j))
+        if row is None:
+            print(f'{name} #{j}: vote row is not found')
             continue
 
-        match = re.match(pattern, value[4])
-        if match:
-            value[4] = match.group(2)
+        for link, result in zip(ballot_config['to_vote'], results):
+            updates.append({'range': gsutils.rowcol_to_a1(row, link[1]+1), 'values': [[result]]})
+
+        print(f"{ballot_config['title']} {name} #{j}")
+
+    if len(updates) > 0:
+        sheet_vote.batch_update(updates, value_input_option='USER_ENTERED')
+        metrics.rows_written(sheet_vote.title, [x['range'] for x in updates])
+        snapshot.invalidate(sheet_index_vote)
+
+    pass
+
+
+def watch_results(json_key_file: Path, file_id: str, sheet_index_matches: Union[int, List[int]], sheet_index_vote: int,
+                  judge_num: int, staff_num: int, ballot_config: Dict[str, Any], **kwargs):
+    """勝敗・ポイント記入シートの変更を監視し、変更のあったシートの記入内容を投票シートに書き込み続ける
+
+    ``interval`` 秒毎に保存先フォルダを前回以降の更新日時で絞り込んで一覧し、
+    更新されたシートだけを ``collect_results`` で取得する。Ctrl+C で終了する。
+
+    :param credentials: Google の認証情報
+    :type credentials: Credentials
+    :param file_id: 管理用スプレッドシートのID
+    :type file_id: str
+    :param sheet_index_matches: 対戦表シートのインデックス (複数日の場合はリスト)
+    :type sheet_index_matches: Union[int, List[int]]
+    :param sheet_index_vote: 投票シートのインデックス
+    :type sheet_index_vote: int
+    :param judge_num: ジャッジの人数
+    :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
+    :param ballot_config: 勝敗・ポイント記入シートの参照関係設定
+    :type ballot_config: Dict[str, Any]
+    """
+
+    interval = kwargs['interval'] if 'interval' in kwargs else WATCH_INTERVAL
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+
+    gc = open_client(json_key_file, workers)
+    sheet_indexes = sheet_index_matches if type(sheet_index_matches) == list else [sheet_index_matches]
+
+    since = None
+    seen = {}
 
-        match = re.match(pattern, value[5])
-        if match:
-            value[5] = match.group(2)
+    try:
+        while True:
+            files = list_files(gc, ballot_config['folder'], since)
+            changed = {f['id'] for f in files if seen.get(f['id']) != f['modifiedTime']}
 
-        for j in range(judge_num):
+            if len(changed) > 0:
+                for sheet_index in sheet_indexes:
+                    collect_results(json_key_file, file_id, sheet_index, sheet_index_vote, judge_num, staff_num,
+                                    ballot_config, ballots=changed, **kwargs)
+                for f in files:
+                    seen[f['id']] = f['modifiedTime']
+                since = max(f['modifiedTime'] for f in files)
 
-            if not value[6+j]:
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def plan(command: str, snapshot: Snapshot, sheet_index: int, cfg: Dict[str, Any], **kwargs) -> Plan:
+    """コマンドを実行した場合の API 呼び出し回数を、書き込みを行わずに見積もる
+
+    対戦表と設定ファイル、``--resume`` の場合はマニフェストを参照し、生成・更新の対象となる試合を数える。
+    スナップショットやテンプレートが再利用できる場合もあるため、読み込みの回数は上限の見積もりとなる。
+
+    :param command: コマンド名
+    :type command: str
+    :param snapshot: 管理用スプレッドシートのスナップショット
+    :type snapshot: Snapshot
+    :param sheet_index: 対戦表シートのインデックス
+    :type sheet_index: int
+    :param cfg: 設定ファイルの内容
+    :type cfg: Dict[str, Any]
+    :return: 見積もり
+    :rtype: Plan
+    """
+
+    offset = kwargs['offset'] if 'offset' in kwargs else 0
+    limit = kwargs['limit'] if 'limit' in kwargs else sys.maxsize
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+    chunk_rows = kwargs['chunk_rows'] if 'chunk_rows' in kwargs else WriteBack.CHUNK_ROWS
+
+    schedule = Schedule(snapshot, sheet_index, cfg['judge_num'], cfg['staff_num'])
+    manifest = Manifest(cfg['file_id'], schedule.sheet_id)
+    result = Plan(f'{command} [{snapshot.titles()[sheet_index]}]', workers, cfg['quota'] if 'quota' in cfg else None)
+
+    # スナップショットの版の確認とメタデータ・表示値・数式の取得
+    result.add(DRIVE)
+    result.add(SHEETS_READ, 3)
+
+    def finished(kind: str, match: Match, slot: int) -> bool:
+        entry = manifest.get(kind, match.name, slot) if resume else None
+        return entry is not None and entry['status'] == Manifest.FINISHED
+
+    def document(kind: str, match: Match, slot: int):
+        # テンプレートのコピーと書き込み
+        if finished(kind, match, slot):
+            return
+        result.item(match.index)
+        result.add(DRIVE, 1, match.index)
+        result.add(SHEETS_WRITE, 1, match.index)
+
+    matches = list(schedule.select(offset, limit))
+    write_backs = 1
+
+    if command == 'generate-room':
+        result.add(ZOOM)
+        for match in matches:
+            if match.has_room or finished('room', match, 0) or match.start is None or match.end is None:
+                continue
+            result.item(match.index)
+            result.add(ZOOM, 1, match.index)
+    elif command == 'clear-room':
+        for match in matches:
+            if match.meeting_id:
+                result.item(match.index)
+                result.add(ZOOM, 1, match.index)
+    elif command == 'generate-ballot':
+        result.add(SHEETS_READ, 2)
+        result.add(SHEETS_WRITE, 2)
+        write_backs = 2
+        for match in matches:
+            if match.has_teams:
+                for j, judge in enumerate(match.judges):
+                    if judge.text:
+                        document('ballot', match, j)
+    elif command in ('generate-member-list', 'generate-advice'):
+        result.add(SHEETS_READ)
+        kind = 'member_list' if command == 'generate-member-list' else 'advice'
+        for match in matches:
+            for j, team in enumerate(match.teams):
+                if team.text:
+                    document(kind, match, j)
+    elif command == 'generate-aggregate':
+        result.add(SHEETS_READ)
+        for match in matches:
+            if match.has_teams:
+                document('aggregate', match, 0)
+    elif command == 'update-live':
+        write_backs = 0
+        for match in matches:
+            if match.meeting_id and match.stream_url and match.stream_key and match.page_url:
+                result.item(match.index)
+                result.add(ZOOM, 1, match.index)
+    elif command == 'update-ballot':
+        result.add(SHEETS_READ, 2)
+        write_backs = 2
+        state = BallotState(cfg['file_id'])
+        header = get_header_cells(schedule, cfg['ballot']['to_ballot'])
+        for match in matches:
+            if not match.has_teams:
                 continue
+            for j, judge in enumerate(match.judges):
+                if not judge.text:
+                    continue
+                if not judge.id:
+                    document('ballot', match, j)
+                    continue
+                cells, options = ballot_contents(match, j, header, cfg['ballot'])
+                pushed = state.get(judge.id)
+                if pushed is None or pushed['cells'] != cells or pushed['options'] != options:
+                    result.item(match.index)
+                    result.add(SHEETS_WRITE, 1, match.index)
+    elif command in ('collect-results', 'watch-results'):
+        result.add(SHEETS_READ, 2)
+        result.add(SHEETS_WRITE)
+        write_backs = 0
+        if command == 'watch-results':
+            result.add(DRIVE)
+        for match in matches:
+            for judge in match.judges:
+                if judge.id:
+                    result.item(match.index)
+                    result.add(SHEETS_READ, 1, match.index)
+
+    # 生成結果は chunk_rows 件毎にまとめて書き込む
+    result.add(SHEETS_WRITE, write_backs * math.ceil(result.items / chunk_rows))
+    return result
+
+
+def resolve_sheets(snapshot: Snapshot, spec: Union[int, str, List[Union[int, str]]]) -> List[int]:
+    """設定ファイルの対戦表シートの指定をシートのインデックスのリストに変換する
+
+    インデックス (``0``)、インデックスの範囲 (``"0-2"``)、シート名 (ワイルドカード可. ``"対戦表*"``)、
+    またはそれらのリストを指定できる。
+
+    :param snapshot: 管理用スプレッドシートのスナップショット
+    :type snapshot: Snapshot
+    :param spec: 対戦表シートの指定
+    :type spec: Union[int, str, List[Union[int, str]]]
+    :raises ValueError: 該当するシートが無い場合に例外を送出
+    :return: シートのインデックスのリスト (指定順)
+    :rtype: List[int]
+    """
+    specs = spec if type(spec) == list else [spec]
+    titles = snapshot.titles()
+    indexes = []
+    for x in specs:
+        if type(x) == int:
+            found = [x]
+        elif re.fullmatch(r'\d+-\d+', x):
+            first, last = x.split('-')
+            found = list(range(int(first), int(last)+1))
+        else:
+            found = [k for k, title in enumerate(titles) if fnmatch(title, x)]
+        if len(found) == 0 or any(k < 0 or k >= len(titles) for k in found):
+            raise ValueError(f'Invalid matches sheet: {x}')
+        indexes += [k for k in found if k not in indexes]
+    return indexes
 
-            match = re.match(pattern, value[6+j])
-            if not match:
-
-                new_book = gc.copy(ballot_config['template'])
-                new_sheet = WorksheetEx.cast(new_book.get_worksheet(0))
-
-                new_book.batch_update({
-                    'requests': [
-                        {
-                            'updateSpreadsheetProperties': {
-                                'properties': {
-                                    'title': f"{ballot_config['title']} {value[0]} #{j}"
-                                },
-                                'fields': 'title'
-                            }
-                        }
-                    ]
-                })
-
-                gauth = get_gauth(json_key_file)
-
-                gdrive = GoogleDrive(gauth)
-                gfile = gdrive.CreateFile({'id': new_book.id})
-                gfile.FetchMetadata(fetch_all=True)
-
-                gfile['parents'] = [{'id': ballot_config['folder']}]
-                gfile.Upload()
-
-                row = 2 + j + judge_num * i
-                vote = [''] * 11
-                vote[0] = f"'{value[0]}"
-                vote[1] = j
-                vote[2] = value[6+j]
-                vote[4] = f'=IF({gsutils.rowcol_to_a1(row,10)}="肯定",1,0)'
-                vote[7] = f'=IF({gsutils.rowcol_to_a1(row,10)}="否定",1,0)'
-                for link in ballot_config['to_vote']:
-                    vote[link[1]] = f'=IMPORTRANGE("{new_book.id}","{new_sheet.title}!{link[0]}")'
-                    pass
-
-                start = gsutils.rowcol_to_a1(row, 1)
-                end = gsutils.rowcol_to_a1(row, 11)
-                sheet_vote.batch_update([
-                    {'range': f'{start}:{end}', 'values': [vote]}
-                ], value_input_option='USER_ENTERED')
-
-                for link in ballot_config['to_ballot']:
-                    if type(link[0]) == int:
-                        if len(link) >= 3 and link[2]:
-                            new_sheet.update_acell(link[1], value[link[0]+j])
-                        else:
-                            new_sheet.update_acell(link[1], value[link[0]])
-                    elif type(link[0]) == str:
-                        cell = sheet_matches.acell(link[0], value_render_option='FORMATTED_VALUE')
-                        new_sheet.update_acell(link[1], cell.value)
-                    elif type(link[0]) == list:
-                        options = [value[x] for x in link[0]]
-                        new_sheet.set_data_validation(link[1], WorksheetEx.conditiontype.ONE_OF_LIST, options, strict=True, custom_ui=True)
-                    time.sleep(INTERVAL)
-
-                sheet_matches.update_cell(3+i, 7+j, f'=HYPERLINK("{new_book.url}","{value[6+j]}")')
-
-                print(f"{ballot_config['title']} {value[0]} #{j}")
 
-    pass
+def run(json_key_file: Path, file_id: str, sheet_indexes: List[int], sheet_index_vote: int, judge_num: int, staff_num: int,
+        commands: Dict[str, Callable[..., None]], steps: Union[List[str], Dict[str, List[str]]], **kwargs):
+    """複数のコマンドを1つのプロセスで実行する
+
+    Google と Zoom のクライアント、スナップショット、読み込んだ対戦表を全てのステップで共有する。
+    生成したリンクは対戦表 (``Schedule``) にも反映されるため、後続のステップは対戦表を読み直さずに参照できる。
+    互いに依存しないステップは並行して実行する。
+
+    複数の対戦表シート (複数日の大会) を指定した場合は、シート毎に全てのステップを実行する。
+    依存関係は同じシートのステップの間だけで考え、投票シートの行と勝敗・ポイント記入シートの記録は全てのシートで共有する。
+    Zoom ミーティングの作成・削除は、アカウント全体の上限を守るためにシートの順に1つずつ実行する。
+
+    :param credentials: Google の認証情報
+    :type credentials: Credentials
+    :param file_id: 管理用スプレッドシートのID
+    :type file_id: str
+    :param sheet_indexes: 対戦表シートのインデックスのリスト
+    :type sheet_indexes: List[int]
+    :param sheet_index_vote: 投票シートのインデックス
+    :type sheet_index_vote: int
+    :param judge_num: ジャッジの人数
+    :type judge_num: int
+    :param staff_num: スタッフの人数
+    :type staff_num: int
+    :param commands: コマンド名と、対戦表シートのインデックスとキーワード引数を受け取ってコマンドを実行する関数
+    :type commands: Dict[str, Callable[..., None]]
+    :param steps: 実行するコマンド名のリスト (依存関係は RUN_DEPENDS と、RUN_CONFLICTS の組についてはリストの順), またはコマンド名と依存するコマンド名のリストの辞書
+    :type steps: Union[List[str], Dict[str, List[str]]]
+    :raises ValueError: 実行できないコマンドが指定された場合に例外を送出
+    """
+
+    offset = kwargs['offset'] if 'offset' in kwargs else 0
+    workers = kwargs['workers'] if 'workers' in kwargs else 1
+    resume = kwargs['resume'] if 'resume' in kwargs else False
+
+    if type(steps) == dict:
+        depends = {name: deps if deps is not None else [] for name, deps in steps.items()}
+    else:
+        # 同じ列や Zoom ミーティングを扱うコマンドは、RUN_DEPENDS に無くても指定した順に実行する
+        depends = {}
+        for k, name in enumerate(steps):
+            depends[name] = list(RUN_DEPENDS.get(name, [])) + [
+                x for x in steps[:k]
+                if name not in RUN_DEPENDS.get(x, []) and any({name, x} <= group for group in RUN_CONFLICTS)
+            ]
+    names = list(steps)
+
+    for name in names:
+        if name not in commands or name in ('run', 'watch-results'):
+            raise ValueError(f'Invalid step: {name}')
+
+    # 並行して実行するステップの分だけコネクションプールを確保しておく
+    gc = open_client(json_key_file, workers * len(names) * len(sheet_indexes))
+    snapshot = Snapshot.open(gc, file_id)
+    titles = snapshot.titles()
+
+    if 'generate-ballot' in names or 'update-ballot' in names:
+        kwargs['vote_rows'] = VoteRows(snapshot, sheet_index_vote, 'generate-ballot' in names and offset <= 0)
+        kwargs['ballot_state'] = BallotState(file_id)
+        if 'generate-ballot' in names and offset <= 0 and not resume:
+            kwargs['ballot_state'].clear()
+
+    def step_name(name: str, sheet_index: int) -> str:
+        return name if len(sheet_indexes) == 1 else f'{name} [{titles[sheet_index]}]'
+
+    def step(name: str, sheet_index: int, schedule: Schedule) -> Callable[[], None]:
+        return lambda: commands[name](sheet_index, schedule=schedule, **kwargs)
+
+    tasks = {}
+    task_depends = {}
+    for k, sheet_index in enumerate(sheet_indexes):
+        schedule = Schedule(snapshot, sheet_index, judge_num, staff_num)
+        for name in names:
+            tasks[step_name(name, sheet_index)] = step(name, sheet_index, schedule)
+            task_depends[step_name(name, sheet_index)] = [step_name(x, sheet_index) for x in depends.get(name, [])]
+            if name in ('generate-room', 'clear-room') and k > 0:
+                task_depends[step_name(name, sheet_index)].append(step_name(name, sheet_indexes[k-1]))
+
+    try:
+        run_steps(tasks, task_depends)
+    finally:
+        if 'ballot_state' in kwargs:
+            kwargs['ballot_state'].save()
 
 
 def main():
@@ -860,6 +1356,7 @@ def main():
     parser.add_argument('-k', '--key', type=str, default='zoom-key.yaml', help='Zoom Config file')
     parser.add_argument('-s', '--settings', type=str, default='zoom-setting.yaml', help='Zoom Config file')
     parser.add_argument('command', type=str, choices=[
+        'run',
         'generate-room',
         'clear-room',
         'generate-ballot',
@@ -868,9 +1365,20 @@ def main():
         'generate-advice',
         'update-live',
         'update-ballot',
+        'collect-results',
+        'watch-results',
     ], help='Command')
     parser.add_argument('-o', '--offset', type=int, default=0)
     parser.add_argument('-l', '--limit', type=int, default=sys.maxsize)
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of documents or meetings generated concurrently')
+    parser.add_argument('-r', '--resume', action='store_true', help='Reuse meetings and documents recorded in the manifest')
+    parser.add_argument('--chunk-rows', type=int, default=WriteBack.CHUNK_ROWS, help='Number of results written back to the sheet at once')
+    parser.add_argument('--chunk-seconds', type=float, default=WriteBack.CHUNK_SECONDS, help='Maximum seconds between write-backs to the sheet')
+    parser.add_argument('-i', '--interval', type=float, default=WATCH_INTERVAL, help='Polling interval in seconds for watch-results')
+    parser.add_argument('--steps', type=str, default=None, help='Comma separated commands executed by run')
+    parser.add_argument('--plan', action='store_true', help='Report the expected API calls and time without writing anything')
+    parser.add_argument('--metrics', type=str, default=None, help='Write a JSON-lines trace of API calls and print a summary')
+    parser.add_argument('--metrics-prom', type=str, default=None, help='Write the summary in Prometheus textfile format')
     args = parser.parse_args()
 
     scope = [
@@ -884,24 +1392,65 @@ def main():
         settings = yaml.load(ifp3, Loader=yaml.SafeLoader)
         json_key_file = Path(cfg['auth']['key_file'])
 
-        if args.command == 'generate-room':
-            generate_room(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['prefix'], cfg['judge_num'], cfg['staff_num'], key, settings, offset=args.offset, limit=args.limit)
-        elif args.command == 'clear-room':
-            clear_room(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['judge_num'], cfg['staff_num'], key, offset=args.offset, limit=args.limit)
-        elif args.command == 'generate-ballot':
-            generate_ballot(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['sheets']['vote'], cfg['judge_num'], cfg['ballot'], offset=args.offset, limit=args.limit)
-        elif args.command == 'generate-member-list':
-            generate_member_list(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['member_list'], offset=args.offset, limit=args.limit)
-        elif args.command == 'generate-aggregate':
-            generate_aggregate(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['judge_num'], cfg['staff_num'], cfg['aggregate'], offset=args.offset, limit=args.limit)
-        elif args.command == 'generate-advice':
-            generate_advice(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['judge_num'], cfg['staff_num'], cfg['advice'], offset=args.offset, limit=args.limit)
-        elif args.command == 'update-live':
-            update_live(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['judge_num'], cfg['staff_num'], key, offset=args.offset, limit=args.limit)
-        elif args.command == 'update-ballot':
-            update_ballot(json_key_file, cfg['file_id'], cfg['sheets']['matches'], cfg['sheets']['vote'], cfg['judge_num'], cfg['ballot'], offset=args.offset, limit=args.limit)
-
-        print('Complete.')
+        commands = {
+            'generate-room': lambda sheet_index, **kwargs: generate_room(json_key_file, cfg['file_id'], sheet_index, cfg['prefix'], cfg['judge_num'], cfg['staff_num'], key, settings, **kwargs),
+            'clear-room': lambda sheet_index, **kwargs: clear_room(json_key_file, cfg['file_id'], sheet_index, cfg['judge_num'], cfg['staff_num'], key, **kwargs),
+            'generate-ballot': lambda sheet_index, **kwargs: generate_ballot(json_key_file, cfg['file_id'], sheet_index, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], cfg['ballot'], **kwargs),
+            'generate-member-list': lambda sheet_index, **kwargs: generate_member_list(json_key_file, cfg['file_id'], sheet_index, cfg['judge_num'], cfg['staff_num'], cfg['member_list'], **kwargs),
+            'generate-aggregate': lambda sheet_index, **kwargs: generate_aggregate(json_key_file, cfg['file_id'], sheet_index, cfg['judge_num'], cfg['staff_num'], cfg['aggregate'], **kwargs),
+            'generate-advice': lambda sheet_index, **kwargs: generate_advice(json_key_file, cfg['file_id'], sheet_index, cfg['judge_num'], cfg['staff_num'], cfg['advice'], **kwargs),
+            'update-live': lambda sheet_index, **kwargs: update_live(json_key_file, cfg['file_id'], sheet_index, cfg['judge_num'], cfg['staff_num'], key, **kwargs),
+            'update-ballot': lambda sheet_index, **kwargs: update_ballot(json_key_file, cfg['file_id'], sheet_index, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], cfg['ballot'], **kwargs),
+            'collect-results': lambda sheet_index, **kwargs: collect_results(json_key_file, cfg['file_id'], sheet_index, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], cfg['ballot'], **kwargs),
+            'watch-results': lambda sheet_index, **kwargs: watch_results(json_key_file, cfg['file_id'], sheet_index, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], cfg['ballot'], **kwargs),
+        }
+        options = {
+            'offset': args.offset,
+            'limit': args.limit,
+            'workers': args.workers,
+            'resume': args.resume,
+            'chunk_rows': args.chunk_rows,
+            'chunk_seconds': args.chunk_seconds,
+            'interval': args.interval,
+        }
+
+        if args.metrics is not None or args.metrics_prom is not None:
+            metrics.enable(Path(args.metrics) if args.metrics is not None else None)
+
+        try:
+            snapshot = Snapshot.open(open_client(json_key_file), cfg['file_id'])
+            sheet_indexes = resolve_sheets(snapshot, cfg['sheets']['matches'])
+
+            if args.command == 'run':
+                if args.steps is not None:
+                    steps = args.steps.split(',')
+                else:
+                    steps = cfg['run'] if 'run' in cfg else RUN_STEPS
+            else:
+                steps = [args.command]
+
+            if args.plan:
+                for name in steps:
+                    for sheet_index in sheet_indexes:
+                        print(plan(name, snapshot, sheet_index, cfg, **options).report())
+                return
+
+            if args.command == 'run':
+                run(json_key_file, cfg['file_id'], sheet_indexes, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], commands, steps, **options)
+            elif args.command == 'watch-results':
+                commands[args.command](sheet_indexes, **options)
+            elif len(sheet_indexes) > 1:
+                run(json_key_file, cfg['file_id'], sheet_indexes, cfg['sheets']['vote'], cfg['judge_num'], cfg['staff_num'], commands, [args.command], **options)
+            else:
+                commands[args.command](sheet_indexes[0], **options)
+
+            print('Complete.')
+        finally:
+            if metrics.enabled:
+                metrics.close()
+                print(metrics.summary())
+                if args.metrics_prom is not None:
+                    metrics.write_prometheus(Path(args.metrics_prom))
 
 
 if __name__ == "__main__":
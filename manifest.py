@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Union
+
+
+class Manifest:
+    """生成した成果物 (Zoom ミーティング・各種シート) の記録
+
+    対戦表シート・成果物の種類・試合・枠 (ジャッジの番号や肯定/否定) を組にして、作成した成果物のIDを SQLite に保存する。
+    対戦表シートはシートID で区別するため、日毎のシートに同じ試合名があっても、シートの並べ替えや名前の変更があっても記録は混ざらない。
+    作成直後に ``created``、書き込みまで完了した時点で ``finished`` として記録し、
+    ``--resume`` を指定した再実行では記録済みの成果物を作り直さずに再利用する。
+    """
+
+    CACHE_DIR = Path('.cache')
+    CREATED = 'created'
+    FINISHED = 'finished'
+
+    def __init__(self, file_id: str, sheet_id: int, cache_dir: Path = CACHE_DIR):
+        """
+        :param file_id: 管理用スプレッドシートのID
+        :type file_id: str
+        :param sheet_id: 対戦表シートのシートID
+        :type sheet_id: int
+        :param cache_dir: 保存先のディレクトリ, defaults to CACHE_DIR
+        :type cache_dir: Path, optional
+        """
+        self.path = Path(cache_dir) / f'manifest-{file_id}.sqlite3'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sheet_id = sheet_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS artifacts (
+                sheet INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                match TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                remote_id TEXT NOT NULL,
+                url TEXT,
+                status TEXT NOT NULL,
+                payload TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (sheet, kind, match, slot)
+            )
+        ''')
+
+    def get(self, kind: str, match: str, slot: int = 0) -> Union[Dict[str, Any], None]:
+        """成果物の記録を取得する
+
+        :param kind: 成果物の種類 (``room``, ``ballot``, ``member_list``, ``aggregate``, ``advice``)
+        :type kind: str
+        :param match: 試合名
+        :type match: str
+        :param slot: 枠の番号, defaults to 0
+        :type slot: int, optional
+        :return: ``remote_id``, ``url``, ``status``, ``payload`` を持つ辞書. 記録が無い場合は None
+        :rtype: Union[Dict[str, Any], None]
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT remote_id, url, status, payload FROM artifacts WHERE sheet = ? AND kind = ? AND match = ? AND slot = ?',
+                (self.sheet_id, kind, match, slot)).fetchone()
+        if row is None:
+            return None
+        return {
+            'remote_id': row[0],
+            'url': row[1],
+            'status': row[2],
+            'payload': json.loads(row[3]) if row[3] is not None else None,
+        }
+
+    def created(self, kind: str, match: str, slot: int, remote_id: str, url: Union[str, None] = None):
+        """成果物を作成した (書き込みは未完了) ことを記録する
+
+        :param kind: 成果物の種類
+        :type kind: str
+        :param match: 試合名
+        :type match: str
+        :param slot: 枠の番号
+        :type slot: int
+        :param remote_id: 作成した成果物のID
+        :type remote_id: str
+        :param url: 作成した成果物のURL, defaults to None
+        :type url: Union[str, None], optional
+        """
+        self._upsert(kind, match, slot, remote_id, url, Manifest.CREATED, None)
+
+    def finished(self, kind: str, match: str, slot: int, remote_id: str,
+                 url: Union[str, None] = None, payload: Union[Dict[str, Any], None] = None):
+        """成果物の作成と書き込みが完了したことを記録する
+
+        :param kind: 成果物の種類
+        :type kind: str
+        :param match: 試合名
+        :type match: str
+        :param slot: 枠の番号
+        :type slot: int
+        :param remote_id: 作成した成果物のID
+        :type remote_id: str
+        :param url: 作成した成果物のURL, defaults to None
+        :type url: Union[str, None], optional
+        :param payload: 再利用時に必要な情報, defaults to None
+        :type payload: Union[Dict[str, Any], None], optional
+        """
+        self._upsert(kind, match, slot, remote_id, url, Manifest.FINISHED, payload)
+
+    def remove(self, kind: str, match: str, slot: int = 0):
+        """成果物の記録を削除する
+
+        :param kind: 成果物の種類
+        :type kind: str
+        :param match: 試合名
+        :type match: str
+        :param slot: 枠の番号, defaults to 0
+        :type slot: int, optional
+        """
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM artifacts WHERE sheet = ? AND kind = ? AND match = ? AND slot = ?',
+                (self.sheet_id, kind, match, slot))
+
+    def _upsert(self, kind: str, match: str, slot: int, remote_id: str, url: Union[str, None],
+                status: str, payload: Union[Dict[str, Any], None]):
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO artifacts (sheet, kind, match, slot, remote_id, url, status, payload, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sheet, kind, match, slot) DO UPDATE SET
+                    remote_id = excluded.remote_id,
+                    url = excluded.url,
+                    status = excluded.status,
+                    payload = excluded.payload,
+                    updated_at = excluded.updated_at
+            ''', (self.sheet_id, kind, match, slot, remote_id, url, status,
+                  json.dumps(payload, ensure_ascii=False) if payload is not None else None, time.time()))
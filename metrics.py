@@ -0,0 +1,305 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Union
+from urllib.parse import urlsplit, unquote
+
+import requests
+
+
+ID_PARENTS = {'spreadsheets', 'files', 'meetings', 'users'}
+RANGE_SUFFIXES = (':append', ':clear')
+
+
+def endpoint_of(url: str) -> str:
+    """URL から ID や範囲を取り除き、エンドポイント毎に集計できる形にする
+
+    :param url: 呼び出した URL
+    :type url: str
+    :return: ``sheets.googleapis.com/v4/spreadsheets/{id}/values:batchUpdate`` のようなエンドポイント
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    for k in range(1, len(segments)):
+        parent = segments[k-1]
+        if parent in ID_PARENTS and segments[k] and segments[k] != 'me':
+            suffix = segments[k][segments[k].index(':'):] if ':' in segments[k] else ''
+            segments[k] = '{id}' + suffix
+        elif parent == 'values':
+            segment = unquote(segments[k])
+            suffix = next((x for x in RANGE_SUFFIXES if segment.endswith(x)), '')
+            segments[k] = '{range}' + suffix
+    return parts.netloc + '/'.join(segments)
+
+
+def api_of(url: str) -> str:
+    """URL から API の種類を求める
+
+    :param url: 呼び出した URL
+    :type url: str
+    :return: ``sheets``, ``drive``, ``google-oauth``, ``zoom``, ``zoom-oauth`` 等
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    if parts.netloc == 'sheets.googleapis.com':
+        return 'sheets'
+    if parts.path.startswith('/drive/') or parts.path.startswith('/upload/drive/'):
+        return 'drive'
+    if parts.netloc == 'oauth2.googleapis.com':
+        return 'google-oauth'
+    if parts.netloc == 'api.zoom.us':
+        return 'zoom'
+    if parts.netloc == 'zoom.us':
+        return 'zoom-oauth'
+    return parts.netloc
+
+
+def percentile(values: List[float], q: float) -> float:
+    """パーセンタイル (最近傍法)
+
+    :param values: 値のリスト (昇順)
+    :type values: List[float]
+    :param q: 0～1
+    :type q: float
+    :return: パーセンタイル値
+    :rtype: float
+    """
+    if len(values) == 0:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class Metrics:
+    """API 呼び出しの計測
+
+    ``instrument`` した HTTP セッションの送信毎に、API・メソッド・エンドポイント・所要時間・送受信バイト数・
+    再試行・ステータスを記録する。``enable`` するまでは何も記録しない。
+    記録は JSON Lines 形式で逐次ファイルに書き出し、終了時にエンドポイント毎の集計を出力する。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records: List[Dict[str, Any]] = []
+        self.sleep_seconds = 0.0
+        self.sleep_count = 0
+        self.rows = set()
+        self.started = time.monotonic()
+        self._trace = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, trace_path: Union[Path, None] = None):
+        """計測を開始する
+
+        :param trace_path: 呼び出し毎の記録 (JSON Lines) の出力先. None の場合は出力しない, defaults to None
+        :type trace_path: Union[Path, None], optional
+        """
+        with self._lock:
+            self.enabled = True
+            self.started = time.monotonic()
+            if trace_path is not None:
+                self._trace = open(trace_path, 'w', encoding='utf-8')
+
+    def close(self):
+        """記録の出力先を閉じる"""
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def instrument(self, session: requests.Session):
+        """HTTP セッションの送信を計測する
+
+        ``Session.send`` を置き換えるため、認証の再試行やリダイレクトも1回の送信として記録する。
+
+        :param session: HTTP セッション
+        :type session: requests.Session
+        """
+        send = session.send
+
+        def instrumented(request: requests.PreparedRequest, **kwargs) -> requests.Response:
+            if not self.enabled:
+                return send(request, **kwargs)
+            start = time.monotonic()
+            try:
+                response = send(request, **kwargs)
+            except requests.RequestException as e:
+                self.record(request, None, time.monotonic() - start, type(e).__name__)
+                raise
+            self.record(request, response, time.monotonic() - start, None, kwargs.get('stream', False))
+            return response
+
+        session.send = instrumented
+
+    def record(self, request: requests.PreparedRequest, response: Union[requests.Response, None],
+               latency: float, error: Union[str, None], stream: bool = False):
+        """1回の送信を記録する
+
+        同じスレッドで直前に 429/5xx となったものと同じ呼び出しは、再試行として数える。
+
+        :param request: 送信したリクエスト
+        :type request: requests.PreparedRequest
+        :param response: 受信したレスポンス. 通信に失敗した場合は None
+        :type response: Union[requests.Response, None]
+        :param latency: 所要時間 (秒)
+        :type latency: float
+        :param error: 通信に失敗した場合の例外名
+        :type error: Union[str, None]
+        :param stream: レスポンスを逐次読み込むか (読み込み前のため受信バイト数は Content-Length とする), defaults to False
+        :type stream: bool, optional
+        """
+        status = response.status_code if response is not None else None
+        key = (request.method, request.url)
+        last = getattr(self._local, 'last', None)
+        retry = last[1] + 1 if last is not None and last[0] == key else 0
+        self._local.last = (key, retry) if status is None or status == 429 or status >= 500 else None
+
+        body = request.body if request.body is not None else b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        length = None
+        if response is not None:
+            length = response.headers.get('Content-Length') if stream else len(response.content)
+        entry = {
+            'time': time.time(),
+            'api': api_of(request.url),
+            'method': request.method,
+            'endpoint': endpoint_of(request.url),
+            'latency': round(latency, 6),
+            'request_bytes': len(body),
+            'response_bytes': int(length) if length is not None else None,
+            'retry': retry,
+            'status': status,
+            'error': error,
+        }
+        with self._lock:
+            self.records.append(entry)
+            if self._trace is not None:
+                self._trace.write(json.dumps(entry) + '\n')
+                self._trace.flush()
+
+    def sleep(self, seconds: float):
+        """待機し、待機した時間を記録する
+
+        :param seconds: 待機する秒数
+        :type seconds: float
+        """
+        time.sleep(seconds)
+        if self.enabled:
+            with self._lock:
+                self.sleep_seconds += seconds
+                self.sleep_count += 1
+
+    def rows_written(self, title: str, ranges: List[str]):
+        """シートに書き込んだ行を記録する (呼び出し回数/行の計算に使う)
+
+        :param title: シート名
+        :type title: str
+        :param ranges: 書き込んだ範囲 (A1形式)
+        :type ranges: List[str]
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for range_name in ranges:
+                rows = [int(x) for x in re.findall(r'[A-Z]+(\d+)', range_name.split('!')[-1])]
+                if len(rows) > 0:
+                    for row in range(rows[0], rows[-1]+1):
+                        self.rows.add((title, row))
+
+    def endpoints(self) -> Dict[str, Dict[str, Any]]:
+        """エンドポイント毎の集計
+
+        :return: ``METHOD endpoint`` と、``api``, ``calls``, ``errors``, ``retries``, ``p50``, ``p95``, ``total`` を持つ辞書
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        with self._lock:
+            records = list(self.records)
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in records:
+            groups.setdefault(f"{entry['method']} {entry['endpoint']}", []).append(entry)
+        result = {}
+        for name, entries in sorted(groups.items()):
+            latencies = sorted(entry['latency'] for entry in entries)
+            result[name] = {
+                'api': entries[0]['api'],
+                'calls': len(entries),
+                'errors': len([x for x in entries if x['status'] is None or x['status'] >= 400]),
+                'retries': len([x for x in entries if x['retry'] > 0]),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'total': sum(latencies),
+            }
+        return result
+
+    def summary(self) -> str:
+        """集計結果を表示用の文字列にする
+
+        :return: 集計結果
+        :rtype: str
+        """
+        endpoints = self.endpoints()
+        calls = sum(x['calls'] for x in endpoints.values())
+        lines = [f"{'endpoint':<72}{'calls':>7}{'err':>5}{'retry':>6}{'p50':>9}{'p95':>9}{'total':>10}"]
+        for name, x in endpoints.items():
+            lines.append(f"{name:<72}{x['calls']:>7}{x['errors']:>5}{x['retries']:>6}"
+                         f"{x['p50']:>9.3f}{x['p95']:>9.3f}{x['total']:>10.1f}")
+        elapsed = time.monotonic() - self.started
+        lines.append(f'wall time: {elapsed:.1f}s')
+        lines.append(f'calls: {calls}, rows written: {len(self.rows)}, calls per row: '
+                     + (f'{calls / len(self.rows):.2f}' if len(self.rows) > 0 else '-'))
+        lines.append(f'time in backoff: {self.sleep_seconds:.1f}s ({self.sleep_count} times)')
+        return '\n'.join(lines)
+
+    def write_prometheus(self, path: Path):
+        """集計結果を Prometheus の textfile 形式で書き出す
+
+        :param path: 出力先 (node_exporter の textfile collector が読み込むディレクトリ内のファイル)
+        :type path: Path
+        """
+        def labels(name: str, x: Dict[str, Any], **extra: str) -> str:
+            method, endpoint = name.split(' ', 1)
+            values = dict(api=x['api'], method=method, endpoint=endpoint, **extra)
+            return ','.join(f'{k}="{v}"' for k, v in values.items())
+
+        endpoints = self.endpoints()
+        lines = [
+            '# HELP online_debate_api_calls_total API calls by endpoint.',
+            '# TYPE online_debate_api_calls_total counter',
+        ]
+        lines += [f"online_debate_api_calls_total{{{labels(name, x)}}} {x['calls']}" for name, x in endpoints.items()]
+        lines += [
+            '# HELP online_debate_api_errors_total Failed API calls by endpoint.',
+            '# TYPE online_debate_api_errors_total counter',
+        ]
+        lines += [f"online_debate_api_errors_total{{{labels(name, x)}}} {x['errors']}" for name, x in endpoints.items()]
+        lines += [
+            '# HELP online_debate_api_latency_seconds API latency by endpoint.',
+            '# TYPE online_debate_api_latency_seconds summary',
+        ]
+        for name, x in endpoints.items():
+            lines.append(f"online_debate_api_latency_seconds{{{labels(name, x, quantile='0.5')}}} {x['p50']}")
+            lines.append(f"online_debate_api_latency_seconds{{{labels(name, x, quantile='0.95')}}} {x['p95']}")
+            lines.append(f"online_debate_api_latency_seconds_sum{{{labels(name, x)}}} {x['total']}")
+            lines.append(f"online_debate_api_latency_seconds_count{{{labels(name, x)}}} {x['calls']}")
+        lines += [
+            '# HELP online_debate_sleep_seconds_total Time spent backing off after rate limiting.',
+            '# TYPE online_debate_sleep_seconds_total counter',
+            f'online_debate_sleep_seconds_total {self.sleep_seconds}',
+            '# HELP online_debate_rows_written_total Sheet rows written back.',
+            '# TYPE online_debate_rows_written_total counter',
+            f'online_debate_rows_written_total {len(self.rows)}',
+        ]
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as ofp:
+            ofp.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
+
+
+metrics = Metrics()
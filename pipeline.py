@@ -0,0 +1,175 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, Tuple, List, Dict, Any, Union
+
+from gspread import Worksheet
+
+from metrics import metrics
+
+
+def run_jobs(job: Callable[..., Any], items: Iterable[Tuple[Any, ...]], workers: int = 1) -> Iterator[Any]:
+    """ジョブを並行実行し、結果を入力順に返す
+
+    ``workers`` が1以下の場合は逐次実行する。
+    2以上の場合はスレッドプールで実行し、完了順に関わらず入力順に結果を返す。
+
+    :param job: 1件分の処理を行う関数
+    :type job: Callable[..., Any]
+    :param items: ``job`` に渡す引数のタプルのリスト
+    :type items: Iterable[Tuple[Any, ...]]
+    :param workers: 並行数, defaults to 1
+    :type workers: int, optional
+    :return: 入力順の結果
+    :rtype: Iterator[Any]
+    """
+    if workers <= 1:
+        for item in items:
+            yield job(*item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(lambda item: job(*item), items)
+
+
+def run_steps(steps: Dict[str, Callable[[], Any]], depends: Dict[str, List[str]]) -> List[str]:
+    """依存関係に従ってステップを実行する
+
+    依存するステップが全て完了したステップから順に開始し、互いに依存しないステップは並行して実行する。
+    失敗したステップに依存するステップは実行しない。
+
+    :param steps: ステップ名と、そのステップを実行する関数
+    :type steps: Dict[str, Callable[[], Any]]
+    :param depends: ステップ名と、先に完了している必要のあるステップ名のリスト (``steps`` に無いものは無視する)
+    :type depends: Dict[str, List[str]]
+    :raises RuntimeError: 失敗したステップがある場合に例外を送出
+    :return: 完了したステップ名 (完了順)
+    :rtype: List[str]
+    """
+    waiting = {name: {x for x in depends.get(name, []) if x in steps and x != name} for name in steps}
+    done: List[str] = []
+    failed: Dict[str, BaseException] = {}
+    skipped: List[str] = []
+
+    with ThreadPoolExecutor(max_workers=max(len(steps), 1)) as executor:
+        running = {}
+        while len(waiting) > 0 or len(running) > 0:
+            for name in [name for name, x in waiting.items() if x & (set(failed) | set(skipped))]:
+                del waiting[name]
+                skipped.append(name)
+                print(f'{name}: skipped')
+            for name in [name for name, x in waiting.items() if x <= set(done)]:
+                del waiting[name]
+                running[executor.submit(steps[name])] = name
+            if len(running) == 0:
+                if len(waiting) > 0:
+                    raise RuntimeError(f"Circular dependency: {', '.join(waiting)}")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is None:
+                    done.append(name)
+                else:
+                    failed[name] = future.exception()
+                    print(f'{name}: {future.exception()}')
+
+    if len(failed) > 0:
+        raise RuntimeError(f"Failed steps: {', '.join(failed)}")
+    return done
+
+
+class WriteBack:
+    """生成結果をシートに逐次書き込む
+
+    書き込む範囲と値を溜めておき、``chunk_rows`` 件溜まるか、前回の書き込みから ``chunk_seconds`` 秒経過した時点で
+    1回の ``values.batchUpdate`` で書き込む。経過時間による書き込みは ``with`` 文の中でバックグラウンドのスレッドが行うため、
+    時間のかかる処理の途中でも進捗がシートに反映される。書き込みに失敗した値は捨てずに残し、次の書き込みで再送する。
+    ``with`` 文を抜ける際には、例外の有無に関わらず残りを書き込む。例外で抜ける場合は元の例外を優先し、
+    書き込みの失敗はその例外の注記に加える。
+    """
+
+    CHUNK_ROWS = 20
+    CHUNK_SECONDS = 10.0
+
+    def __init__(self, worksheet: Worksheet, chunk_rows: int = CHUNK_ROWS, chunk_seconds: float = CHUNK_SECONDS,
+                 on_flush: Union[Callable[[], None], None] = None):
+        """
+        :param worksheet: 書き込み先のシート
+        :type worksheet: Worksheet
+        :param chunk_rows: 1回に書き込む件数, defaults to CHUNK_ROWS
+        :type chunk_rows: int, optional
+        :param chunk_seconds: 書き込みの間隔 (秒), defaults to CHUNK_SECONDS
+        :type chunk_seconds: float, optional
+        :param on_flush: 書き込み後に呼び出す関数, defaults to None
+        :type on_flush: Union[Callable[[], None], None], optional
+        """
+        self.worksheet = worksheet
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.on_flush = on_flush
+        self.pending: List[Dict[str, Any]] = []
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer: Union[threading.Thread, None] = None
+
+    def __enter__(self) -> 'WriteBack':
+        if 0 < self.chunk_seconds < float('inf'):
+            self._stopped.clear()
+            self._timer = threading.Thread(target=self._run, name='WriteBack', daemon=True)
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._timer is not None:
+            self._stopped.set()
+            self._timer.join()
+            self._timer = None
+
+        if exc_type is None:
+            self.flush()
+            return
+
+        try:
+            self.flush()
+        except Exception as e:
+            exc_value.add_note(f'{len(self.pending)} pending ranges of {self.worksheet.title} were not written: {e!r}')
+
+    def _run(self):
+        while not self._stopped.wait(max(0.0, self.last_flush + self.chunk_seconds - time.monotonic())):
+            try:
+                self.flush()
+            except Exception:
+                # 値は残っているので、次の書き込み (または with 文の終了時) に再送する
+                pass
+
+    def put(self, range_name: str, values: List[List[Any]]):
+        """書き込む範囲と値を追加する
+
+        :param range_name: 書き込む範囲 (A1形式)
+        :type range_name: str
+        :param values: 書き込む値
+        :type values: List[List[Any]]
+        """
+        with self._lock:
+            self.pending.append({'range': range_name, 'values': values})
+            due = len(self.pending) >= self.chunk_rows or time.monotonic() - self.last_flush >= self.chunk_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """溜まっている値を書き込む"""
+        with self._lock:
+            pending, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+            if len(pending) == 0:
+                return
+            try:
+                self.worksheet.batch_update(pending, value_input_option='USER_ENTERED')
+            except Exception:
+                self.pending = pending + self.pending
+                raise
+            metrics.rows_written(self.worksheet.title, [x['range'] for x in pending])
+        if self.on_flush is not None:
+            self.on_flush()
@@ -0,0 +1,141 @@
+import math
+from typing import List, Dict, Tuple, Union
+
+
+SHEETS_READ = 'sheets-read'
+SHEETS_WRITE = 'sheets-write'
+DRIVE = 'drive'
+ZOOM = 'zoom'
+
+
+class Plan:
+    """コマンドを実行した場合の API 呼び出し回数の見積もり
+
+    API 呼び出しを、試合毎の呼び出しと、試合に関わらず必要な呼び出し (シートの読み込み・書き込み等) に分けて数え、
+    1分あたりの上限 (クォータ) と並行数から所要時間を見積もる。
+    また、1回の実行がクォータの1分間分に収まるような ``--offset``/``--limit`` の区切りを求める。
+    """
+
+    # 1分あたりの上限 (Sheets API はユーザー毎の上限、Zoom は MeetingScheduler.RATE)
+    QUOTAS = {
+        SHEETS_READ: 60,
+        SHEETS_WRITE: 60,
+        DRIVE: 12000,
+        ZOOM: 600,
+    }
+    # 1回の呼び出しにかかる時間 (秒) の目安
+    LATENCY = {
+        SHEETS_READ: 0.5,
+        SHEETS_WRITE: 1.0,
+        DRIVE: 2.0,
+        ZOOM: 0.5,
+    }
+
+    def __init__(self, title: str, workers: int = 1, quotas: Union[Dict[str, int], None] = None):
+        """
+        :param title: 見積もりの見出し (コマンド名等)
+        :type title: str
+        :param workers: 並行数, defaults to 1
+        :type workers: int, optional
+        :param quotas: 1分あたりの上限の変更, defaults to None
+        :type quotas: Union[Dict[str, int], None], optional
+        """
+        self.title = title
+        self.workers = max(workers, 1)
+        self.quotas = dict(Plan.QUOTAS, **(quotas if quotas is not None else {}))
+        self.fixed: Dict[str, int] = {}
+        self.matches: Dict[int, Dict[str, int]] = {}
+        self.items = 0
+
+    def add(self, bucket: str, count: int = 1, index: Union[int, None] = None):
+        """API 呼び出しを加える
+
+        :param bucket: クォータの種類 (``sheets-read``, ``sheets-write``, ``drive``, ``zoom``)
+        :type bucket: str
+        :param count: 呼び出し回数, defaults to 1
+        :type count: int, optional
+        :param index: 試合のインデックス. 試合に関わらない呼び出しの場合は None, defaults to None
+        :type index: Union[int, None], optional
+        """
+        calls = self.fixed if index is None else self.matches.setdefault(index, {})
+        calls[bucket] = calls.get(bucket, 0) + count
+
+    def item(self, index: int):
+        """生成・更新する成果物を1つ加える
+
+        :param index: 試合のインデックス
+        :type index: int
+        """
+        self.matches.setdefault(index, {})
+        self.items += 1
+
+    def totals(self) -> Dict[str, int]:
+        """クォータの種類毎の呼び出し回数の合計
+
+        :return: クォータの種類と呼び出し回数
+        :rtype: Dict[str, int]
+        """
+        totals = dict(self.fixed)
+        for calls in self.matches.values():
+            for bucket, count in calls.items():
+                totals[bucket] = totals.get(bucket, 0) + count
+        return totals
+
+    def duration(self) -> float:
+        """所要時間 (秒) の見積もり
+
+        クォータで決まる時間と、呼び出しにかかる時間を並行数で割った時間の長い方とする。
+
+        :return: 所要時間 (秒)
+        :rtype: float
+        """
+        totals = self.totals()
+        by_quota = max([count / self.quotas[bucket] * 60 for bucket, count in totals.items()], default=0)
+        by_latency = sum(count * Plan.LATENCY[bucket] for bucket, count in totals.items()) / self.workers
+        return max(by_quota, by_latency)
+
+    def chunks(self) -> List[Tuple[int, int]]:
+        """1回の実行がクォータの1分間分に収まるように試合を区切る
+
+        :return: (``--offset``, ``--limit``) のリスト
+        :rtype: List[Tuple[int, int]]
+        """
+        chunks = []
+        used: Dict[str, int] = dict(self.fixed)
+        first = None
+        last = None
+        for index in sorted(self.matches):
+            calls = self.matches[index]
+            fits = all(used.get(bucket, 0) + count <= self.quotas[bucket] for bucket, count in calls.items())
+            if not fits and first is not None:
+                chunks.append((first, last + 1))
+                used = dict(self.fixed)
+                first = None
+            if first is None:
+                first = index
+            for bucket, count in calls.items():
+                used[bucket] = used.get(bucket, 0) + count
+            last = index
+        if first is not None:
+            chunks.append((first, last + 1))
+        return chunks
+
+    def report(self) -> str:
+        """見積もりを表示用の文字列にする
+
+        :return: 見積もり
+        :rtype: str
+        """
+        totals = self.totals()
+        lines = [f'{self.title}: {self.items} items in {len(self.matches)} matches']
+        for bucket in Plan.QUOTAS:
+            if bucket in totals:
+                lines.append(f'  {bucket:<13}{totals[bucket]:>6} calls  (quota {self.quotas[bucket]}/min)')
+        seconds = math.ceil(self.duration())
+        lines.append(f'  estimated time: {seconds // 60}m {seconds % 60}s (workers={self.workers})')
+        chunks = self.chunks()
+        if len(chunks) > 1:
+            lines.append('  suggested chunks:')
+            for offset, limit in chunks:
+                lines.append(f'    --offset {offset} --limit {limit}')
+        return '\n'.join(lines)
@@ -0,0 +1,411 @@
+import re
+import threading
+from datetime import datetime
+from typing import List, Any, Iterator, Union
+
+import gspread.utils as gsutils
+from gspread.urls import SPREADSHEET_DRIVE_URL
+
+from pipeline import WriteBack
+from snapshot import Snapshot
+
+
+HYPERLINK_PATTERN = re.compile(r'=HYPERLINK\("https://docs\.google\.com/spreadsheets/d/(.*?)","(.*?)"\)')
+
+
+class Layout:
+    """対戦表シートの列の配置 (0始まりの列番号)
+
+    ジャッジ・スタッフの人数によって、それ以降の列の位置が変わる。
+    """
+
+    __slots__ = ('judge_num', 'staff_num', 'name', 'venue', 'start', 'end', 'team', 'judge', 'staff',
+                 'user', 'room_url', 'meeting_id', 'passcode', 'stream_url', 'stream_key', 'page_url',
+                 'aggregate', 'advice')
+
+    def __init__(self, judge_num: int, staff_num: int):
+        """
+        :param judge_num: ジャッジの人数
+        :type judge_num: int
+        :param staff_num: スタッフの人数
+        :type staff_num: int
+        """
+        base = 5 + judge_num + staff_num
+        self.judge_num = judge_num
+        self.staff_num = staff_num
+        self.name = 0
+        self.venue = 1
+        self.start = 2
+        self.end = 3
+        self.team = 4
+        self.judge = 6
+        self.staff = 6 + judge_num
+        self.user = base + 1
+        self.room_url = base + 3
+        self.meeting_id = base + 4
+        self.passcode = base + 5
+        self.stream_url = base + 6
+        self.stream_key = base + 7
+        self.page_url = base + 8
+        self.aggregate = base + 9
+        self.advice = base + 10
+
+
+class Link:
+    """リンク付きのセル (表示名と、リンク先のスプレッドシートID)"""
+
+    __slots__ = ('text', 'id')
+
+    def __init__(self, text: str, id: Union[str, None] = None):
+        """
+        :param text: 表示名
+        :type text: str
+        :param id: リンク先のスプレッドシートID. リンクが無い場合は None, defaults to None
+        :type id: Union[str, None], optional
+        """
+        self.text = text
+        self.id = id
+
+    @classmethod
+    def parse(cls, rendered: Any, formula: Any) -> 'Link':
+        """表示値と数式からリンクを解析する
+
+        :param rendered: セルの表示値
+        :type rendered: Any
+        :param formula: セルの数式
+        :type formula: Any
+        :return: リンク
+        :rtype: Link
+        """
+        match = HYPERLINK_PATTERN.match(str(formula))
+        if match:
+            return cls(str(rendered), match.group(1))
+        return cls(str(rendered))
+
+    @property
+    def url(self) -> Union[str, None]:
+        """リンク先のURL"""
+        return SPREADSHEET_DRIVE_URL % self.id if self.id else None
+
+    def formula(self, text: Union[str, None] = None) -> str:
+        """セルに書き込む値
+
+        :param text: 表示名を置き換える場合に指定する, defaults to None
+        :type text: Union[str, None], optional
+        :return: リンクがあれば HYPERLINK の数式、無ければ表示名
+        :rtype: str
+        """
+        text = self.text if text is None else text
+        if self.id:
+            return f'=HYPERLINK("{self.url}","{text}")'
+        return text
+
+
+class Match:
+    """対戦表の1行 (1試合)
+
+    値を変更するメソッドは変更した列を記録し、``Schedule.write`` で変更された列だけを書き込む。
+    ``run`` では複数のコマンドが同じ試合を並行して変更するため、変更した列の記録はロックで保護する。
+    """
+
+    __slots__ = ('layout', 'index', 'values', 'name', 'venue', 'start', 'end', 'teams', 'judges', 'staffs',
+                 'user', 'room_url', 'meeting_id', 'passcode', 'stream_url', 'stream_key', 'page_url',
+                 'aggregate', 'advice', 'dirty', 'lock')
+
+    def __init__(self, layout: Layout, index: int, values: List[Any], formulas: List[Any], date: Union[datetime, None]):
+        """
+        :param layout: 列の配置
+        :type layout: Layout
+        :param index: 試合のインデックス (対戦表の3行目が0)
+        :type index: int
+        :param values: 行の表示値
+        :type values: List[Any]
+        :param formulas: 行の数式
+        :type formulas: List[Any]
+        :param date: 開催日
+        :type date: Union[datetime, None]
+        """
+        width = layout.advice + 2
+        values = list(values) + [''] * (width - len(values))
+        formulas = list(formulas) + [''] * (width - len(formulas))
+
+        self.layout = layout
+        self.index = index
+        self.values = values
+        self.name = values[layout.name]
+        self.venue = values[layout.venue]
+        self.start = Match.parse_time(date, values[layout.start])
+        self.end = Match.parse_time(date, values[layout.end])
+        self.teams = [Link.parse(values[layout.team+j], formulas[layout.team+j]) for j in range(2)]
+        self.judges = [Link.parse(values[layout.judge+j], formulas[layout.judge+j]) for j in range(layout.judge_num)]
+        self.staffs = values[layout.staff:layout.staff+layout.staff_num]
+        self.user = values[layout.user]
+        self.room_url = values[layout.room_url]
+        self.meeting_id = values[layout.meeting_id]
+        self.passcode = values[layout.passcode]
+        self.stream_url = values[layout.stream_url]
+        self.stream_key = values[layout.stream_key]
+        self.page_url = values[layout.page_url]
+        self.aggregate = Link.parse(values[layout.aggregate], formulas[layout.aggregate])
+        self.advice = [Link.parse(values[layout.advice+j], formulas[layout.advice+j]) for j in range(2)]
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    @property
+    def row(self) -> int:
+        """シート上の行番号"""
+        return 3 + self.index
+
+    @property
+    def has_teams(self) -> bool:
+        """肯定側・否定側の両方が決まっているか"""
+        return bool(self.teams[0].text) and bool(self.teams[1].text)
+
+    @property
+    def has_room(self) -> bool:
+        """会場URL・ミーティングID・パスコードが全て記入されているか"""
+        return bool(self.room_url) and bool(self.meeting_id) and bool(self.passcode)
+
+    def set_room(self, room_url: str, meeting_id: str, passcode: str):
+        """Zoom ミーティングの情報を設定する (空文字列で削除)
+
+        :param room_url: 会場URL
+        :type room_url: str
+        :param meeting_id: ミーティングID
+        :type meeting_id: str
+        :param passcode: パスコード
+        :type passcode: str
+        """
+        with self.lock:
+            self.room_url = room_url
+            self.meeting_id = str(meeting_id)
+            self.passcode = str(passcode)
+            self.dirty.update([self.layout.room_url, self.layout.meeting_id, self.layout.passcode])
+
+    def set_team_list(self, j: int, id: str):
+        """出場メンバー届のリンクを設定する
+
+        :param j: 0:肯定側, 1:否定側
+        :type j: int
+        :param id: スプレッドシートID
+        :type id: str
+        """
+        with self.lock:
+            self.teams[j].id = id
+            self.dirty.add(self.layout.team+j)
+
+    def set_ballot(self, j: int, id: str):
+        """勝敗・ポイント記入シートのリンクを設定する
+
+        :param j: ジャッジの番号
+        :type j: int
+        :param id: スプレッドシートID
+        :type id: str
+        """
+        with self.lock:
+            self.judges[j].id = id
+            self.dirty.add(self.layout.judge+j)
+
+    def set_aggregate(self, id: str):
+        """集計用紙のリンクを設定する
+
+        :param id: スプレッドシートID
+        :type id: str
+        """
+        with self.lock:
+            self.aggregate = Link('Link', id)
+            self.dirty.add(self.layout.aggregate)
+
+    def set_advice(self, j: int, id: str):
+        """アドバイスシートのリンクを設定する
+
+        :param j: 0:肯定側, 1:否定側
+        :type j: int
+        :param id: スプレッドシートID
+        :type id: str
+        """
+        with self.lock:
+            self.advice[j] = Link('Link', id)
+            self.dirty.add(self.layout.advice+j)
+
+    def text(self, column: int) -> Any:
+        """列の表示値
+
+        参照関係設定で列番号により指定された値を、解析済みの属性から取り出す。
+
+        :param column: 列番号 (0始まり)
+        :type column: int
+        :return: 表示値
+        :rtype: Any
+        """
+        layout = self.layout
+        if column == layout.name:
+            return self.name
+        if column == layout.venue:
+            return self.venue
+        if layout.team <= column < layout.team + 2:
+            return self.teams[column-layout.team].text
+        if layout.judge <= column < layout.judge + layout.judge_num:
+            return self.judges[column-layout.judge].text
+        if layout.staff <= column < layout.staff + layout.staff_num:
+            return self.staffs[column-layout.staff]
+        return self.values[column]
+
+    def cell(self, column: int) -> Any:
+        """列に書き込む値
+
+        :param column: 列番号 (0始まり)
+        :type column: int
+        :return: 書き込む値
+        :rtype: Any
+        """
+        layout = self.layout
+        if column == layout.room_url:
+            return self.room_url
+        if column == layout.meeting_id:
+            return f"'{self.meeting_id}" if self.meeting_id else ''
+        if column == layout.passcode:
+            return f"'{self.passcode}" if self.passcode else ''
+        if layout.team <= column < layout.team + 2:
+            return self.teams[column-layout.team].formula()
+        if layout.judge <= column < layout.judge + layout.judge_num:
+            return self.judges[column-layout.judge].formula()
+        if column == layout.aggregate:
+            return self.aggregate.formula()
+        if layout.advice <= column < layout.advice + 2:
+            return self.advice[column-layout.advice].formula()
+        return self.values[column]
+
+    @staticmethod
+    def parse_time(date: Union[datetime, None], value: str) -> Union[datetime, None]:
+        """開催日と時刻 (HH:MM) から日時を求める
+
+        :param date: 開催日
+        :type date: Union[datetime, None]
+        :param value: 時刻
+        :type value: str
+        :return: 日時. 解析できない場合は None
+        :rtype: Union[datetime, None]
+        """
+        if date is None or not value:
+            return None
+        try:
+            hour, minute = str(value).split(':')[:2]
+            return date.replace(hour=int(hour), minute=int(minute))
+        except ValueError:
+            return None
+
+
+class Schedule:
+    """対戦表シートを1回だけ解析したもの
+
+    表示値と数式を1回ずつ取得し、各行を ``Match`` に変換する。
+    変更は ``Match`` に記録し、``write`` で変更のあったセルだけを書き込む。
+    """
+
+    def __init__(self, snapshot: Snapshot, sheet_index: int, judge_num: int, staff_num: int):
+        """
+        :param snapshot: 管理用スプレッドシートのスナップショット
+        :type snapshot: Snapshot
+        :param sheet_index: 対戦表シートのインデックス
+        :type sheet_index: int
+        :param judge_num: ジャッジの人数
+        :type judge_num: int
+        :param staff_num: スタッフの人数
+        :type staff_num: int
+        """
+        self.snapshot = snapshot
+        self.sheet_index = sheet_index
+        self.layout = Layout(judge_num, staff_num)
+
+        values = snapshot.values(sheet_index)
+        formulas = snapshot.values(sheet_index, Snapshot.FORMULA)
+        self.values = values
+        self.date = Schedule.parse_date(values[0][1] if len(values) > 0 and len(values[0]) > 1 else '')
+        self.matches = [
+            Match(self.layout, i, value, formulas[i+2] if i+2 < len(formulas) else [], self.date)
+            for i, value in enumerate(values[2:])
+        ]
+
+    @property
+    def sheet_id(self) -> int:
+        """対戦表シートのシートID (並べ替えや名前の変更では変わらない)"""
+        return self.snapshot.worksheet(self.sheet_index).id
+
+    def select(self, offset: int = 0, limit: int = None) -> Iterator[Match]:
+        """``offset`` 以上 ``limit`` 未満のインデックスの試合を返す
+
+        :param offset: 最初のインデックス, defaults to 0
+        :type offset: int, optional
+        :param limit: 最後のインデックス+1, defaults to None
+        :type limit: int, optional
+        :return: 試合
+        :rtype: Iterator[Match]
+        """
+        return iter(self.matches[offset:limit])
+
+    def cell(self, label: str) -> Union[str, None]:
+        """読み込んだ時点のセルの表示値を取得する
+
+        :param label: セルの位置 (A1形式)
+        :type label: str
+        :return: セルの値. 範囲外の場合は None
+        :rtype: Union[str, None]
+        """
+        row, col = gsutils.a1_to_rowcol(label)
+        if row <= len(self.values) and col <= len(self.values[row-1]):
+            return self.values[row-1][col-1]
+        return None
+
+    def writer(self, chunk_rows: int = WriteBack.CHUNK_ROWS, chunk_seconds: float = WriteBack.CHUNK_SECONDS) -> WriteBack:
+        """対戦表シートに逐次書き込む WriteBack を生成する
+
+        :param chunk_rows: 1回に書き込む件数, defaults to WriteBack.CHUNK_ROWS
+        :type chunk_rows: int, optional
+        :param chunk_seconds: 書き込みの間隔 (秒), defaults to WriteBack.CHUNK_SECONDS
+        :type chunk_seconds: float, optional
+        :return: WriteBack
+        :rtype: WriteBack
+        """
+        return WriteBack(self.snapshot.worksheet(self.sheet_index), chunk_rows, chunk_seconds,
+                         lambda: self.snapshot.invalidate(self.sheet_index))
+
+    def write(self, match: Match, write_back: WriteBack):
+        """試合の変更された列を書き込む (隣接する列は1つの範囲にまとめる)
+
+        :param match: 試合
+        :type match: Match
+        :param write_back: 書き込み先
+        :type write_back: WriteBack
+        """
+        with match.lock:
+            columns = sorted(match.dirty)
+            match.dirty.clear()
+            cells = {column: match.cell(column) for column in columns}
+
+        ranges: List[List[int]] = []
+        for column in columns:
+            if len(ranges) > 0 and ranges[-1][1] == column - 1:
+                ranges[-1][1] = column
+            else:
+                ranges.append([column, column])
+
+        for first, last in ranges:
+            start = gsutils.rowcol_to_a1(match.row, first+1)
+            end = gsutils.rowcol_to_a1(match.row, last+1)
+            write_back.put(f'{start}:{end}', [[cells[column] for column in range(first, last+1)]])
+
+    @staticmethod
+    def parse_date(value: str) -> Union[datetime, None]:
+        """開催日 (YYYY/MM/DD) を解析する
+
+        :param value: 開催日
+        :type value: str
+        :return: 開催日. 解析できない場合は None
+        :rtype: Union[datetime, None]
+        """
+        try:
+            year, month, day = str(value).split('/')
+            return datetime(int(year), int(month), int(day))
+        except ValueError:
+            return None
@@ -0,0 +1,249 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Union
+
+import gspread
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+
+def create_adapter(pool_size: int) -> HTTPAdapter:
+    """コネクションプールの大きさを指定して HTTPAdapter を生成する
+
+    :param pool_size: コネクションプールの大きさ
+    :type pool_size: int
+    :return: HTTPAdapter
+    :rtype: HTTPAdapter
+    """
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+
+class Governor:
+    """HTTP セッションの全ての送信に対する流量制御
+
+    同時に送信するリクエスト数の上限を AIMD で調整する。
+    成功する毎に上限を少しずつ (1/上限) 増やし、レート制限を受けた場合は上限を半分にする。
+    レート制限を受けたリクエストは、``Retry-After`` または指数バックオフ (ジッター付き) に従って待機し、再送する。
+    Zoom の日毎の上限のように、待っても解消しないものはそのまま返す。
+    """
+
+    MAX_RETRIES = 10
+    MAX_DELAY = 64.0
+    COOLDOWN = 1.0
+    RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        """
+        :param max_concurrency: 同時に送信するリクエスト数の上限の最大値
+        :type max_concurrency: int
+        :param min_concurrency: 同時に送信するリクエスト数の上限の最小値, defaults to 1
+        :type min_concurrency: int, optional
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.limit = float(self.max_concurrency)
+        self.active = 0
+        self.decreased_at = None
+        self._cond = threading.Condition()
+
+    def resize(self, max_concurrency: int):
+        """上限の最大値を変更する (レート制限を受けていなければ上限も変更する)
+
+        :param max_concurrency: 同時に送信するリクエスト数の上限の最大値
+        :type max_concurrency: int
+        """
+        with self._cond:
+            self.max_concurrency = max(max_concurrency, 1)
+            if self.decreased_at is None:
+                self.limit = float(self.max_concurrency)
+            else:
+                self.limit = min(self.limit, self.max_concurrency)
+            self._cond.notify_all()
+
+    def acquire(self):
+        """送信中のリクエスト数が上限未満になるまで待機する"""
+        with self._cond:
+            while self.active >= max(int(self.limit), self.min_concurrency):
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, throttled: Union[bool, None]):
+        """送信の完了を通知し、結果に応じて上限を調整する
+
+        :param throttled: レート制限を受けた場合は True. 通信に失敗した場合は None (上限を変えない)
+        :type throttled: Union[bool, None]
+        """
+        with self._cond:
+            self.active -= 1
+            if throttled:
+                # 同時に送信していたリクエストがまとめて制限された場合に、何度も半分にしない
+                now = time.monotonic()
+                if self.decreased_at is None or now - self.decreased_at >= Governor.COOLDOWN:
+                    self.limit = max(float(self.min_concurrency), self.limit / 2)
+                    self.decreased_at = now
+            elif throttled is not None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def instrument(self, session: Session):
+        """HTTP セッションの送信を流量制御の対象にする
+
+        ``Session.send`` を置き換えるため、gspread や Drive API の呼び出しも含めて全ての送信が対象になる。
+
+        :param session: HTTP セッション
+        :type session: Session
+        """
+        send = session.send
+
+        def governed(request: PreparedRequest, **kwargs) -> Response:
+            retries = 0
+            while True:
+                self.acquire()
+                throttled = None
+                try:
+                    response = send(request, **kwargs)
+                    throttled = Governor.is_throttled(response)
+                finally:
+                    self.release(throttled)
+                if not throttled or retries >= Governor.MAX_RETRIES:
+                    return response
+                delay = Governor.retry_after(response, retries)
+                response.close()
+                metrics.sleep(delay)
+                retries += 1
+
+        session.send = governed
+
+    @staticmethod
+    def is_throttled(response: Response) -> bool:
+        """待機して再送すべきレート制限か判定する
+
+        Sheets/Zoom の 429 と、Drive の 403 (``rateLimitExceeded``, ``userRateLimitExceeded``) を対象とする。
+
+        :param response: レスポンス
+        :type response: Response
+        :return: レート制限を受けた場合は True
+        :rtype: bool
+        """
+        if response.status_code == 429:
+            return response.headers.get('X-RateLimit-Type', '').lower() != 'daily-limit'
+        if response.status_code == 403:
+            try:
+                error = response.json().get('error')
+            except (ValueError, AttributeError):
+                return False
+            if not isinstance(error, dict):
+                return False
+            return any(x.get('reason') in Governor.RATE_LIMIT_REASONS for x in error.get('errors', []))
+        return False
+
+    @staticmethod
+    def retry_after(response: Response, retries: int) -> float:
+        """レート制限を受けた応答から次の再送までの待機秒数を求める
+
+        ``Retry-After`` が秒数または日時で指定されていればそれに従い、
+        無ければ指数バックオフ (ジッター付き、最大 ``MAX_DELAY`` 秒) とする。
+        """
+        value = response.headers.get('Retry-After')
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+            try:
+                at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                try:
+                    at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                except ValueError:
+                    at = None
+            if at is not None:
+                if at.tzinfo is None:
+                    at = at.replace(tzinfo=timezone.utc)
+                return max(0.0, (at - datetime.now(timezone.utc)).total_seconds())
+        return min(Governor.MAX_DELAY, 2 ** retries) * (0.5 + random.random())
+
+
+class GoogleSession:
+    """プロセス内で共有する Google の認証情報と HTTP セッション
+
+    鍵ファイルの読み込みはプロセス内で1回だけ行い、アクセストークンは有効期限が切れるまで使い回す。
+    HTTP セッションはコネクションプールを持ち、gspread のクライアントと Drive API の呼び出しで共有する。
+    送信は ``Governor`` で流量制御し、同時に送信する数の上限の最大値はコネクションプールの大きさとする。
+    """
+
+    SCOPES = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+    POOL_SIZE = 10
+
+    _sessions: Dict[str, 'GoogleSession'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, json_key_file: Path, pool_size: int = POOL_SIZE):
+        """
+        :param json_key_file: サービスアカウントの鍵ファイル
+        :type json_key_file: Path
+        :param pool_size: コネクションプールの大きさ, defaults to POOL_SIZE
+        :type pool_size: int, optional
+        """
+        self.credentials = Credentials.from_service_account_file(str(json_key_file), scopes=GoogleSession.SCOPES)
+        self.session = AuthorizedSession(self.credentials)
+        metrics.instrument(self.session)
+        self.governor = Governor(pool_size)
+        self.governor.instrument(self.session)
+        self.pool_size = 0
+        self.resize(pool_size)
+        self.client = gspread.Client(None, session=self.session)
+
+    @classmethod
+    def open(cls, json_key_file: Path, pool_size: int = POOL_SIZE) -> 'GoogleSession':
+        """鍵ファイルに対応するセッションを取得する (作成済みであれば共有する)
+
+        :param json_key_file: サービスアカウントの鍵ファイル
+        :type json_key_file: Path
+        :param pool_size: 必要なコネクションプールの大きさ, defaults to POOL_SIZE
+        :type pool_size: int, optional
+        :return: セッション
+        :rtype: GoogleSession
+        """
+        key = str(Path(json_key_file).resolve())
+        with cls._lock:
+            if key not in cls._sessions:
+                cls._sessions[key] = cls(json_key_file, pool_size)
+            session = cls._sessions[key]
+            if session.pool_size < pool_size:
+                session.resize(pool_size)
+            return session
+
+    def resize(self, pool_size: int):
+        """コネクションプールの大きさを変更する
+
+        :param pool_size: コネクションプールの大きさ
+        :type pool_size: int
+        """
+        self.session.mount('https://', create_adapter(pool_size))
+        self.governor.resize(pool_size)
+        self.pool_size = pool_size
+
+
+def open_client(json_key_file: Path, workers: int = 1) -> gspread.Client:
+    """共有セッションの gspread クライアントを取得する
+
+    :param json_key_file: サービスアカウントの鍵ファイル
+    :type json_key_file: Path
+    :param workers: 並行数, defaults to 1
+    :type workers: int, optional
+    :return: gspread のクライアント
+    :rtype: gspread.Client
+    """
+    return GoogleSession.open(json_key_file, max(workers, GoogleSession.POOL_SIZE)).client
@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Union
+
+from gspread import Client, Spreadsheet, Worksheet
+from gspread.urls import DRIVE_FILES_API_V3_URL
+import gspread.utils as gsutils
+
+from worksheet import WorksheetEx
+
+
+class Snapshot:
+    """管理用スプレッドシートの内容のスナップショット
+
+    シートの内容を表示値 (FORMATTED_VALUE) と数式 (FORMULA) の両方についてローカルのファイルに保存する。
+    保存した内容は Drive のファイルの ``version`` と ``modifiedTime`` に紐づけ、
+    スプレッドシートが変更されるまでは、コマンドの実行中も実行間でも再利用する。
+    保存した内容の読み書きは全てロックの中で行うため、複数のスレッドから共有してよい。
+    """
+
+    CACHE_DIR = Path('.cache')
+    RENDERED = 'FORMATTED_VALUE'
+    FORMULA = 'FORMULA'
+
+    _snapshots: Dict[str, 'Snapshot'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, client: Client, file_id: str, cache_dir: Path = CACHE_DIR):
+        """
+        :param client: gspread のクライアント
+        :type client: Client
+        :param file_id: 管理用スプレッドシートのID
+        :type file_id: str
+        :param cache_dir: 保存先のディレクトリ, defaults to CACHE_DIR
+        :type cache_dir: Path, optional
+        """
+        self.client = client
+        self.file_id = file_id
+        self.path = Path(cache_dir) / f'snapshot-{file_id}.json'
+        self.data = None
+        self._data_lock = threading.RLock()
+        self.refresh()
+
+    @classmethod
+    def open(cls, client: Client, file_id: str) -> 'Snapshot':
+        """スナップショットを取得する
+
+        同じプロセス内で取得済みであれば共有し、スプレッドシートが変更されていないかだけを確認する。
+
+        :param client: gspread のクライアント
+        :type client: Client
+        :param file_id: 管理用スプレッドシートのID
+        :type file_id: str
+        :return: スナップショット
+        :rtype: Snapshot
+        """
+        with cls._lock:
+            if file_id not in cls._snapshots:
+                cls._snapshots[file_id] = cls(client, file_id)
+                return cls._snapshots[file_id]
+            snapshot = cls._snapshots[file_id]
+        snapshot.refresh()
+        return snapshot
+
+    def refresh(self):
+        """スプレッドシートの版を確認し、変更されていれば保存した内容を破棄する
+
+        自身の書き込み (``invalidate``) で版が分からなくなっただけの場合は、メタデータは破棄せずに再利用する。
+        """
+        revision = self._fetch_revision()
+        with self._data_lock:
+            if self.data is None:
+                self.data = self._load()
+            if self.data is None or self.data['revision'] not in (None, revision):
+                self.data = {'revision': revision, 'properties': None, 'sheets': None, 'values': {}}
+            elif self.data['revision'] is None:
+                self.data = dict(self.data, revision=revision, values={})
+                self._save()
+
+    def invalidate(self, index: Union[int, None] = None, metadata: bool = False):
+        """書き込みを行ったシートの内容を破棄する
+
+        :param index: シートのインデックス. None の場合は全てのシート, defaults to None
+        :type index: Union[int, None], optional
+        :param metadata: 行の追加・削除等でメタデータも変わった場合は True, defaults to False
+        :type metadata: bool, optional
+        """
+        with self._data_lock:
+            if index is None:
+                self.data['values'] = {}
+            else:
+                for render in (Snapshot.RENDERED, Snapshot.FORMULA):
+                    self.data['values'].pop(f'{index}:{render}', None)
+            if metadata:
+                self.data['properties'] = None
+                self.data['sheets'] = None
+            self.data['revision'] = None
+            self._save()
+
+    def spreadsheet(self) -> Spreadsheet:
+        """保存したメタデータから Spreadsheet を生成する (メタデータは再取得しない)
+
+        :return: 管理用スプレッドシート
+        :rtype: Spreadsheet
+        """
+        with self._data_lock:
+            self._fetch_metadata()
+            book = Spreadsheet.__new__(Spreadsheet)
+            book.client = self.client.http_client
+            book._properties = dict(self.data['properties'], id=self.file_id)
+            return book
+
+    def titles(self) -> List[str]:
+        """保存したメタデータから全てのシート名を取得する
+
+        :return: シートのインデックス順のシート名
+        :rtype: List[str]
+        """
+        with self._data_lock:
+            self._fetch_metadata()
+            return [sheet['title'] for sheet in self.data['sheets']]
+
+    def worksheet(self, index: int) -> WorksheetEx:
+        """保存したメタデータからシートを生成する (メタデータは再取得しない)
+
+        :param index: シートのインデックス
+        :type index: int
+        :return: シート
+        :rtype: WorksheetEx
+        """
+        with self._data_lock:
+            book = self.spreadsheet()
+            properties = dict(self.data['sheets'][index])
+        return WorksheetEx.cast(Worksheet(book, properties, self.file_id, self.client.http_client))
+
+    def values(self, index: int, render: str = RENDERED) -> List[List[str]]:
+        """シートの全ての値を取得する (``get_all_values`` と同じ形式)
+
+        :param index: シートのインデックス
+        :type index: int
+        :param render: ``FORMATTED_VALUE`` または ``FORMULA``, defaults to RENDERED
+        :type render: str, optional
+        :return: シートの値 (呼び出し側で変更しても良いように複製して返す)
+        :rtype: List[List[str]]
+        """
+        key = f'{index}:{render}'
+        with self._data_lock:
+            if key not in self.data['values']:
+                self._fetch_metadata()
+                title = self.data['sheets'][index]['title']
+                response = self.client.http_client.values_get(
+                    self.file_id, gsutils.absolute_range_name(title), params={'valueRenderOption': render})
+                self.data['values'][key] = gsutils.fill_gaps(response.get('values', [[]]))
+                self._save()
+            return [list(row) for row in self.data['values'][key]]
+
+    def _fetch_revision(self) -> str:
+        response = self.client.http_client.request(
+            'get',
+            f'{DRIVE_FILES_API_V3_URL}/{self.file_id}',
+            params={'fields': 'version,modifiedTime', 'supportsAllDrives': True},
+        )
+        js = response.json()
+        return f"{js.get('version')}:{js.get('modifiedTime')}"
+
+    def _fetch_metadata(self):
+        # 呼び出し側で _data_lock を取得しておくこと
+        if self.data['sheets'] is not None:
+            return
+        metadata = self.client.http_client.fetch_sheet_metadata(
+            self.file_id, params={'fields': 'properties,sheets.properties'})
+        self.data['properties'] = metadata['properties']
+        self.data['sheets'] = [sheet['properties'] for sheet in metadata['sheets']]
+        self._save()
+
+    def _load(self) -> Union[Dict[str, Any], None]:
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as ifp:
+                return json.load(ifp)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        # 呼び出し側で _data_lock を取得しておくこと
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.path.parent,
+                                         prefix=self.path.name, suffix='.tmp', delete=False) as ofp:
+            json.dump(self.data, ofp, ensure_ascii=False)
+        os.replace(ofp.name, self.path)
@@ -0,0 +1,276 @@
+"""オフライン ベンチマーク
+
+ローカルの代替サーバー (tests/fakeapi.py) に対して manage.py の各コマンドを実行し、
+試合数・ジャッジ数・並行数の組み合わせ毎に所要時間と API 呼び出し回数を計測する。
+Google と Zoom の認証情報は不要で、実際の API は呼び出さない。
+リポジトリのトップで ``python -m tests.bench`` として実行する。
+"""
+import argparse
+import itertools
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any
+
+import gspread.utils as gsutils
+import yaml
+
+from plan import Plan, SHEETS_READ, SHEETS_WRITE, DRIVE, ZOOM
+from schedule import Layout
+from tests.fakeapi import FakeAPI, Sheet
+
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE = ROOT / 'config-dkoshien.yaml.sample'
+COMMANDS = [
+    'generate-room',
+    'generate-ballot',
+    'generate-member-list',
+    'generate-aggregate',
+    'generate-advice',
+    'collect-results',
+]
+SHEET_TITLES = ['対戦表', 'エントリー', 'ジャッジ', 'スタッフ', '投票', '結果', '得点']
+MEETINGS_PER_USER = 50
+
+
+def fill(sheet: Sheet, labels: List[str], value: str):
+    """シートの指定のセルに値を入れる
+
+    :param sheet: シート
+    :type sheet: Sheet
+    :param labels: セルの位置 (A1形式) のリスト
+    :type labels: List[str]
+    :param value: 値
+    :type value: str
+    """
+    for label in labels:
+        row, col = gsutils.a1_to_rowcol(label)
+        sheet.set(row-1, col-1, value)
+
+
+def build_schedule(matches: int, judge_num: int, staff_num: int, users: int) -> List[List[str]]:
+    """対戦表のシートの値を生成する
+
+    :param matches: 試合数
+    :type matches: int
+    :param judge_num: ジャッジ数
+    :type judge_num: int
+    :param staff_num: スタッフ数
+    :type staff_num: int
+    :param users: Zoom ユーザー数
+    :type users: int
+    :return: シートの値
+    :rtype: List[List[str]]
+    """
+    layout = Layout(judge_num, staff_num)
+    width = layout.advice + 2
+    values = [['開催日', datetime.now().strftime('%Y/%m/%d')], ['試合']]
+    for k in range(matches):
+        row = [''] * width
+        row[layout.name] = f'第{k+1}試合'
+        row[layout.venue] = f'会場{k % 20 + 1}'
+        row[layout.start] = '10:00'
+        row[layout.end] = '11:30'
+        row[layout.team] = f'チーム{2*k+1}'
+        row[layout.team+1] = f'チーム{2*k+2}'
+        for j in range(judge_num):
+            row[layout.judge+j] = f'ジャッジ{k}-{j+1}'
+        for s in range(staff_num):
+            row[layout.staff+s] = f'スタッフ{k}-{s+1}'
+        row[layout.user] = f'u{k % users}@example.com'
+        values.append(row)
+    return values
+
+
+def build_config(cfg: Dict[str, Any], judge_num: int, templates: Dict[str, str]) -> Dict[str, Any]:
+    """サンプルの設定を、代替サーバー上のファイルを指すように書き換える
+
+    :param cfg: サンプルの設定
+    :type cfg: Dict[str, Any]
+    :param judge_num: ジャッジ数
+    :type judge_num: int
+    :param templates: 書類の種類とテンプレートのID
+    :type templates: Dict[str, str]
+    :return: 設定
+    :rtype: Dict[str, Any]
+    """
+    cfg = dict(cfg, file_id='main', prefix='ベンチマーク ', judge_num=judge_num, staff_num=1)
+    cfg['auth'] = {'key_file': 'key.json'}
+    cfg['sheets'] = {k: n for n, k in enumerate(['matches', 'entries', 'judges', 'staff', 'vote', 'result', 'score'])}
+    for kind, template in templates.items():
+        cfg[kind] = dict(cfg[kind], template=template, folder=f'folder-{kind}')
+    return cfg
+
+
+def setup(api: FakeAPI, directory: Path, matches: int, judge_num: int):
+    """代替サーバーにスプレッドシートとテンプレートを用意し、設定ファイルを書き出す
+
+    :param api: 代替サーバー
+    :type api: FakeAPI
+    :param directory: 設定ファイルの出力先 (manage.py の作業ディレクトリ)
+    :type directory: Path
+    :param matches: 試合数
+    :type matches: int
+    :param judge_num: ジャッジ数
+    :type judge_num: int
+    """
+    with open(SAMPLE, encoding='utf-8') as ifp:
+        sample = yaml.load(ifp, Loader=yaml.SafeLoader)
+
+    users = matches // MEETINGS_PER_USER + 1
+    api.add_users(users)
+    sheets = {title: [] for title in SHEET_TITLES}
+    sheets[SHEET_TITLES[0]] = build_schedule(matches, judge_num, 1, users)
+    sheets[SHEET_TITLES[4]] = [['試合', 'ジャッジ', '名前']]
+    main = api.add_workbook('main', sheets)
+    main.sheets[0].row_count = max(1000, matches + 2)
+
+    templates = {}
+    for kind in ('ballot', 'member_list', 'aggregate', 'advice'):
+        template = api.add_workbook(f'template-{kind}', {'シート1': []})
+        if kind == 'ballot':
+            # 集計で読み取るセルに投票の結果が入っているものとする
+            fill(template.sheets[0], [label for label, _ in sample['ballot']['to_vote']], '1')
+        templates[kind] = template.id
+
+    cfg = build_config(sample, judge_num, templates)
+    with open(directory / 'config.yaml', 'w', encoding='utf-8') as ofp:
+        yaml.dump(cfg, ofp, allow_unicode=True)
+    with open(directory / 'zoom-key.yaml', 'w', encoding='utf-8') as ofp:
+        yaml.dump({'account-id': 'bench', 'client-id': 'bench', 'client-secret': 'bench'}, ofp)
+    with open(directory / 'zoom-setting.yaml', 'w', encoding='utf-8') as ofp:
+        yaml.dump({'waiting_room': False}, ofp)
+    with open(directory / 'key.json', 'w', encoding='utf-8') as ofp:
+        ofp.write('{}')
+
+
+def run_scenario(matches: int, judge_num: int, commands: List[str], workers: int, **kwargs) -> List[Dict[str, Any]]:
+    """1つの組み合わせについて、コマンドを順に実行して計測する
+
+    :param matches: 試合数
+    :type matches: int
+    :param judge_num: ジャッジ数
+    :type judge_num: int
+    :param commands: 実行するコマンド
+    :type commands: List[str]
+    :param workers: 並行数
+    :type workers: int
+    :return: コマンド毎の計測結果
+    :rtype: List[Dict[str, Any]]
+    """
+    api = FakeAPI(
+        latency=kwargs['latency'] if 'latency' in kwargs else 0.0,
+        jitter=kwargs['jitter'] if 'jitter' in kwargs else 0.0,
+        quotas=kwargs['quotas'] if 'quotas' in kwargs else None,
+        error_rate=kwargs['error_rate'] if 'error_rate' in kwargs else 0.0,
+        seed=kwargs['seed'] if 'seed' in kwargs else None,
+    )
+    endpoint = api.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='online-debate-bench-') as tmp:
+            directory = Path(tmp)
+            setup(api, directory, matches, judge_num)
+
+            for command in commands:
+                calls = Counter(api.calls)
+                throttled = sum(api.throttled.values())
+                start = time.monotonic()
+                process = subprocess.run(
+                    [sys.executable, str(ROOT / 'tests' / 'redirect.py'), endpoint, command, '-w', str(workers)],
+                    cwd=directory, capture_output=True, text=True, encoding='utf-8')
+                seconds = time.monotonic() - start
+                lines = [x for x in process.stdout.splitlines() if x and x != 'Complete.']
+                if process.returncode != 0:
+                    print(f'{command} failed ({matches} matches, {judge_num} judges):', file=sys.stderr)
+                    print(process.stderr, file=sys.stderr)
+                results.append({
+                    'matches': matches,
+                    'judges': judge_num,
+                    'workers': workers,
+                    'command': command,
+                    'ok': process.returncode == 0,
+                    'seconds': seconds,
+                    'items': len(lines),
+                    'calls': api.calls - calls,
+                    'throttled': sum(api.throttled.values()) - throttled,
+                })
+    finally:
+        api.stop()
+    return results
+
+
+def report(results: List[Dict[str, Any]], header: bool = True) -> str:
+    """計測結果を表示用の文字列にする
+
+    :param results: 計測結果
+    :type results: List[Dict[str, Any]]
+    :param header: 見出しの行を含める, defaults to True
+    :type header: bool, optional
+    :return: 計測結果の表
+    :rtype: str
+    """
+    buckets = [SHEETS_READ, SHEETS_WRITE, DRIVE, ZOOM]
+    lines = [] if not header else [f"{'matches':>8}{'judges':>7}{'workers':>8}  {'command':<22}{'sec':>9}{'items':>7}{'items/s':>9}"
+             + ''.join(f'{x:>14}' for x in buckets) + f"{'429':>6}"]
+    for x in results:
+        rate = x['items'] / x['seconds'] if x['seconds'] > 0 else 0.0
+        lines.append(f"{x['matches']:>8}{x['judges']:>7}{x['workers']:>8}  {x['command'] + ('' if x['ok'] else ' !'):<22}"
+                     f"{x['seconds']:>9.2f}{x['items']:>7}{rate:>9.1f}"
+                     + ''.join(f"{x['calls'].get(bucket, 0):>14}" for bucket in buckets) + f"{x['throttled']:>6}")
+    return '\n'.join(lines)
+
+
+def parse_quotas(value: str) -> Dict[str, int]:
+    """``--quota`` の値を解析する
+
+    :param value: ``sheets-write=60,drive=12000`` の形式、または Plan の既定値を使う ``default``
+    :type value: str
+    :return: クォータの種類と1分あたりの上限
+    :rtype: Dict[str, int]
+    """
+    if value == 'default':
+        return dict(Plan.QUOTAS)
+    quotas = {}
+    for item in value.split(','):
+        bucket, count = item.split('=')
+        quotas[bucket.strip()] = int(count)
+    return quotas
+
+
+def main():
+    """メイン関数
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--matches', type=str, default='50,200,1000', help='Comma separated numbers of matches')
+    parser.add_argument('--judges', type=str, default='1,3,5', help='Comma separated numbers of judges per match')
+    parser.add_argument('--workers', type=str, default='1', help='Comma separated numbers of workers')
+    parser.add_argument('--commands', type=str, default=','.join(COMMANDS), help='Comma separated commands executed in order')
+    parser.add_argument('--latency', type=float, default=0.05, help='Response latency of the fake servers in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency in seconds')
+    parser.add_argument('--quota', type=str, default=None, help='Per-minute quotas such as sheets-write=60, or "default"')
+    parser.add_argument('--inject-429', type=float, default=0.0, help='Probability of answering 429 to any call')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed of the fake servers')
+    args = parser.parse_args()
+
+    commands = args.commands.split(',')
+    print(report([]), flush=True)
+    for matches, judge_num, workers in itertools.product(
+            [int(x) for x in args.matches.split(',')],
+            [int(x) for x in args.judges.split(',')],
+            [int(x) for x in args.workers.split(',')]):
+        results = run_scenario(
+            matches, judge_num, commands, workers,
+            latency=args.latency, jitter=args.jitter,
+            quotas=parse_quotas(args.quota) if args.quota is not None else None,
+            error_rate=args.inject_429, seed=args.seed)
+        print(report(results, header=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Any
+
+import pytest
+import yaml
+
+from schedule import Layout
+from snapshot import Snapshot
+from tests import bench, redirect
+from tests.fakeapi import FakeAPI, Workbook
+
+
+class Workspace:
+    """代替サーバーと、manage.py を実行する作業ディレクトリ"""
+
+    def __init__(self, api: FakeAPI, endpoint: str, directory: Path, matches: int, judge_num: int):
+        self.api = api
+        self.endpoint = endpoint
+        self.directory = directory
+        self.matches = matches
+        self.judge_num = judge_num
+        self.layout = Layout(judge_num, 1)
+        with open(directory / 'config.yaml', encoding='utf-8') as ifp:
+            self.cfg = yaml.load(ifp, Loader=yaml.SafeLoader)
+
+    @property
+    def main(self) -> Workbook:
+        """管理用スプレッドシート"""
+        return self.api.workbooks['main']
+
+    def manage(self, *args: str) -> subprocess.CompletedProcess:
+        """作業ディレクトリで manage.py を実行する"""
+        return subprocess.run(
+            [sys.executable, str(bench.ROOT / 'tests' / 'redirect.py'), self.endpoint, *args],
+            cwd=self.directory, capture_output=True, text=True, encoding='utf-8')
+
+    def row(self, k: int) -> List[Any]:
+        """対戦表の k 番目の試合の行"""
+        values = self.main.sheets[0].values[k+2]
+        return values + [''] * (self.layout.advice + 2 - len(values))
+
+    def votes(self) -> List[List[Any]]:
+        """投票シートの見出し以外の行"""
+        return [row for row in self.main.sheets[4].values[1:] if row and row[0]]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """代替サーバーに対戦表を用意し、作業ディレクトリに移動する
+
+    ``workspace(matches, judge_num, **options)`` で生成する。options は FakeAPI に渡す。
+    """
+    servers = []
+
+    def create(matches: int = 6, judge_num: int = 2, **options) -> Workspace:
+        api = FakeAPI(**options)
+        endpoint = api.start()
+        servers.append(api)
+        bench.setup(api, tmp_path, matches, judge_num)
+        for target, name, value in redirect.patches(endpoint):
+            monkeypatch.setattr(target, name, value)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(Snapshot, '_snapshots', {})
+        return Workspace(api, endpoint, tmp_path, matches, judge_num)
+
+    yield create
+    for api in servers:
+        api.stop()
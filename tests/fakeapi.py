@@ -0,0 +1,436 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Tuple, Union
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import gspread.utils as gsutils
+
+from plan import SHEETS_READ, SHEETS_WRITE, DRIVE, ZOOM
+
+
+HYPERLINK_PATTERN = re.compile(r'=HYPERLINK\("(.*?)","(.*?)"\)')
+
+
+class Sheet:
+    """代替サーバー上のシート"""
+
+    def __init__(self, sheet_id: int, title: str, values: List[List[Any]], row_count: int = 1000, column_count: int = 26):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.values = [list(row) for row in values]
+        self.row_count = max(row_count, len(values))
+        self.column_count = column_count
+
+    def properties(self, index: int) -> Dict[str, Any]:
+        return {
+            'sheetId': self.sheet_id,
+            'title': self.title,
+            'index': index,
+            'sheetType': 'GRID',
+            'gridProperties': {'rowCount': self.row_count, 'columnCount': self.column_count},
+        }
+
+    def get(self, row: int, col: int) -> Any:
+        if row < len(self.values) and col < len(self.values[row]):
+            return self.values[row][col]
+        return ''
+
+    def set(self, row: int, col: int, value: Any):
+        while len(self.values) <= row:
+            self.values.append([])
+        line = self.values[row]
+        while len(line) <= col:
+            line.append('')
+        line[col] = value
+
+
+class Workbook:
+    """代替サーバー上のスプレッドシート (Drive のファイルを兼ねる)"""
+
+    def __init__(self, id: str, title: str, sheets: List[Sheet], parents: Union[List[str], None] = None):
+        self.id = id
+        self.title = title
+        self.sheets = sheets
+        self.parents = parents if parents is not None else []
+        self.version = 1
+        self.modified_time = FakeAPI.now()
+
+    def touch(self):
+        self.version += 1
+        self.modified_time = FakeAPI.now()
+
+    def sheet(self, title: Union[str, None] = None, sheet_id: Union[int, None] = None) -> Sheet:
+        for sheet in self.sheets:
+            if (title is not None and sheet.title == title) or (sheet_id is not None and sheet.sheet_id == sheet_id):
+                return sheet
+        if title is None and sheet_id is None:
+            return self.sheets[0]
+        raise KeyError(title if title is not None else sheet_id)
+
+
+class FakeAPI:
+    """ベンチマーク用の Sheets v4 / Drive v3 / Zoom v2 の代替サーバー
+
+    ``manage.py`` と ``zoom.py`` が使うエンドポイントだけを実装する。
+    応答の遅延 (``latency`` 秒 + ``jitter`` 秒以内の揺らぎ)、クォータの種類毎の1分あたりの上限 (``quotas``)、
+    一定の確率での 429 応答 (``error_rate``) を設定できる。
+    ``RedirectAdapter`` で送信先を変更したクライアントから呼び出すことを想定し、
+    元のホスト名は ``X-Forwarded-Host`` ヘッダから判別する。
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, quotas: Union[Dict[str, int], None] = None,
+                 error_rate: float = 0.0, seed: Union[int, None] = None):
+        """
+        :param latency: 応答の遅延 (秒), defaults to 0.0
+        :type latency: float, optional
+        :param jitter: 遅延の揺らぎ (秒), defaults to 0.0
+        :type jitter: float, optional
+        :param quotas: クォータの種類と1分あたりの上限, defaults to None
+        :type quotas: Union[Dict[str, int], None], optional
+        :param error_rate: 429 を返す確率, defaults to 0.0
+        :type error_rate: float, optional
+        :param seed: 乱数の種, defaults to None
+        :type seed: Union[int, None], optional
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.quotas = quotas if quotas is not None else {}
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.workbooks: Dict[str, Workbook] = {}
+        self.users: List[Dict[str, Any]] = []
+        self.meetings: Dict[int, Dict[str, Any]] = {}
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.windows: Dict[str, deque] = {}
+        self.next_id = 1
+        self.lock = threading.RLock()
+        self.server = None
+
+    @staticmethod
+    def now() -> str:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            self.next_id += 1
+            return f'{prefix}{self.next_id:08d}'
+
+    def add_workbook(self, id: str, sheets: Dict[str, List[List[Any]]], parents: Union[List[str], None] = None) -> Workbook:
+        """スプレッドシートを追加する
+
+        :param id: スプレッドシートID
+        :type id: str
+        :param sheets: シート名と値 (シートの順)
+        :type sheets: Dict[str, List[List[Any]]]
+        :param parents: 親フォルダのID, defaults to None
+        :type parents: Union[List[str], None], optional
+        :return: スプレッドシート
+        :rtype: Workbook
+        """
+        workbook = Workbook(id, id, [Sheet(k, title, values) for k, (title, values) in enumerate(sheets.items())], parents)
+        with self.lock:
+            self.workbooks[id] = workbook
+        return workbook
+
+    def add_users(self, count: int, domain: str = 'example.com'):
+        """Zoom ユーザーを追加する
+
+        :param count: 人数
+        :type count: int
+        :param domain: メールアドレスのドメイン, defaults to 'example.com'
+        :type domain: str, optional
+        """
+        with self.lock:
+            for k in range(count):
+                self.users.append({'id': f'U{len(self.users):05d}', 'email': f'u{len(self.users)}@{domain}'})
+
+    def start(self, port: int = 0) -> str:
+        """別スレッドでサーバーを起動する
+
+        :param port: ポート番号. 0 の場合は空いているポート, defaults to 0
+        :type port: int, optional
+        :return: 送信先 (tests/redirect.py に指定する値)
+        :rtype: str
+        """
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                api.handle(self)
+
+            do_POST = do_GET
+            do_PATCH = do_GET
+            do_PUT = do_GET
+            do_DELETE = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        """サーバーを停止する"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def bucket(self, host: str, method: str, path: str) -> str:
+        if path.startswith('/v4/'):
+            return SHEETS_READ if method == 'GET' else SHEETS_WRITE
+        if path.startswith('/drive/'):
+            return DRIVE
+        return ZOOM
+
+    def admit(self, bucket: str) -> Tuple[bool, Union[float, None]]:
+        # 1分間の窓でクォータを数え、上限を超えた場合と、一定の確率で 429 とする
+        # 上限を超えた場合は、窓が空くまでの秒数を Retry-After として返す (無作為の 429 には付けない)
+        with self.lock:
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return False, None
+            if bucket not in self.quotas:
+                return True, None
+            window = self.windows.setdefault(bucket, deque())
+            now = time.monotonic()
+            while len(window) > 0 and window[0] <= now - 60:
+                window.popleft()
+            if len(window) >= self.quotas[bucket]:
+                return False, window[0] + 60 - now
+            window.append(now)
+            return True, None
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        parts = urlsplit(handler.path)
+        path = unquote(parts.path)
+        query = parse_qs(parts.query)
+        host = handler.headers.get('X-Forwarded-Host', '')
+        length = int(handler.headers.get('Content-Length') or 0)
+        raw = handler.rfile.read(length) if length > 0 else b''
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+
+        method = handler.command
+        bucket = self.bucket(host, method, path)
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            self.calls[bucket] += 1
+        admitted, retry_after = self.admit(bucket)
+        if not admitted:
+            with self.lock:
+                self.throttled[bucket] += 1
+            self.reply(handler, 429, {'error': {'code': 429, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}},
+                       {'Retry-After': str(math.ceil(retry_after))} if retry_after is not None else None)
+            return
+
+        try:
+            status, payload = self.route(method, path, query, body)
+        except KeyError as e:
+            status, payload = 404, {'error': {'code': 404, 'message': f'Not found: {e}'}}
+        self.reply(handler, status, payload)
+
+    def reply(self, handler: BaseHTTPRequestHandler, status: int, payload: Union[Dict[str, Any], None],
+              headers: Union[Dict[str, str], None] = None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        for key, value in (headers if headers is not None else {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def route(self, method: str, path: str, query: Dict[str, List[str]], body: Dict[str, Any]) -> Tuple[int, Any]:
+        with self.lock:
+            match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)', path)
+            if match and method == 'GET':
+                return 200, self.metadata(self.workbooks[match.group(1)])
+            match = re.fullmatch(r'/v4/spreadsheets/([^/:]+):batchUpdate', path)
+            if match:
+                return 200, self.batch_update(self.workbooks[match.group(1)], body)
+            match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)/values:batchGet', path)
+            if match:
+                workbook = self.workbooks[match.group(1)]
+                render = query.get('valueRenderOption', ['FORMATTED_VALUE'])[0]
+                return 200, {'spreadsheetId': workbook.id,
+                             'valueRanges': [self.values_get(workbook, x, render) for x in query.get('ranges', [])]}
+            match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)/values:batchUpdate', path)
+            if match:
+                return 200, self.values_update(self.workbooks[match.group(1)], body)
+            match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)/values/(.+)', path)
+            if match and method == 'GET':
+                render = query.get('valueRenderOption', ['FORMATTED_VALUE'])[0]
+                return 200, self.values_get(self.workbooks[match.group(1)], match.group(2), render)
+
+            match = re.fullmatch(r'/drive/v3/files/([^/]+)/copy', path)
+            if match:
+                return 200, self.copy(self.workbooks[match.group(1)], body)
+            match = re.fullmatch(r'/drive/v3/files/([^/]+)', path)
+            if match:
+                workbook = self.workbooks[match.group(1)]
+                return 200, {'id': workbook.id, 'version': str(workbook.version), 'modifiedTime': workbook.modified_time}
+            if path == '/drive/v3/files':
+                return 200, self.list_files(query.get('q', [''])[0])
+
+            if path == '/oauth/token':
+                return 200, {'access_token': self.new_id('token'), 'token_type': 'bearer', 'expires_in': 3600}
+            if path == '/v2/users':
+                size = int(query.get('page_size', ['30'])[0])
+                number = int(query.get('page_number', ['1'])[0])
+                pages = max(1, -(-len(self.users) // size))
+                return 200, {'page_count': pages, 'page_number': number, 'page_size': size,
+                             'total_records': len(self.users), 'users': self.users[(number-1)*size:number*size]}
+            match = re.fullmatch(r'/v2/users/([^/]+)/meetings', path)
+            if match and method == 'POST':
+                id = 80000000000 + len(self.meetings)
+                meeting = dict(body, id=id, host_id=match.group(1), join_url=f'https://zoom.us/j/{id}',
+                               password=body.get('password', ''))
+                self.meetings[id] = meeting
+                return 201, meeting
+            match = re.fullmatch(r'/v2/meetings/(\d+)/livestream', path)
+            if match:
+                if int(match.group(1)) not in self.meetings:
+                    raise KeyError(match.group(1))
+                return 204, None
+            match = re.fullmatch(r'/v2/meetings/(\d+)', path)
+            if match:
+                if method == 'DELETE':
+                    del self.meetings[int(match.group(1))]
+                    return 204, None
+                return 200, self.meetings[int(match.group(1))]
+
+        raise KeyError(path)
+
+    def metadata(self, workbook: Workbook) -> Dict[str, Any]:
+        return {
+            'spreadsheetId': workbook.id,
+            'properties': {'title': workbook.title, 'locale': 'ja_JP', 'timeZone': 'Asia/Tokyo'},
+            'sheets': [{'properties': sheet.properties(k)} for k, sheet in enumerate(workbook.sheets)],
+        }
+
+    def parse_range(self, workbook: Workbook, range_name: str) -> Tuple[Sheet, int, int, int, int]:
+        # 'シート名'!A1:B2 / シート名 / A1:B2 を (シート, 開始行, 開始列, 終了行, 終了列) (0始まり, 終了を含まない) にする
+        if '!' in range_name:
+            title, cells = range_name.rsplit('!', 1)
+        elif re.fullmatch(r'[A-Z]+\d*(:[A-Z]+\d*)?', range_name):
+            title, cells = None, range_name
+        else:
+            title, cells = range_name, ''
+        if title is not None and title.startswith("'") and title.endswith("'"):
+            title = title[1:-1].replace("''", "'")
+        sheet = workbook.sheet(title)
+        if not cells:
+            return sheet, 0, 0, sheet.row_count, sheet.column_count
+        first, _, last = cells.partition(':')
+        row1, col1 = gsutils.a1_to_rowcol(first if re.search(r'\d', first) else first + '1')
+        if not last:
+            return sheet, row1-1, col1-1, row1, col1
+        row2, col2 = gsutils.a1_to_rowcol(last if re.search(r'\d', last) else last + str(sheet.row_count))
+        return sheet, row1-1, col1-1, row2, col2
+
+    def render(self, value: Any, render: str) -> Any:
+        if render == 'FORMULA' or not isinstance(value, str) or not value.startswith('='):
+            return value
+        match = HYPERLINK_PATTERN.match(value)
+        if match:
+            return match.group(2)
+        return ''
+
+    def values_get(self, workbook: Workbook, range_name: str, render: str) -> Dict[str, Any]:
+        sheet, top, left, bottom, right = self.parse_range(workbook, range_name)
+        rows = []
+        for row in range(top, min(bottom, len(sheet.values))):
+            line = [self.render(sheet.get(row, col), render) for col in range(left, min(right, len(sheet.values[row])))]
+            while len(line) > 0 and line[-1] == '':
+                line.pop()
+            rows.append(line)
+        while len(rows) > 0 and len(rows[-1]) == 0:
+            rows.pop()
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if len(rows) > 0:
+            result['values'] = rows
+        return result
+
+    def values_update(self, workbook: Workbook, body: Dict[str, Any]) -> Dict[str, Any]:
+        for data in body.get('data', []):
+            sheet, top, left, _, _ = self.parse_range(workbook, data['range'])
+            for r, line in enumerate(data.get('values', [])):
+                for c, value in enumerate(line):
+                    if isinstance(value, str) and value.startswith("'"):
+                        value = value[1:]
+                    sheet.set(top + r, left + c, value)
+        workbook.touch()
+        return {'spreadsheetId': workbook.id, 'totalUpdatedRanges': len(body.get('data', []))}
+
+    def batch_update(self, workbook: Workbook, body: Dict[str, Any]) -> Dict[str, Any]:
+        for request in body.get('requests', []):
+            if 'updateCells' in request:
+                update = request['updateCells']
+                start = update['start']
+                sheet = workbook.sheet(sheet_id=start.get('sheetId', 0))
+                for r, row in enumerate(update.get('rows', [])):
+                    for c, cell in enumerate(row.get('values', [])):
+                        value = cell.get('userEnteredValue', {})
+                        sheet.set(start.get('rowIndex', 0) + r, start.get('columnIndex', 0) + c,
+                                  next(iter(value.values()), ''))
+            elif 'pasteData' in request:
+                paste = request['pasteData']
+                start = paste['coordinate']
+                sheet = workbook.sheet(sheet_id=start.get('sheetId', 0))
+                for r, line in enumerate(paste['data'].split('\n')):
+                    for c, value in enumerate(line.split(paste.get('delimiter', ','))):
+                        sheet.set(start.get('rowIndex', 0) + r, start.get('columnIndex', 0) + c, value)
+            elif 'appendDimension' in request:
+                append = request['appendDimension']
+                sheet = workbook.sheet(sheet_id=append.get('sheetId', 0))
+                if append['dimension'] == 'ROWS':
+                    sheet.row_count += append['length']
+                else:
+                    sheet.column_count += append['length']
+            elif 'updateSheetProperties' in request:
+                properties = request['updateSheetProperties']['properties']
+                sheet = workbook.sheet(sheet_id=properties.get('sheetId', 0))
+                grid = properties.get('gridProperties', {})
+                sheet.row_count = grid.get('rowCount', sheet.row_count)
+                sheet.column_count = grid.get('columnCount', sheet.column_count)
+            elif 'deleteDimension' in request:
+                target = request['deleteDimension']['range']
+                sheet = workbook.sheet(sheet_id=target.get('sheetId', 0))
+                if target['dimension'] == 'ROWS':
+                    del sheet.values[target['startIndex']:target['endIndex']]
+                    sheet.row_count -= target['endIndex'] - target['startIndex']
+        workbook.touch()
+        return {'spreadsheetId': workbook.id, 'replies': [{} for _ in body.get('requests', [])]}
+
+    def copy(self, workbook: Workbook, body: Dict[str, Any]) -> Dict[str, Any]:
+        id = self.new_id('copy')
+        sheets = [Sheet(sheet.sheet_id, sheet.title, sheet.values, sheet.row_count, sheet.column_count)
+                  for sheet in workbook.sheets]
+        self.workbooks[id] = Workbook(id, body.get('name', workbook.title), sheets, body.get('parents', []))
+        return {'id': id}
+
+    def list_files(self, q: str) -> Dict[str, Any]:
+        folder = re.search(r"'([^']*)' in parents", q)
+        since = re.search(r"modifiedTime >= '([^']*)'", q)
+        files = [{'id': workbook.id, 'modifiedTime': workbook.modified_time}
+                 for workbook in self.workbooks.values()
+                 if (folder is None or folder.group(1) in workbook.parents)
+                 and (since is None or workbook.modified_time >= since.group(1))]
+        return {'files': files}
@@ -0,0 +1,87 @@
+"""manage.py の API 呼び出しをローカルの代替サーバー (tests/fakeapi.py) に向ける
+
+テストとベンチマーク専用。``python tests/redirect.py <送信先> <manage.py の引数...>`` として実行すると、
+Google と Zoom への全てのリクエストを送信先に送り、Google の認証は行わずに manage.py を実行する。
+送信先はループバックアドレスに限る。
+"""
+import runpy
+import sys
+from pathlib import Path
+from typing import List, Tuple, Any
+from urllib.parse import urlsplit
+
+from google.auth.credentials import AnonymousCredentials
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+
+
+ROOT = Path(__file__).resolve().parent.parent
+LOOPBACK_HOSTS = {'127.0.0.1', 'localhost', '::1'}
+
+
+class RedirectAdapter(HTTPAdapter):
+    """全てのリクエストを指定の送信先に送る HTTPAdapter
+
+    パスとクエリはそのままにし、元のホスト名は ``X-Forwarded-Host`` ヘッダで渡す。
+    """
+
+    def __init__(self, endpoint: str, **kwargs):
+        """
+        :param endpoint: 送信先 (``http://127.0.0.1:8080`` 等)
+        :type endpoint: str
+        :raises ValueError: 送信先がループバックアドレスでない場合に例外を送出
+        """
+        if urlsplit(endpoint).hostname not in LOOPBACK_HOSTS:
+            raise ValueError(f'Not a loopback endpoint: {endpoint}')
+        super().__init__(**kwargs)
+        self.endpoint = endpoint.rstrip('/')
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        parts = urlsplit(request.url)
+        request = request.copy()
+        request.headers['X-Forwarded-Host'] = parts.netloc
+        request.url = self.endpoint + parts.path + ('?' + parts.query if parts.query else '')
+        return super().send(request, **kwargs)
+
+
+class AnonymousServiceAccount:
+    """鍵ファイルを読まずに匿名の認証情報を返す ``Credentials`` の代わり"""
+
+    @staticmethod
+    def from_service_account_file(filename: str, **kwargs) -> AnonymousCredentials:
+        return AnonymousCredentials()
+
+
+def patches(endpoint: str) -> List[Tuple[Any, str, Any]]:
+    """送信先を変更するために置き換える属性
+
+    :param endpoint: 送信先
+    :type endpoint: str
+    :return: 置き換える対象・属性名・値の組のリスト
+    :rtype: List[Tuple[Any, str, Any]]
+    """
+    import session
+    import zoom
+
+    def create_adapter(pool_size: int) -> HTTPAdapter:
+        return RedirectAdapter(endpoint, pool_connections=pool_size, pool_maxsize=pool_size)
+
+    return [
+        (session, 'create_adapter', create_adapter),
+        (zoom, 'create_adapter', create_adapter),
+        (session, 'Credentials', AnonymousServiceAccount),
+    ]
+
+
+def main():
+    endpoint = sys.argv[1]
+    # manage.py を直接実行した場合と同じ sys.path と sys.argv にする
+    sys.path[0] = str(ROOT)
+    sys.argv = [str(ROOT / 'manage.py'), *sys.argv[2:]]
+    for target, name, value in patches(endpoint):
+        setattr(target, name, value)
+    runpy.run_path(str(ROOT / 'manage.py'), run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import pytest
+
+from document import DocumentRender
+
+
+def rendered(value) -> dict:
+    render = DocumentRender(7)
+    render.set_value('B3', value)
+    [request] = render.body()['requests']
+    return request
+
+
+@pytest.mark.parametrize('value', ['2024/10/01', '10:00', '50%', '1,234', '¥1,000', '第1試合'])
+def test_values_parsed_by_sheets_are_pasted(value):
+    paste = rendered(value)['pasteData']
+    assert paste['data'] == value
+    assert paste['coordinate'] == {'sheetId': 7, 'rowIndex': 2, 'columnIndex': 1}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('=A1', {'formulaValue': '=A1'}),
+    ('12', {'numberValue': 12}),
+    ('1.5', {'numberValue': 1.5}),
+    (3, {'numberValue': 3}),
+    ('true', {'boolValue': True}),
+    ('肯定', {'stringValue': '肯定'}),
+    ("'2024/10/01", {'stringValue': '2024/10/01'}),
+    ('1\n2', {'stringValue': '1\n2'}),
+    (None, {'stringValue': ''}),
+])
+def test_other_values_are_written_as_cells(value, expected):
+    update = rendered(value)['updateCells']
+    assert update['rows'][0]['values'][0]['userEnteredValue'] == expected
+    assert update['start'] == {'sheetId': 7, 'rowIndex': 2, 'columnIndex': 1}
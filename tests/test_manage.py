@@ -0,0 +1,140 @@
+from collections import Counter
+
+import pytest
+
+import manage
+from plan import SHEETS_READ, SHEETS_WRITE, DRIVE, ZOOM
+from session import open_client
+from snapshot import Snapshot
+from tests.fakeapi import HYPERLINK_PATTERN
+
+
+def open_snapshot(ws) -> Snapshot:
+    return Snapshot.open(open_client(ws.directory / 'key.json'), 'main')
+
+
+def linked(value: str) -> bool:
+    return HYPERLINK_PATTERN.match(str(value)) is not None
+
+
+def test_resolve_sheets(workspace):
+    ws = workspace()
+    ws.main.sheets[1].title = '対戦表2'
+    snapshot = open_snapshot(ws)
+
+    assert manage.resolve_sheets(snapshot, 0) == [0]
+    assert manage.resolve_sheets(snapshot, '0-1') == [0, 1]
+    assert manage.resolve_sheets(snapshot, '対戦表*') == [0, 1]
+    assert manage.resolve_sheets(snapshot, ['対戦表2', 0, '0-1']) == [1, 0]
+    with pytest.raises(ValueError):
+        manage.resolve_sheets(snapshot, '存在しない')
+    with pytest.raises(ValueError):
+        manage.resolve_sheets(snapshot, '5-9')
+
+
+@pytest.mark.parametrize('command', ['generate-room', 'generate-ballot', 'generate-aggregate', 'collect-results'])
+def test_plan_matches_actual_calls(workspace, command):
+    ws = workspace(8, 2)
+    if command == 'collect-results':
+        assert ws.manage('generate-ballot').returncode == 0
+    snapshot = open_snapshot(ws)
+    estimate = manage.plan(command, snapshot, 0, ws.cfg, workers=4)
+    totals = estimate.totals()
+
+    before = Counter(ws.api.calls)
+    process = ws.manage(command, '-w', '4')
+    assert process.returncode == 0, process.stderr
+    actual = ws.api.calls - before
+
+    items = [x for x in process.stdout.splitlines() if x and x != 'Complete.']
+    assert estimate.items == len(items)
+    # 読み込みはスナップショットを再利用する分だけ見積もりより少なくなる
+    assert actual[SHEETS_READ] <= totals.get(SHEETS_READ, 0)
+    for bucket in (SHEETS_WRITE, DRIVE, ZOOM):
+        assert abs(actual[bucket] - totals.get(bucket, 0)) <= 2, bucket
+
+
+def test_resume_reuses_created_ballots(workspace):
+    ws = workspace(6, 2)
+    assert ws.manage('generate-ballot').returncode == 0
+    links = [ws.row(k)[ws.layout.judge:ws.layout.judge+2] for k in range(6)]
+
+    # 対戦表への書き込み前に止まった場合を再現する
+    for k in range(6):
+        for j in range(2):
+            ws.main.sheets[0].values[k+2][ws.layout.judge+j] = f'ジャッジ{k}-{j+1}'
+    ws.main.touch()
+
+    before = Counter(ws.api.calls)
+    process = ws.manage('generate-ballot', '--resume')
+    assert process.returncode == 0, process.stderr
+    assert (ws.api.calls - before)[DRIVE] <= 2
+    assert [ws.row(k)[ws.layout.judge:ws.layout.judge+2] for k in range(6)] == links
+    assert len(ws.votes()) == 12
+
+
+def test_update_ballot_writes_only_changes(workspace):
+    ws = workspace(4, 2)
+    assert ws.manage('generate-ballot').returncode == 0
+    votes = ws.votes()
+
+    process = ws.manage('update-ballot')
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.splitlines() == ['Complete.']
+
+    ws.main.sheets[0].values[3][ws.layout.team] = '変更後のチーム'
+    ws.main.touch()
+    process = ws.manage('update-ballot')
+    assert process.returncode == 0, process.stderr
+    updated = [x for x in process.stdout.splitlines() if x.endswith('(updated)')]
+    assert len(updated) == 2
+    assert all('第2試合' in x for x in updated)
+    assert ws.votes() == votes
+
+
+def test_update_ballot_reuses_vote_row_of_lost_link(workspace):
+    ws = workspace(4, 2)
+    assert ws.manage('generate-ballot').returncode == 0
+    votes = ws.votes()
+    row = next(k for k, vote in enumerate(votes) if vote[0] == '第2試合' and str(vote[1]) == '0')
+
+    ws.main.sheets[0].values[3][ws.layout.judge] = 'ジャッジ1-1'
+    ws.main.touch()
+    process = ws.manage('update-ballot')
+    assert process.returncode == 0, process.stderr
+    assert linked(ws.row(1)[ws.layout.judge])
+
+    ballot_id = HYPERLINK_PATTERN.match(ws.row(1)[ws.layout.judge]).group(1).split('/')[-1]
+    after = ws.votes()
+    assert len(after) == len(votes)
+    assert after[row][0] == '第2試合'
+    assert any(ballot_id in str(cell) for cell in after[row])
+
+
+def test_run_with_workers(workspace):
+    ws = workspace(12, 3, error_rate=0.02, seed=1)
+    process = ws.manage('run', '-w', '4')
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.splitlines()[-1] == 'Complete.'
+
+    for k in range(12):
+        row = ws.row(k)
+        assert row[ws.layout.room_url]
+        assert all(linked(row[ws.layout.judge+j]) for j in range(3))
+        assert all(linked(row[ws.layout.team+j]) for j in range(2))
+        assert linked(row[ws.layout.aggregate])
+    assert sorted((vote[0], str(vote[1])) for vote in ws.votes()) == sorted(
+        (f'第{k+1}試合', str(j)) for k in range(12) for j in range(3))
+
+
+def test_run_steps_follow_the_given_order(workspace):
+    ws = workspace(4, 2)
+    assert ws.manage('generate-room').returncode == 0
+    assert len(ws.api.meetings) == 4
+
+    # 作り直す場合は、削除が終わってから作成する
+    process = ws.manage('run', '--steps', 'clear-room,generate-room', '-w', '4')
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.splitlines()[-1] == 'Complete.'
+    assert all(ws.row(k)[ws.layout.room_url] for k in range(4))
+    assert len(ws.api.meetings) == 4
@@ -0,0 +1,22 @@
+from manifest import Manifest
+
+
+def test_records_are_scoped_by_sheet(tmp_path):
+    day1 = Manifest('main', 100, tmp_path)
+    day2 = Manifest('main', 200, tmp_path)
+    day1.created('ballot', '第1試合', 0, 'b1')
+    day2.finished('ballot', '第1試合', 0, 'b2', 'https://example.com/b2', {'row': 3})
+
+    assert day1.get('ballot', '第1試合')['status'] == Manifest.CREATED
+    assert day2.get('ballot', '第1試合') == {
+        'remote_id': 'b2', 'url': 'https://example.com/b2', 'status': Manifest.FINISHED, 'payload': {'row': 3}}
+
+    day1.finished('ballot', '第1試合', 0, 'b1')
+    day2.remove('ballot', '第1試合')
+    assert day1.get('ballot', '第1試合')['remote_id'] == 'b1'
+    assert day2.get('ballot', '第1試合') is None
+
+
+def test_records_survive_reopening(tmp_path):
+    Manifest('main', 100, tmp_path).finished('room', '第1試合', 0, '123', 'https://zoom.us/j/123')
+    assert Manifest('main', 100, tmp_path).get('room', '第1試合')['remote_id'] == '123'
@@ -0,0 +1,100 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from pipeline import run_jobs, run_steps, WriteBack
+
+
+def worksheet() -> mock.Mock:
+    sheet = mock.Mock()
+    sheet.title = 'Sheet1'
+    return sheet
+
+
+def test_run_jobs_keeps_input_order():
+    def job(k: int) -> int:
+        time.sleep(0.01 * (5 - k))
+        return k * 10
+
+    assert list(run_jobs(job, [(k,) for k in range(5)], 4)) == [0, 10, 20, 30, 40]
+
+
+def test_run_steps_waits_for_dependencies():
+    finished = []
+    lock = threading.Lock()
+
+    def step(name: str):
+        time.sleep(0.01)
+        with lock:
+            finished.append(name)
+
+    steps = {name: (lambda name=name: step(name)) for name in ('a', 'b', 'c')}
+    assert run_steps(steps, {'c': ['a', 'b']})[-1] == 'c'
+    assert finished[-1] == 'c'
+
+
+def test_run_steps_skips_dependents_of_failed_steps():
+    def fail():
+        raise ValueError('failed')
+
+    steps = {'a': fail, 'b': mock.Mock(), 'c': mock.Mock()}
+    with pytest.raises(RuntimeError):
+        run_steps(steps, {'c': ['a']})
+    steps['b'].assert_called_once()
+    steps['c'].assert_not_called()
+
+
+def test_write_back_flushes_every_chunk_rows():
+    sheet = worksheet()
+    with WriteBack(sheet, chunk_rows=2, chunk_seconds=60) as write_back:
+        for k in range(5):
+            write_back.put(f'A{k+1}', [[k]])
+    assert [len(call.args[0]) for call in sheet.batch_update.call_args_list] == [2, 2, 1]
+
+
+def test_write_back_flushes_on_deadline_while_idle():
+    sheet = worksheet()
+    with WriteBack(sheet, chunk_rows=100, chunk_seconds=0.1) as write_back:
+        write_back.put('A1', [[1]])
+        # 次の put が無くても、経過時間で書き込まれる
+        time.sleep(0.5)
+        assert sheet.batch_update.call_count == 1
+    assert sheet.batch_update.call_count == 1
+
+
+def test_write_back_keeps_values_on_failure():
+    sheet = worksheet()
+    sheet.batch_update.side_effect = [RuntimeError('quota'), None]
+    on_flush = mock.Mock()
+    write_back = WriteBack(sheet, chunk_rows=100, chunk_seconds=60, on_flush=on_flush)
+    write_back.put('A1', [[1]])
+    with pytest.raises(RuntimeError):
+        write_back.flush()
+    assert write_back.pending == [{'range': 'A1', 'values': [[1]]}]
+    on_flush.assert_not_called()
+
+    write_back.flush()
+    assert write_back.pending == []
+    assert sheet.batch_update.call_args.args[0] == [{'range': 'A1', 'values': [[1]]}]
+    on_flush.assert_called_once()
+
+
+def test_write_back_does_not_hide_the_original_error():
+    sheet = worksheet()
+    sheet.batch_update.side_effect = RuntimeError('quota')
+    with pytest.raises(ValueError) as raised:
+        with WriteBack(sheet, chunk_rows=100, chunk_seconds=60) as write_back:
+            write_back.put('A1', [[1]])
+            raise ValueError('job failed')
+    assert 'quota' in raised.value.__notes__[0]
+
+
+def test_write_back_flushes_remaining_values_on_error():
+    sheet = worksheet()
+    with pytest.raises(ValueError):
+        with WriteBack(sheet, chunk_rows=100, chunk_seconds=60) as write_back:
+            write_back.put('A1', [[1]])
+            raise ValueError('job failed')
+    sheet.batch_update.assert_called_once()
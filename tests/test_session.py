@@ -0,0 +1,94 @@
+import io
+import threading
+import time
+from unittest import mock
+
+from requests import Response, Session
+
+from session import Governor
+
+
+def response(status: int, headers=None, body: bytes = b'{}') -> Response:
+    result = Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    result._content = body
+    result.raw = io.BytesIO(body)
+    return result
+
+
+def test_governor_halves_limit_once_per_cooldown():
+    governor = Governor(8)
+    for _ in range(2):
+        governor.acquire()
+    governor.release(True)
+    governor.release(True)
+    assert governor.limit == 4.0
+
+
+def test_governor_recovers_additively():
+    governor = Governor(4)
+    governor.acquire()
+    governor.release(True)
+    assert governor.limit == 2.0
+    for _ in range(20):
+        governor.acquire()
+        governor.release(False)
+    assert governor.limit == 4.0
+
+
+def test_governor_ignores_failed_requests():
+    governor = Governor(4)
+    governor.acquire()
+    governor.release(None)
+    assert governor.limit == 4.0
+    assert governor.active == 0
+
+
+def test_governor_blocks_above_limit():
+    governor = Governor(2)
+    governor.acquire()
+    governor.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        governor.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    governor.release(False)
+    assert acquired.wait(1.0)
+    thread.join()
+
+
+def test_is_throttled():
+    assert Governor.is_throttled(response(429))
+    assert not Governor.is_throttled(response(429, {'X-RateLimit-Type': 'Daily-limit'}))
+    assert Governor.is_throttled(response(403, body=b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'))
+    assert not Governor.is_throttled(response(403, body=b'{"error": {"errors": [{"reason": "forbidden"}]}}'))
+    assert not Governor.is_throttled(response(200))
+
+
+def test_retry_after():
+    assert Governor.retry_after(response(429, {'Retry-After': '3'}), 0) == 3.0
+    assert 0.5 <= Governor.retry_after(response(429), 0) <= 1.5
+    assert Governor.retry_after(response(429), 20) <= Governor.MAX_DELAY * 1.5
+
+
+def test_instrument_retries_throttled_requests():
+    session = Session()
+    replies = [response(429, {'Retry-After': '0'}), response(429, {'Retry-After': '0'}), response(200)]
+    send = mock.Mock(side_effect=replies)
+    session.send = send
+    governor = Governor(4)
+    governor.instrument(session)
+
+    start = time.monotonic()
+    assert session.send(mock.Mock()).status_code == 200
+    assert send.call_count == 3
+    assert time.monotonic() - start < 1.0
+    # 2回の 429 で半分になるのは1回だけで、成功で 1/上限 戻る
+    assert governor.limit == 2.5
+    assert governor.active == 0
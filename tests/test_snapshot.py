@@ -0,0 +1,79 @@
+import threading
+
+from plan import SHEETS_READ
+from session import open_client
+from snapshot import Snapshot
+
+
+def open_snapshot(ws) -> Snapshot:
+    return Snapshot.open(open_client(ws.directory / 'key.json'), 'main')
+
+
+def test_values_are_reused_until_the_spreadsheet_changes(workspace):
+    ws = workspace()
+    snapshot = open_snapshot(ws)
+    snapshot.values(0)
+    reads = ws.api.calls[SHEETS_READ]
+
+    assert snapshot.values(0)[2][0] == '第1試合'
+    # 別のコマンドの実行でも、保存した内容を再利用する
+    assert Snapshot(snapshot.client, 'main').values(0)[2][0] == '第1試合'
+    assert ws.api.calls[SHEETS_READ] == reads
+
+    ws.main.sheets[0].values[2][0] = '変更'
+    ws.main.touch()
+    snapshot.refresh()
+    assert snapshot.values(0)[2][0] == '変更'
+    # メタデータと値を取得し直す
+    assert ws.api.calls[SHEETS_READ] == reads + 2
+
+
+def test_invalidate_keeps_metadata(workspace):
+    ws = workspace()
+    snapshot = open_snapshot(ws)
+    snapshot.values(0)
+    reads = ws.api.calls[SHEETS_READ]
+
+    snapshot.invalidate(4)
+    ws.main.touch()
+    snapshot.refresh()
+    snapshot.titles()
+    snapshot.worksheet(4)
+    assert ws.api.calls[SHEETS_READ] == reads
+    snapshot.values(0)
+    assert ws.api.calls[SHEETS_READ] == reads + 1
+
+    snapshot.invalidate(4, metadata=True)
+    snapshot.titles()
+    assert ws.api.calls[SHEETS_READ] == reads + 2
+
+
+def test_refresh_waits_for_worksheet(workspace, monkeypatch):
+    ws = workspace()
+    snapshot = open_snapshot(ws)
+    snapshot.invalidate(4, metadata=True)
+    fetched = threading.Event()
+    refreshed = threading.Event()
+    fetch_metadata = snapshot._fetch_metadata
+    titles = []
+
+    def fetch_metadata_and_wait():
+        # メタデータを取得した直後に、別のスレッドで refresh させる
+        fetch_metadata()
+        if threading.current_thread() is reader:
+            fetched.set()
+            refreshed.wait(0.5)
+
+    def read():
+        titles.append(snapshot.worksheet(4).title)
+
+    monkeypatch.setattr(snapshot, '_fetch_metadata', fetch_metadata_and_wait)
+    reader = threading.Thread(target=read)
+    reader.start()
+    assert fetched.wait(5.0)
+    ws.main.touch()
+    snapshot.refresh()
+    refreshed.set()
+    reader.join()
+    assert titles == ['投票']
+    assert not list(ws.directory.glob('.cache/*.tmp'))
@@ -0,0 +1,86 @@
+import json
+from unittest import mock
+
+import pytest
+from gspread import Worksheet
+from gspread.http_client import HTTPClient
+
+from worksheet import RequestBatch, WorksheetEx
+
+
+def spreadsheet(file_id: str = 'book') -> mock.Mock:
+    book = mock.Mock()
+    book.id = file_id
+    return book
+
+
+def worksheet(book: mock.Mock, sheet_id: int) -> WorksheetEx:
+    properties = {'sheetId': sheet_id, 'title': f'Sheet{sheet_id}', 'index': sheet_id}
+    return WorksheetEx.cast(Worksheet(book, properties, book.id, mock.Mock(spec=HTTPClient)))
+
+
+def sent(book: mock.Mock) -> list:
+    return [call.args[0]['requests'] for call in book.batch_update.call_args_list]
+
+
+def test_batch_sends_queued_requests_in_order():
+    book = spreadsheet()
+    sheet = worksheet(book, 0)
+    with sheet.batch():
+        sheet.set_dimention_size('COLUMNS', 0, 1, 100)
+        sheet.clear_freeze()
+        sheet.set_dimention_size('ROWS', 2, 3, 21)
+        book.batch_update.assert_not_called()
+
+    assert [list(request) for request in sent(book)[0]] == [
+        ['updateDimensionProperties'], ['updateSheetProperties'], ['updateDimensionProperties']]
+    assert sent(book)[0][2]['updateDimensionProperties']['range']['dimension'] == 'ROWS'
+    assert book.batch_update.call_count == 1
+
+
+def test_batch_splits_requests_over_max_bytes():
+    book = spreadsheet()
+    sheet = worksheet(book, 0)
+    with sheet.batch():
+        sheet.clear_freeze()
+        request = RequestBatch.current(book.id).requests[0]
+    length = len(json.dumps(request, ensure_ascii=False).encode('utf-8')) + 1
+    book.batch_update.reset_mock()
+
+    with RequestBatch(book, max_bytes=length * 2):
+        for _ in range(5):
+            sheet.clear_freeze()
+    assert [len(requests) for requests in sent(book)] == [2, 2, 1]
+
+
+def test_batch_is_shared_by_worksheets_of_the_same_spreadsheet():
+    book = spreadsheet()
+    other = spreadsheet('other')
+    first, second = worksheet(book, 0), worksheet(book, 1)
+    with first.batch():
+        first.clear_freeze()
+        with second.batch():
+            second.clear_freeze()
+        # 内側の with を抜けても送信しない
+        book.batch_update.assert_not_called()
+        # 別のスプレッドシートはすぐに送信する
+        worksheet(other, 0).clear_freeze()
+        assert other.batch_update.call_count == 1
+
+    assert [request['updateSheetProperties']['properties']['sheetId'] for request in sent(book)[0]] == [0, 1]
+    assert book.batch_update.call_count == 1
+
+
+def test_batch_sends_nothing_when_the_block_raises():
+    book = spreadsheet()
+    sheet = worksheet(book, 0)
+    with pytest.raises(ValueError):
+        with sheet.batch():
+            sheet.clear_freeze()
+            raise ValueError('failed')
+    book.batch_update.assert_not_called()
+    assert RequestBatch.current(book.id) is None
+
+    # バッチの外ではすぐに送信する
+    sheet.clear_freeze()
+    assert len(sent(book)) == 1
@@ -0,0 +1,44 @@
+import json
+from unittest import mock
+
+from zoom import MeetingScheduler, ZoomRateLimitError
+
+
+def client() -> mock.Mock:
+    result = mock.Mock(account_id='account')
+    result.create_meeting.return_value.json.return_value = {'id': 1}
+    return result
+
+
+def create(scheduler: MeetingScheduler, meetings) -> list:
+    errors = []
+    scheduler.create_meetings(meetings, lambda index, data, error: errors.append(error))
+    return errors
+
+
+def test_daily_limit_is_shared_between_runs(tmp_path):
+    counts = tmp_path / 'zoom-meetings.json'
+    zoom = client()
+    assert create(MeetingScheduler(zoom, 2, rate=1000, daily_limit=3, counts=counts), [('u1', {})] * 2) == [None, None]
+
+    errors = create(MeetingScheduler(zoom, 2, rate=1000, daily_limit=3, counts=counts), [('u1', {})] * 2 + [('u2', {})])
+    assert errors.count(None) == 2
+    assert any(isinstance(error, RuntimeError) for error in errors)
+    assert json.loads(counts.read_text(encoding='utf-8'))['created'] == {'u1': 3, 'u2': 1}
+
+
+def test_counts_of_another_day_are_ignored(tmp_path):
+    counts = tmp_path / 'zoom-meetings.json'
+    counts.write_text(json.dumps({'account_id': 'account', 'date': '2000-01-01', 'created': {'u1': 3}}), encoding='utf-8')
+    assert create(MeetingScheduler(client(), 1, rate=1000, daily_limit=3, counts=counts), [('u1', {})]) == [None]
+
+
+def test_daily_limit_error_stops_the_user(tmp_path):
+    counts = tmp_path / 'zoom-meetings.json'
+    zoom = client()
+    zoom.create_meeting.side_effect = ZoomRateLimitError(mock.Mock(status_code=429, text='daily limit'))
+    errors = create(MeetingScheduler(zoom, 1, rate=1000, daily_limit=100, counts=counts), [('u1', {})] * 3)
+    assert zoom.create_meeting.call_count == 1
+    assert isinstance(errors[0], ZoomRateLimitError)
+    assert all(isinstance(error, RuntimeError) for error in errors[1:])
+    assert json.loads(counts.read_text(encoding='utf-8'))['created'] == {'u1': 100}
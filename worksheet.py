@@ -1,8 +1,103 @@
+import json
+import threading
 from typing import Union, List, Dict, Any
-from gspread import Worksheet
+from gspread import Spreadsheet, Worksheet
 import gspread.utils as gsutils
 
 
+class RequestBatch:
+    """同じスプレッドシートへの batchUpdate のリクエストを溜めて、まとめて送信する
+
+    ``with`` の中では、同じスレッドから同じスプレッドシートの WorksheetEx に対して呼び出した
+    ``add_protected_range`` 等のリクエストを送信せずに順に溜め、``with`` を抜ける時に送信する。
+    リクエストボディが ``MAX_BYTES`` を超える場合は、順序を保ったまま複数回の batchUpdate に分ける。
+    ``with`` の中で例外が発生した場合は送信しない。
+    """
+
+    # batchUpdate のリクエストボディの上限 (10MB) に余裕を持たせた値
+    MAX_BYTES = 8 * 1024 * 1024
+
+    _local = threading.local()
+
+    def __init__(self, spreadsheet: Spreadsheet, max_bytes: int = MAX_BYTES):
+        """
+        :param spreadsheet: 送信先のスプレッドシート
+        :type spreadsheet: Spreadsheet
+        :param max_bytes: 1回の batchUpdate のリクエストボディの上限, defaults to MAX_BYTES
+        :type max_bytes: int, optional
+        """
+        self.spreadsheet = spreadsheet
+        self.max_bytes = max_bytes
+        self.requests: List[Dict[str, Any]] = []
+        self.outer = None
+
+    @classmethod
+    def current(cls, spreadsheet_id: str) -> Union['RequestBatch', None]:
+        """実行中のスレッドで開始しているバッチを取得する
+
+        :param spreadsheet_id: スプレッドシートID
+        :type spreadsheet_id: str
+        :return: バッチ. 開始していない場合は None
+        :rtype: Union[RequestBatch, None]
+        """
+        return getattr(cls._local, 'batches', {}).get(spreadsheet_id)
+
+    def __enter__(self) -> 'RequestBatch':
+        batches = RequestBatch._local.__dict__.setdefault('batches', {})
+        # 同じスプレッドシートのバッチが開始済みであれば、そちらに溜める
+        self.outer = batches.get(self.spreadsheet.id)
+        if self.outer is not None:
+            return self.outer
+        batches[self.spreadsheet.id] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.outer is not None:
+            self.outer = None
+            return False
+        del RequestBatch._local.batches[self.spreadsheet.id]
+        if exc_type is None:
+            self.send()
+        else:
+            self.requests = []
+        return False
+
+    def add(self, request: Dict[str, Any]):
+        """リクエストを溜める
+
+        :param request: batchUpdate のリクエスト
+        :type request: Dict[str, Any]
+        """
+        self.requests.append(request)
+
+    def chunks(self) -> List[List[Dict[str, Any]]]:
+        """溜めたリクエストを、リクエストボディが上限に収まるように順に区切る
+
+        :return: 1回の batchUpdate で送信するリクエストのリストのリスト
+        :rtype: List[List[Dict[str, Any]]]
+        """
+        chunks = []
+        chunk = []
+        size = 0
+        for request in self.requests:
+            length = len(json.dumps(request, ensure_ascii=False).encode('utf-8')) + 1
+            if len(chunk) > 0 and size + length > self.max_bytes:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(request)
+            size += length
+        if len(chunk) > 0:
+            chunks.append(chunk)
+        return chunks
+
+    def send(self):
+        """溜めたリクエストを送信する"""
+        for chunk in self.chunks():
+            self.spreadsheet.batch_update({'requests': chunk})
+        self.requests = []
+
+
 class WorksheetEx(Worksheet):
     """gspread.models.Worksheet の拡張"""
 
@@ -21,6 +116,24 @@ class WorksheetEx(Worksheet):
         obj.__class__ = cls
         return obj
 
+    def batch(self) -> RequestBatch:
+        """このシートのスプレッドシートへのリクエストをまとめて送信するバッチを開始する
+
+        ``with sheet.batch():`` の中では、同じスプレッドシートの他のシートへのリクエストもまとめて送信する。
+
+        :return: バッチ
+        :rtype: RequestBatch
+        """
+        return RequestBatch(self.spreadsheet)
+
+    def _batch_update(self, requests: List[Dict[str, Any]]):
+        batch = RequestBatch.current(self.spreadsheet.id)
+        if batch is not None:
+            for request in requests:
+                batch.add(request)
+        else:
+            self.spreadsheet.batch_update({'requests': requests})
+
     @gsutils.cast_to_a1_notation
     def add_protected_range(
         self,
@@ -84,7 +197,7 @@ class WorksheetEx(Worksheet):
             ]
         }
 
-        self.spreadsheet.batch_update(body)
+        self._batch_update(body['requests'])
 
     def get_protected_ranges(self) -> List[Dict[str, Any]]:
         """保護された範囲のリストを取得する
@@ -114,9 +227,7 @@ class WorksheetEx(Worksheet):
         if ids is None:
             ids = [range['protectedRangeId'] for range in self.get_protected_ranges()]
         if len(ids) > 0:
-            self.spreadsheet.batch_update({
-                "requests": [{"deleteProtectedRange": {"protectedRangeId": id}} for id in ids]
-            })
+            self._batch_update([{"deleteProtectedRange": {"protectedRangeId": id}} for id in ids])
 
     class ConditionType:
         """条件付き書式のタイプ定義"""
@@ -363,39 +474,35 @@ class WorksheetEx(Worksheet):
             else:
                 cv.append({'userEnteredValue': str(v)})
 
-        self.spreadsheet.batch_update({
-            "requests": [{
-                "addConditionalFormatRule": {
-                    "rule": {
-                        'ranges': [grid_range],
-                        'booleanRule': {
-                            'condition': {
-                                'type': cond_type,
-                                'values': cv
-                            },
-                            'format': cond_format
-                        }
-                    },
-                    'index': 0
-                }
-            }]
-        })
+        self._batch_update([{
+            "addConditionalFormatRule": {
+                "rule": {
+                    'ranges': [grid_range],
+                    'booleanRule': {
+                        'condition': {
+                            'type': cond_type,
+                            'values': cv
+                        },
+                        'format': cond_format
+                    }
+                },
+                'index': 0
+            }
+        }])
 
     @gsutils.cast_to_a1_notation
     def add_gradient_format(self, name: str, grad_rule: Dict[str, Any]):
         grid_range = gsutils.a1_range_to_grid_range(name, self.id)
 
-        self.spreadsheet.batch_update({
-            "requests": [{
-                "addConditionalFormatRule": {
-                    "rule": {
-                        'ranges': [grid_range],
-                        'gradientRule': grad_rule
-                    },
-                    'index': 0
-                }
-            }]
-        })
+        self._batch_update([{
+            "addConditionalFormatRule": {
+                "rule": {
+                    'ranges': [grid_range],
+                    'gradientRule': grad_rule
+                },
+                'index': 0
+            }
+        }])
 
     @gsutils.cast_to_a1_notation
     def set_data_validation(self, name: str, cond_type: str, cond_values: List[Union[int, float, str]],
@@ -416,6 +523,33 @@ class WorksheetEx(Worksheet):
         :type custom_ui: bool, optional
         """
         grid_range = gsutils.a1_range_to_grid_range(name, self.id)
+        rule = WorksheetEx.data_validation_rule(cond_type, cond_values, message, strict, custom_ui)
+
+        self._batch_update([{
+            "setDataValidation": {
+                'range': grid_range,
+                "rule": rule
+            }
+        }])
+
+    @staticmethod
+    def data_validation_rule(cond_type: str, cond_values: List[Union[int, float, str]],
+                             message: Union[str, None] = None, strict: bool = False, custom_ui: bool = False) -> Dict[str, Any]:
+        """データの入力規則 (DataValidationRule) を組み立てる
+
+        :param cond_type: 条件のタイプ
+        :type cond_type: str
+        :param cond_values: 条件の値
+        :type cond_values: List[Union[int, float, str]]
+        :param message: 入力時に表示するメッセージ, defaults to None
+        :type message: Union[str, None], optional
+        :param strict: 条件に一致しない値を拒否する, defaults to False
+        :type strict: bool, optional
+        :param custom_ui: プルダウンリストを表示する, defaults to False
+        :type custom_ui: bool, optional
+        :return: DataValidationRule
+        :rtype: Dict[str, Any]
+        """
         cv = []
         for v in cond_values:
             if v in WorksheetEx.relativedate.__dict__.keys():
@@ -436,45 +570,34 @@ class WorksheetEx(Worksheet):
         if message is not None:
             rule['inputMessage'] = message
 
-        self.spreadsheet.batch_update({
-            "requests": [{
-                "setDataValidation": {
-                    'range': grid_range,
-                    "rule": rule
-                }
-            }]
-        })
+        return rule
 
     def set_dimention_size(self, dimention: str, start: int, end: int, size: int):
-        self.spreadsheet.batch_update({
-            'requests': [{
-                'updateDimensionProperties': {
-                    'range': {
-                        'sheetId': self.id,
-                        'dimension': dimention,
-                        'startIndex': start,
-                        'endIndex': end+1
-                    },
-                    'fields': '*',
-                    'properties': {
-                        'pixelSize': size
-                    }
+        self._batch_update([{
+            'updateDimensionProperties': {
+                'range': {
+                    'sheetId': self.id,
+                    'dimension': dimention,
+                    'startIndex': start,
+                    'endIndex': end+1
+                },
+                'fields': '*',
+                'properties': {
+                    'pixelSize': size
                 }
-            }]
-        })
+            }
+        }])
 
     def clear_freeze(self):
-        self.spreadsheet.batch_update({
-            'requests': [{
-                'updateSheetProperties': {
-                    'properties': {
-                        'sheetId': self.id,
-                        'gridProperties': {
-                            'frozenRowCount': 0,
-                            'frozenColumnCount': 0
-                        }
-                    },
-                    'fields': 'gridProperties/frozenRowCount,gridProperties/frozenColumnCount'
-                }
-            }]
-        })
+        self._batch_update([{
+            'updateSheetProperties': {
+                'properties': {
+                    'sheetId': self.id,
+                    'gridProperties': {
+                        'frozenRowCount': 0,
+                        'frozenColumnCount': 0
+                    }
+                },
+                'fields': 'gridProperties/frozenRowCount,gridProperties/frozenColumnCount'
+            }
+        }])
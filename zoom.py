@@ -1,75 +1,221 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union, Tuple, Callable
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import requests
 import base64
+import json
+import os
+import threading
+import time
+
+from metrics import metrics
+from session import Governor, create_adapter
+
+
+class ZoomRateLimitError(RuntimeError):
+    """日毎の上限に達したため、当日中は再試行できないことを示す例外"""
+
+    def __init__(self, response: requests.Response):
+        super().__init__(f'Zoom API daily rate limit reached: {response.request.method} {response.url}')
+        self.response = response
+
+
+class RateLimiter:
+    """1秒あたりのリクエスト数を制限するトークンバケット"""
+
+    def __init__(self, rate: float, burst: Union[int, None] = None):
+        """
+        :param rate: 1秒あたりのリクエスト数
+        :type rate: float
+        :param burst: 連続して送信できるリクエスト数. None の場合は rate と同じ, defaults to None
+        :type burst: Union[int, None], optional
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """リクエストを1件送信できるようになるまで待機する"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 
 class Zoom:
 
     BASE_URL = 'https://zoom.us'
     API_URL = 'https://api.zoom.us/v2'
+    POOL_SIZE = 10
+    TOKEN_MARGIN = 60
+    PAGE_SIZE = 300
 
     def __init__(
             self,
             client_id: str, client_secret: str,
-            account_id: str):
+            account_id: str,
+            token_cache: Union[Path, None] = None,
+            pool_size: int = POOL_SIZE):
+        """
+        :param client_id: Client ID
+        :type client_id: str
+        :param client_secret: Client Secret
+        :type client_secret: str
+        :param account_id: Account ID
+        :type account_id: str
+        :param token_cache: アクセストークンを保存するファイル. None の場合は保存しない, defaults to None
+        :type token_cache: Union[Path, None], optional
+        :param pool_size: コネクションプールの大きさ, defaults to POOL_SIZE
+        :type pool_size: int, optional
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.account_id = account_id
+        self.token_cache = Path(token_cache) if token_cache is not None else None
+
+        self.session = requests.Session()
+        self.session.mount('https://', create_adapter(pool_size))
+        metrics.instrument(self.session)
+        self.governor = Governor(pool_size)
+        self.governor.instrument(self.session)
+
+        self.token = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+        if not self._load_token():
+            self._fetch_token()
 
-        auth = base64.b64encode(f'{client_id}:{client_secret}'.encode()).decode()
+    def _load_token(self) -> bool:
+        if self.token_cache is None or not self.token_cache.exists():
+            return False
+
+        try:
+            with open(self.token_cache, encoding='utf-8') as ifp:
+                js = json.load(ifp)
+        except (OSError, ValueError):
+            return False
+
+        if js.get('account_id') != self.account_id or js.get('client_id') != self.client_id:
+            return False
+        if js.get('expires_at', 0) - Zoom.TOKEN_MARGIN <= time.time():
+            return False
+
+        self.token = js['access_token']
+        self.expires_at = js['expires_at']
+        return True
+
+    def _save_token(self):
+        if self.token_cache is None:
+            return
+
+        tmp = self.token_cache.with_name(self.token_cache.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as ofp:
+            json.dump({
+                'account_id': self.account_id,
+                'client_id': self.client_id,
+                'access_token': self.token,
+                'expires_at': self.expires_at,
+            }, ofp)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.token_cache)
+
+    def _fetch_token(self):
+        auth = base64.b64encode(f'{self.client_id}:{self.client_secret}'.encode()).decode()
         url = f'{Zoom.BASE_URL}/oauth/token'
         params = {
             'grant_type': 'account_credentials',
-            'account_id': account_id,
+            'account_id': self.account_id,
         }
         header = {
             'Authorization': f'Basic {auth}'
         }
-        response = requests.post(url, params=params, headers=header)
+        response = self.session.post(url, params=params, headers=header)
         if response.ok:
             js = response.json()
             self.token = js['access_token']
+            self.expires_at = time.time() + js.get('expires_in', 3600)
+            self._save_token()
         else:
             response.raise_for_status()
 
-    def get_users(self, **kwargs) -> List[Dict[str, Any]]:
-        users = []
-        url = f'{Zoom.API_URL}/users'
-        header = {
-            'Authorization': f'Bearer {self.token}'
-        }
-        params = {}
+    def _get_token(self, expired: Union[str, None] = None) -> str:
+        with self._lock:
+            if self.token == expired or self.expires_at - Zoom.TOKEN_MARGIN <= time.time():
+                self._fetch_token()
+            return self.token
 
-        if 'status' in kwargs:
-            params['status'] = kwargs['status']
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """API を呼び出す
 
-        page_count = None
-        page_number = None
+        アクセストークンが失効していた場合 (401) は、トークンを再取得して1回だけ再試行する。
+        レート制限 (429) の待機と再送は ``Governor`` が行い、日毎の上限に達した場合は ``ZoomRateLimitError`` を送出する。
+        """
+        refreshed = False
+        while True:
+            token = self._get_token()
+            response = self.session.request(method, url, headers={'Authorization': f'Bearer {token}'}, **kwargs)
 
-        while page_count is None or page_number < page_count:
-            if page_count is not None and page_number is not None:
-                page_number += 1
-                params['page_number'] = page_number
+            if response.status_code == 401 and not refreshed:
+                self._get_token(expired=token)
+                refreshed = True
+                continue
 
-            if len(params) > 0:
-                response = requests.get(url, params=params, headers=header)
-            else:
-                response = requests.get(url, headers=header)
+            if response.status_code == 429 and response.headers.get('X-RateLimit-Type', '').lower() == 'daily-limit':
+                raise ZoomRateLimitError(response)
+
+            return response
 
+    def get_users(self, workers: int = 1, **kwargs) -> List[Dict[str, Any]]:
+        """ユーザーの一覧を取得する
+
+        最大のページサイズで1ページ目を取得し、``page_count`` が判明した後は残りのページを並行して取得する。
+
+        :param workers: 並行数, defaults to 1
+        :type workers: int, optional
+        :return: ユーザーのリスト
+        :rtype: List[Dict[str, Any]]
+        """
+        url = f'{Zoom.API_URL}/users'
+        params = {'page_size': Zoom.PAGE_SIZE}
+
+        if 'status' in kwargs:
+            params['status'] = kwargs['status']
+
+        def get_page(page_number: int) -> Dict[str, Any]:
+            response = self._request('get', url, params={**params, 'page_number': page_number})
             if response.ok:
-                js = response.json()
-                page_count = js['page_count']
-                page_number = js['page_number']
-                users.extend(js['users'])
+                return response.json()
             else:
                 response.raise_for_status()
 
+        js = get_page(1)
+        users = list(js['users'])
+        pages = range(2, js['page_count'] + 1)
+
+        if workers <= 1:
+            for page in map(get_page, pages):
+                users.extend(page['users'])
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for page in executor.map(get_page, pages):
+                    users.extend(page['users'])
+
         return users
 
     def get_meeting(self, id: str) -> List[Dict[str, Any]]:
         url = f'{Zoom.API_URL}/meetings/{id}'
-        header = {
-            'Authorization': f'Bearer {self.token}'
-        }
-        response = requests.get(url, headers=header)
+        response = self._request('get', url)
         if response.ok:
             return response.json()
         else:
@@ -77,22 +223,25 @@ class Zoom:
 
     def create_meeting(self, user_id: str, body: Dict[str, Any]) -> requests.Response:
         url = f'{Zoom.API_URL}/users/{user_id}/meetings'
-        header = {
-            'Authorization': f'Bearer {self.token}',
-        }
-        response = requests.post(url, headers=header, json=body)
+        response = self._request('post', url, json=body)
         if response.ok:
             return response
         else:
             response.raise_for_status()
 
-    def delete_meeting(self, id: str) -> bool:
+    def delete_meeting(self, id: str, missing_ok: bool = False) -> bool:
+        """ミーティングを削除する
+
+        :param id: ミーティングID
+        :type id: str
+        :param missing_ok: 削除済み (404) の場合も成功とみなす, defaults to False
+        :type missing_ok: bool, optional
+        :return: 削除できた場合は True
+        :rtype: bool
+        """
         url = f'{Zoom.API_URL}/meetings/{id}'
-        header = {
-            'Authorization': f'Bearer {self.token}'
-        }
-        response = requests.delete(url, headers=header)
-        if response.ok:
+        response = self._request('delete', url)
+        if response.ok or (missing_ok and response.status_code == 404):
             return True
         else:
             response.raise_for_status()
@@ -102,16 +251,268 @@ class Zoom:
             stream_url: str, stream_key: str, page_url: str) -> bool:
 
         url = f'{Zoom.API_URL}/meetings/{meeting_id}/livestream'
-        header = {
-            'Authorization': f'Bearer {self.token}'
-        }
         body = {
             'stream_url': stream_url,
             'stream_key': stream_key,
             'page_url': page_url,
         }
-        response = requests.patch(url, headers=header, json=body)
+        response = self._request('patch', url, json=body)
         if response.ok:
             return True
         else:
             response.raise_for_status()
+
+
+class UserDirectory:
+    """メールアドレスで引ける Zoom ユーザーの一覧
+
+    ユーザーの一覧はローカルのファイルにキャッシュし、有効期間内であれば Zoom API を呼び出さずに再利用する。
+    """
+
+    TTL = 3600
+
+    def __init__(self, client: Zoom, cache: Union[Path, None] = None, ttl: float = TTL, workers: int = 1):
+        """
+        :param client: Zoom API のクライアント
+        :type client: Zoom
+        :param cache: キャッシュファイル. None の場合はキャッシュしない, defaults to None
+        :type cache: Union[Path, None], optional
+        :param ttl: キャッシュの有効期間 (秒), defaults to TTL
+        :type ttl: float, optional
+        :param workers: ページを並行して取得する数, defaults to 1
+        :type workers: int, optional
+        """
+        self.client = client
+        self.cache = Path(cache) if cache is not None else None
+        self.ttl = ttl
+        self.workers = workers
+        self.users = None
+        self.index = {}
+
+    def load(self, refresh: bool = False) -> 'UserDirectory':
+        """ユーザーの一覧を読み込む
+
+        :param refresh: キャッシュを使わずに取得し直す, defaults to False
+        :type refresh: bool, optional
+        :return: 自身
+        :rtype: UserDirectory
+        """
+        users = None if refresh else self._load_cache()
+        if users is None:
+            users = self.client.get_users(workers=self.workers)
+            self._save_cache(users)
+
+        self.users = users
+        self.index = {user['email'].lower(): user for user in users if user.get('email')}
+        return self
+
+    def find(self, email: str) -> Union[Dict[str, Any], None]:
+        """メールアドレスでユーザーを検索する
+
+        :param email: メールアドレス
+        :type email: str
+        :return: ユーザー. 見つからない場合は None
+        :rtype: Union[Dict[str, Any], None]
+        """
+        if self.users is None:
+            self.load()
+        return self.index.get(email.strip().lower()) if email else None
+
+    def _load_cache(self) -> Union[List[Dict[str, Any]], None]:
+        if self.cache is None or not self.cache.exists():
+            return None
+
+        try:
+            with open(self.cache, encoding='utf-8') as ifp:
+                js = json.load(ifp)
+        except (OSError, ValueError):
+            return None
+
+        if js.get('account_id') != self.client.account_id:
+            return None
+        if js.get('fetched_at', 0) + self.ttl <= time.time():
+            return None
+        return js['users']
+
+    def _save_cache(self, users: List[Dict[str, Any]]):
+        if self.cache is None:
+            return
+
+        tmp = self.cache.with_name(self.cache.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as ofp:
+            json.dump({
+                'account_id': self.client.account_id,
+                'fetched_at': time.time(),
+                'users': users,
+            }, ofp, ensure_ascii=False)
+        os.replace(tmp, self.cache)
+
+
+class MeetingScheduler:
+    """ミーティングの作成・削除を並行して実行する
+
+    作成は、同じホストユーザーのミーティングは順番に、異なるホストユーザーの間で並行させる。
+    アカウント全体の1秒あたりの上限と、ホストユーザー毎の1日あたりの作成数の上限を守る。
+    1日あたりの作成数は日付 (Zoom の上限と同じく UTC) と共にファイルに保存し、同じ日の別のコマンド実行でも引き継ぐ。
+    結果を受け取る関数は同時には呼び出さないため、関数の中で表示やシートへの書き込みをしてよい。
+    """
+
+    RATE = 10
+    DAILY_LIMIT = 100
+
+    def __init__(self, client: Zoom, workers: int = 1, rate: float = RATE, daily_limit: int = DAILY_LIMIT,
+                 counts: Union[Path, None] = None):
+        """
+        :param client: Zoom API のクライアント
+        :type client: Zoom
+        :param workers: 並行数, defaults to 1
+        :type workers: int, optional
+        :param rate: 1秒あたりの作成数の上限, defaults to RATE
+        :type rate: float, optional
+        :param daily_limit: ホストユーザー毎の1日あたりの作成数の上限, defaults to DAILY_LIMIT
+        :type daily_limit: int, optional
+        :param counts: 1日あたりの作成数の保存先. None の場合はこの実行の中だけで数える, defaults to None
+        :type counts: Union[Path, None], optional
+        """
+        self.client = client
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.daily_limit = daily_limit
+        self.counts = Path(counts) if counts is not None else None
+        self._result_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._date = self._today()
+        self._created = self._load_counts()
+
+    def _notify(self, on_result: Callable[..., None], *args):
+        with self._result_lock:
+            on_result(*args)
+
+    def create_meetings(
+            self,
+            meetings: List[Tuple[str, Dict[str, Any]]],
+            on_result: Callable[[int, Union[Dict[str, Any], None], Union[Exception, None]], None]):
+        """ミーティングを作成する
+
+        結果は1件作成する毎に ``on_result(index, data, error)`` で通知する。
+        作成に失敗した場合は ``data`` が None で、``error`` に例外が入る。
+
+        :param meetings: (ホストユーザーID, リクエストボディ) のリスト
+        :type meetings: List[Tuple[str, Dict[str, Any]]]
+        :param on_result: 結果を受け取る関数
+        :type on_result: Callable[[int, Union[Dict[str, Any], None], Union[Exception, None]], None]
+        """
+        queues: Dict[str, List[int]] = {}
+        for index, (user_id, body) in enumerate(meetings):
+            queues.setdefault(user_id, []).append(index)
+
+        def run(user_id: str, indexes: List[int]):
+            for index in indexes:
+                if user_id is None:
+                    self._notify(on_result, index, None, ValueError('Host user is not found'))
+                    continue
+                if self._count(user_id) >= self.daily_limit:
+                    self._notify(on_result, index, None, RuntimeError(f'Daily meeting limit reached: {user_id}'))
+                    continue
+
+                self.limiter.acquire()
+                try:
+                    response = self.client.create_meeting(user_id, meetings[index][1])
+                    self._count(user_id, 1)
+                    self._notify(on_result, index, response.json(), None)
+                except ZoomRateLimitError as e:
+                    # 他のツール等で作成した分も含めて上限に達しているので、この日はこれ以上作成しない
+                    self._count(user_id, self.daily_limit)
+                    self._notify(on_result, index, None, e)
+                except (requests.RequestException, ValueError) as e:
+                    self._notify(on_result, index, None, e)
+
+        try:
+            if self.workers <= 1:
+                for user_id, indexes in queues.items():
+                    run(user_id, indexes)
+                return
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(run, user_id, indexes) for user_id, indexes in queues.items()]
+                for future in futures:
+                    future.result()
+        finally:
+            self._save_counts()
+
+    def delete_meetings(
+            self,
+            ids: List[str],
+            on_result: Callable[[int, bool, Union[Exception, None]], None]):
+        """ミーティングを並行して削除する
+
+        削除済みのミーティングは削除に成功したものとみなす。
+        結果は1件削除する毎に ``on_result(index, deleted, error)`` で通知する。
+
+        :param ids: ミーティングIDのリスト
+        :type ids: List[str]
+        :param on_result: 結果を受け取る関数
+        :type on_result: Callable[[int, bool, Union[Exception, None]], None]
+        """
+        def run(index: int):
+            self.limiter.acquire()
+            try:
+                deleted = self.client.delete_meeting(ids[index], missing_ok=True)
+            except (requests.RequestException, ZoomRateLimitError) as e:
+                self._notify(on_result, index, False, e)
+                return
+            self._notify(on_result, index, deleted, None)
+
+        if self.workers <= 1:
+            for index in range(len(ids)):
+                run(index)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in executor.map(run, range(len(ids))):
+                pass
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def _count(self, user_id: str, increment: int = 0) -> int:
+        with self._count_lock:
+            today = self._today()
+            if today != self._date:
+                self._date = today
+                self._created = {}
+            count = self._created.get(user_id, 0)
+            if increment:
+                count = min(count + increment, self.daily_limit)
+                self._created[user_id] = count
+            return count
+
+    def _load_counts(self) -> Dict[str, int]:
+        if self.counts is None or not self.counts.exists():
+            return {}
+
+        try:
+            with open(self.counts, encoding='utf-8') as ifp:
+                js = json.load(ifp)
+        except (OSError, ValueError):
+            return {}
+
+        if js.get('account_id') != self.client.account_id or js.get('date') != self._date:
+            return {}
+        return js['created']
+
+    def _save_counts(self):
+        if self.counts is None:
+            return
+
+        with self._count_lock:
+            self.counts.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.counts.with_name(self.counts.name + '.tmp')
+            with open(tmp, 'w', encoding='utf-8') as ofp:
+                json.dump({
+                    'account_id': self.client.account_id,
+                    'date': self._date,
+                    'created': self._created,
+                }, ofp, ensure_ascii=False)
+            os.replace(tmp, self.counts)